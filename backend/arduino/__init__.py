@@ -1 +1,8 @@
+import serial
 from .arduino import Arduino
+from .asynchronous import AsyncArduino
+from .framed import FramedArduino
+
+# sim:// URLs open the simulated board from arduino.protocol_sim
+if 'arduino' not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append('arduino')
@@ -1,4 +1,8 @@
 import serial
+from .protocol import (
+    WRITE_MASK, BOOT_TIMEOUT, PinStates, mask_groups, merge_many, read_many_chunks, read_many_flags, ready_version,
+    unpack_many, wait_ready,
+)
 
 
 class Arduino(object):
@@ -6,12 +10,17 @@ class Arduino(object):
     __OUTPUT_PINS = -1
 
     def __init__(self, port, baudrate=115200):
-        self.serial = serial.Serial(port, baudrate)
+        self.serial = serial.serial_for_url(port, baudrate)
         self.serial.write(b'99')
+        self.__pinStates = PinStates()
 
     def __str__(self):
         return "Arduino is on port %s at %d baudrate" % (self.serial.port, self.serial.baudrate)
 
+    def waitReady(self, timeout=BOOT_TIMEOUT):
+        self.__pinStates.clear()
+        return wait_ready(self.serial, timeout)
+
     def output(self, pinArray):
         self.__sendData(len(pinArray))
 
@@ -22,21 +31,48 @@ class Arduino(object):
         return True
 
     def setLow(self, pin):
+        changes = self.__pinStates.changes({pin: False})
+        if not changes:
+            return True
         self.__sendData('0')
         self.__sendData(pin)
+        self.__pinStates.update(changes)
         return True
 
     def setHigh(self, pin):
+        changes = self.__pinStates.changes({pin: True})
+        if not changes:
+            return True
         self.__sendData('1')
         self.__sendData(pin)
+        self.__pinStates.update(changes)
+        return True
+
+    def writeMask(self, states):
+        """Set the digital outputs to the states ({pin: True/False}) in one command, the pins already
+        in their state are left out.
+        """
+        changes = self.__pinStates.changes(states)
+        if not changes:
+            return True
+        groups = mask_groups(changes)
+        self.__sendData(WRITE_MASK)
+        self.__sendData(len(groups))
+        for group in groups:
+            for value in group:
+                self.__sendData(value)
+        self.__pinStates.update(changes)
         return True
 
     def getState(self, pin):
         self.__sendData('2')
         self.__sendData(pin)
-        return self.__formatPinState(self.__getData()[0])
+        state = self.__formatPinState(self.__getData()[0])
+        self.__pinStates.update({pin: state})
+        return state
 
     def analogWrite(self, pin, value):
+        self.__pinStates.forget(pin)
         self.__sendData('3')
         self.__sendData(pin)
         self.__sendData(value)
@@ -60,14 +96,37 @@ class Arduino(object):
         self.__sendData('7')
         return self.__getData()
 
+    def readMany(self, analogPins=(), digitalPins=(), servo=False, i2c=False):
+        # the sketch answers READ_MANY_MAX_PINS pins at most, the rest goes into the next request
+        result = None
+        for analog, digital in read_many_chunks(analogPins, digitalPins):
+            first = result is None
+            result = merge_many(result, self.__readMany(analog, digital, servo and first, i2c and first))
+        return result
+
+    def __readMany(self, analogPins, digitalPins, servo, i2c):
+        self.__sendData('9')
+        self.__sendData(len(analogPins))
+        for each_pin in analogPins:
+            self.__sendData(each_pin)
+        self.__sendData(len(digitalPins))
+        for each_pin in digitalPins:
+            self.__sendData(each_pin)
+        self.__sendData(read_many_flags(servo, i2c))
+        values = self.__getData().rstrip('\r')
+        return unpack_many(values.split(',') if values else [], analogPins, digitalPins, servo, i2c)
+
     def turnOff(self):
-        for each_pin in self.__OUTPUT_PINS:
-            self.setLow(each_pin)
-        return True
+        return self.writeMask({each_pin: False for each_pin in self.__OUTPUT_PINS})
 
     def __sendData(self, serial_data):
-        while (self.__getData()[0] != "w"):
-            pass
+        while True:
+            input_string = self.__getData()
+            if input_string[0] == "w":
+                break
+            if ready_version(input_string) is not None:
+                # the board was reset on its own, the outputs are low again
+                self.__pinStates.clear()
         serial_data = str(serial_data).encode('utf-8')
         self.serial.write(serial_data)
 
@@ -0,0 +1,200 @@
+import asyncio
+import io
+import serial
+from .protocol import (
+    READ_MANY, WRITE_MASK, CANCEL, BOOT_TIMEOUT, PinStates, mask_groups, merge_many, read_many_chunks, read_many_flags,
+    ready_version, unpack_many,
+)
+
+POLL_INTERVAL = 0.005  # how often the ports without a file descriptor (sim:// and the network ones) are read
+
+
+class AsyncArduino(object):
+    """Text protocol on top of the non-blocking serial port driven by the event loop.
+
+    Every command has a deadline. When it passes, the board is resynchronized by sending the cancel
+    opcode and waiting for the next "w" prompt, so a dropped byte costs one timeout instead of
+    hanging the caller.
+    """
+
+    __OUTPUT_PINS = -1
+
+    def __init__(self, port, baudrate=115200, timeout=1):
+        self.serial = serial.serial_for_url(port, baudrate, timeout=0)
+        self.timeout = timeout
+        self.__loop = None
+        self.__poller = None
+        self.__reader = asyncio.StreamReader()
+        self.__lock = asyncio.Lock()
+        # the board already printed the "w" prompt and waits for the next token
+        self.__prompted = False
+        self.__pinStates = PinStates()
+
+    @classmethod
+    async def open(cls, port, baudrate=115200, timeout=1):
+        self = cls(port, baudrate, timeout)
+        self.__loop = asyncio.get_running_loop()
+        try:
+            self.__loop.add_reader(self.serial.fileno(), self.__readable)
+        except io.UnsupportedOperation:
+            self.__poller = self.__loop.create_task(self.__poll())
+        self.serial.write(str(CANCEL).encode('utf-8'))
+        return self
+
+    def __str__(self):
+        return "Arduino (asyncio) is on port %s at %d baudrate" % (self.serial.port, self.serial.baudrate)
+
+    async def waitReady(self, timeout=BOOT_TIMEOUT):
+        self.__pinStates.clear()
+        try:
+            return await asyncio.wait_for(self.__waitBanner(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def output(self, pinArray, timeout=None):
+        if (isinstance(pinArray, list) or isinstance(pinArray, tuple)):
+            self.__OUTPUT_PINS = pinArray
+        await self.__command([len(pinArray)] + list(pinArray), timeout=timeout)
+        return True
+
+    async def setLow(self, pin, timeout=None):
+        changes = self.__pinStates.changes({pin: False})
+        if not changes:
+            return True
+        await self.__command(['0', pin], timeout=timeout)
+        self.__pinStates.update(changes)
+        return True
+
+    async def setHigh(self, pin, timeout=None):
+        changes = self.__pinStates.changes({pin: True})
+        if not changes:
+            return True
+        await self.__command(['1', pin], timeout=timeout)
+        self.__pinStates.update(changes)
+        return True
+
+    async def writeMask(self, states, timeout=None):
+        changes = self.__pinStates.changes(states)
+        if not changes:
+            return True
+        groups = mask_groups(changes)
+        await self.__command([WRITE_MASK, len(groups)] + [value for group in groups for value in group], timeout=timeout)
+        self.__pinStates.update(changes)
+        return True
+
+    async def getState(self, pin, timeout=None):
+        state = await self.__command(['2', pin], reply=True, timeout=timeout) == '1'
+        self.__pinStates.update({pin: state})
+        return state
+
+    async def analogWrite(self, pin, value, timeout=None):
+        self.__pinStates.forget(pin)
+        await self.__command(['3', pin, value], timeout=timeout)
+        return True
+
+    async def analogRead(self, pin, timeout=None):
+        return await self.__command(['4', pin], reply=True, timeout=timeout)
+
+    async def i2cRead(self, timeout=None):
+        return await self.__command(['5'], reply=True, timeout=timeout)
+
+    async def moveServo(self, value, timeout=None):
+        await self.__command(['6', value], timeout=timeout)
+        return True
+
+    async def readServo(self, timeout=None):
+        return await self.__command(['7'], reply=True, timeout=timeout)
+
+    async def readMany(self, analogPins=(), digitalPins=(), servo=False, i2c=False, timeout=None):
+        # the sketch answers READ_MANY_MAX_PINS pins at most, the rest goes into the next request
+        result = None
+        for analog, digital in read_many_chunks(analogPins, digitalPins):
+            first = result is None
+            tokens = [READ_MANY, len(analog)] + analog + [len(digital)] + digital
+            tokens.append(read_many_flags(servo and first, i2c and first))
+            values = await self.__command(tokens, reply=True, timeout=timeout)
+            values = unpack_many(values.split(',') if values else [], analog, digital, servo and first, i2c and first)
+            result = merge_many(result, values)
+        return result
+
+    async def turnOff(self, timeout=None):
+        return await self.writeMask({each_pin: False for each_pin in self.__OUTPUT_PINS}, timeout=timeout)
+
+    async def __command(self, tokens, reply=False, timeout=None):
+        async with self.__lock:
+            try:
+                return await asyncio.wait_for(self.__exchange(tokens, reply), timeout or self.timeout)
+            except asyncio.TimeoutError:
+                await self.__resync(timeout or self.timeout)
+                raise
+
+    async def __exchange(self, tokens, reply):
+        for token in tokens:
+            await self.__waitPrompt()
+            # the leading space keeps the tokens apart for parseInt even if they end up in the same read
+            self.serial.write((' %s' % token).encode('utf-8'))
+        if reply:
+            while True:
+                line = await self.__getData()
+                if line != "w":
+                    return line
+                # the prompt for the next command came before the reply to this one was read
+                self.__prompted = True
+
+    async def __resync(self, timeout):
+        # whatever is buffered belongs to the interrupted command
+        self.__reader = asyncio.StreamReader()
+        self.__prompted = False
+        self.serial.write((' %d' % CANCEL).encode('utf-8'))
+        try:
+            await asyncio.wait_for(self.__waitPrompt(), timeout)
+        except asyncio.TimeoutError:
+            # the next command tries again
+            pass
+        else:
+            self.__prompted = True
+
+    async def __waitBanner(self):
+        while True:
+            version = ready_version(await self.__getData())
+            if version is not None:
+                return version
+
+    async def __waitPrompt(self):
+        if self.__prompted:
+            self.__prompted = False
+            return
+        while (await self.__getData() != "w"):
+            pass
+
+    async def __getData(self):
+        input_string = await self.__reader.readline()
+        input_string = input_string.decode('utf-8')
+        return input_string.rstrip('\r\n')
+
+    def __readable(self):
+        if not self.__feed():
+            self.__loop.remove_reader(self.serial.fileno())
+
+    async def __poll(self):
+        while self.__feed():
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def __feed(self):
+        """Hand what came to the reader, False once the port failed."""
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except serial.SerialException as e:
+            self.__reader.set_exception(e)
+            return False
+        if data:
+            self.__reader.feed_data(data)
+        return True
+
+    def close(self):
+        if self.__poller is not None:
+            self.__poller.cancel()
+        elif self.__loop is not None:
+            self.__loop.remove_reader(self.serial.fileno())
+        self.serial.close()
+        return True
@@ -0,0 +1,268 @@
+import queue
+import threading
+import time
+import serial
+from .protocol import (
+    SET_LOW, SET_HIGH, GET_STATE, ANALOG_WRITE, ANALOG_READ, I2C_READ, MOVE_SERVO, READ_SERVO, OUTPUT, READ_MANY,
+    SUBSCRIBE, STREAM, STREAM_SEQUENCE, WRITE_MASK, SUBSCRIBE_MAX_PINS, FRAME_MAX_ARGUMENTS, FRAME_START, FRAME_ERROR, FrameError,
+    PinStates, decode_frame, encode_frame, mask_groups, merge_many, pin_number, read_many_chunks, read_many_flags, ready_version, unpack_many, BOOT_TIMEOUT, wait_ready,
+)
+
+READER_TIMEOUT = 0.1  # how long a read of the reader thread blocks, it stops this quickly
+TEXT_MAX_LENGTH = 32  # longer runs of bytes between the frames aren't lines the sketch printed
+
+
+class FramedArduino(object):
+    """Same interface as Arduino, but every command is one binary frame written at once and answered
+    with one framed reply, so there is no waiting on the "w" prompt for each token.
+
+    After subscribe the board pushes the values on its own. A reader thread takes over the port then,
+    keeps the latest value of every pin with the time it came and hands the replies to the commands.
+    """
+
+    __OUTPUT_PINS = -1
+
+    def __init__(self, port, baudrate=115200, timeout=1):
+        self.serial = serial.serial_for_url(port, baudrate, timeout=timeout)
+        self.timeout = timeout
+        self.__sequence = 0
+        self.__reader = None
+        self.__replies = queue.Queue()
+        self.__subscription = None
+        self.__latest = {}  # ("analog", pin): (value, time.monotonic() when it came)
+        self.__pinStates = PinStates()
+        self.__text = bytearray()  # the line of text read so far between the frames
+
+    def __str__(self):
+        return "Arduino (framed) is on port %s at %d baudrate" % (self.serial.port, self.serial.baudrate)
+
+    def waitReady(self, timeout=BOOT_TIMEOUT):
+        # the board was reset, so it doesn't push anything any more and the outputs are low
+        self.__stopReader()
+        self.__pinStates.clear()
+        self.__text = bytearray()
+        return wait_ready(self.serial, timeout)
+
+    def output(self, pinArray):
+        if (isinstance(pinArray, list) or isinstance(pinArray, tuple)):
+            self.__OUTPUT_PINS = pinArray
+            pins = [pin_number(pin) for pin in pinArray]
+            for start in range(0, len(pins), FRAME_MAX_ARGUMENTS):
+                self.__command(OUTPUT, *pins[start:start + FRAME_MAX_ARGUMENTS])
+        return True
+
+    def setLow(self, pin):
+        changes = self.__pinStates.changes({pin: False})
+        if not changes:
+            return True
+        self.__command(SET_LOW, pin_number(pin))
+        self.__pinStates.update(changes)
+        return True
+
+    def setHigh(self, pin):
+        changes = self.__pinStates.changes({pin: True})
+        if not changes:
+            return True
+        self.__command(SET_HIGH, pin_number(pin))
+        self.__pinStates.update(changes)
+        return True
+
+    def writeMask(self, states):
+        """Set the digital outputs to the states ({pin: True/False}) in one frame, the pins already
+        in their state are left out.
+        """
+        changes = self.__pinStates.changes(states)
+        groups = mask_groups(changes)
+        per_frame = FRAME_MAX_ARGUMENTS // 3
+        for start in range(0, len(groups), per_frame):
+            self.__command(WRITE_MASK, *[value for group in groups[start:start + per_frame] for value in group])
+        self.__pinStates.update(changes)
+        return True
+
+    def getState(self, pin):
+        state = self.__command(GET_STATE, pin_number(pin))[0] == 1
+        self.__pinStates.update({pin: state})
+        return state
+
+    def analogWrite(self, pin, value):
+        self.__pinStates.forget(pin)
+        self.__command(ANALOG_WRITE, pin_number(pin), int(value))
+        return True
+
+    def analogRead(self, pin):
+        return self.__command(ANALOG_READ, pin_number(pin))[0]
+
+    def i2cRead(self):
+        return self.__command(I2C_READ)[0]
+
+    def moveServo(self, value):
+        self.__command(MOVE_SERVO, int(value))
+        return True
+
+    def readServo(self):
+        return self.__command(READ_SERVO)[0]
+
+    def readMany(self, analogPins=(), digitalPins=(), servo=False, i2c=False):
+        # doesn't fit in one frame, the rest goes into the next one
+        result = None
+        for analog, digital in read_many_chunks(analogPins, digitalPins):
+            first = result is None
+            args = [len(analog)] + [pin_number(pin) for pin in analog]
+            args += [len(digital)] + [pin_number(pin) for pin in digital]
+            values = self.__command(READ_MANY, *args, read_many_flags(servo and first, i2c and first))
+            result = merge_many(result, unpack_many(values, analog, digital, servo and first, i2c and first))
+        return result
+
+    def subscribe(self, period, analogPins=(), digitalPins=(), servo=False, i2c=False):
+        """Make the board push the values of the pins every period milliseconds, 0 stops it. It takes
+        SUBSCRIBE_MAX_PINS pins at most, the others have to be read with readMany.
+        """
+        analogPins, digitalPins = list(analogPins), list(digitalPins)
+        if len(analogPins) + len(digitalPins) > SUBSCRIBE_MAX_PINS:
+            raise ValueError("Subscribed to %d pins, %d at most." % (len(analogPins) + len(digitalPins), SUBSCRIBE_MAX_PINS))
+        args = [period, len(analogPins)] + [pin_number(pin) for pin in analogPins]
+        args += [len(digitalPins)] + [pin_number(pin) for pin in digitalPins]
+        self.__startReader()
+        self.__subscription = (analogPins, digitalPins, servo, i2c) if period else None
+        self.__latest = {}
+        self.__command(SUBSCRIBE, *args, read_many_flags(servo, i2c))
+        return True
+
+    def readLatest(self, analogPins=(), digitalPins=(), servo=False, i2c=False, maxAge=None):
+        """Return the values the board pushed last like readMany does, leaving out those that didn't
+        come yet or are older than maxAge seconds.
+        """
+        latest = self.__latest
+        oldest = time.monotonic() - maxAge if maxAge is not None else None
+        result = {"analog": {}, "digital": {}, "servo": None, "i2c": None}
+
+        def fresh(key):
+            return key in latest and (oldest is None or latest[key][1] >= oldest)
+        for pin in analogPins:
+            if fresh(("analog", pin)):
+                result["analog"][pin] = latest[("analog", pin)][0]
+        for pin in digitalPins:
+            if fresh(("digital", pin)):
+                result["digital"][pin] = latest[("digital", pin)][0]
+        if servo and fresh(("servo", None)):
+            result["servo"] = latest[("servo", None)][0]
+        if i2c and fresh(("i2c", None)):
+            result["i2c"] = latest[("i2c", None)][0]
+        return result
+
+    def turnOff(self):
+        return self.writeMask({each_pin: False for each_pin in self.__OUTPUT_PINS})
+
+    def __command(self, opcode, *args):
+        # the sequence 0 is left for the frames the board pushes
+        self.__sequence = self.__sequence % 255 + 1
+        self.serial.write(encode_frame(self.__sequence, opcode, *args))
+        return self.__getFrame(self.__sequence, opcode)
+
+    def __readFrame(self):
+        """Return the sequence, the opcode and the values of the next frame, None if nothing came in time."""
+        while True:
+            start = self.serial.read(1)
+            if not start:
+                return None
+            if start[0] != FRAME_START:
+                # "w" prompts of the text protocol, leftovers of the dropped frames and the banner
+                self.__readText(start)
+                continue
+            length = self.serial.read(1)
+            body = self.serial.read(length[0]) if length else b""
+            frame_checksum = self.serial.read(1)
+            if not length or len(body) != length[0] or not frame_checksum:
+                raise FrameError("Timed out in the middle of a frame.")
+            return decode_frame(length[0], body, frame_checksum[0])
+
+    def __readText(self, byte):
+        if byte != b"\n":
+            if len(self.__text) < TEXT_MAX_LENGTH:
+                self.__text += byte
+            return
+        line, self.__text = self.__text.decode('utf-8', 'replace'), bytearray()
+        if ready_version(line) is not None:
+            # the board was reset on its own, the outputs are low again
+            self.__pinStates.clear()
+
+    def __getFrame(self, sequence, opcode):
+        while True:
+            if self.__reader is not None:
+                try:
+                    frame = self.__replies.get(timeout=self.timeout)
+                except queue.Empty:
+                    frame = None
+            else:
+                frame = self.__readFrame()
+            if frame is None:
+                raise FrameError("Timed out waiting for the reply to %d." % opcode)
+            reply_sequence, reply_opcode, values = frame
+            if reply_sequence != sequence:
+                # a late reply to the command that already timed out or a pushed frame
+                continue
+            if reply_opcode == FRAME_ERROR:
+                raise FrameError("The board rejected the frame for %d." % opcode)
+            if reply_opcode != opcode:
+                raise FrameError("Expected the reply to %d, got %d." % (opcode, reply_opcode))
+            return values
+
+    def __startReader(self):
+        if self.__reader is None:
+            self.__replies = queue.Queue()
+            # the reader is the only one reading the port now
+            self.serial.timeout = READER_TIMEOUT
+            self.__reader = threading.Thread(target=self.__read, name="%s-reader" % self.serial.port, daemon=True)
+            self.__reader.start()
+
+    def __stopReader(self):
+        reader, self.__reader = self.__reader, None
+        if reader is not None:
+            reader.join()
+            self.serial.timeout = self.timeout
+        self.__subscription = None
+        self.__latest = {}
+
+    def __read(self):
+        reader = threading.current_thread()
+        while self.__reader is reader:
+            try:
+                frame = self.__readFrame()
+            except FrameError:
+                # broken frame, the command waiting for it times out
+                continue
+            except (serial.SerialException, OSError, TypeError):
+                # the port was closed
+                return
+            if frame is None:
+                continue
+            if frame[0] == STREAM_SEQUENCE and frame[1] == STREAM:
+                self.__store(frame[2])
+            else:
+                self.__replies.put(frame)
+
+    def __store(self, values):
+        subscription = self.__subscription
+        if subscription is None:
+            return
+        try:
+            values = unpack_many(values, *subscription)
+        except FrameError:
+            # pushed before the board got the new subscription
+            return
+        now = time.monotonic()
+        latest = dict(self.__latest)
+        for kind in ("analog", "digital"):
+            for pin, value in values[kind].items():
+                latest[(kind, pin)] = (value, now)
+        for kind in ("servo", "i2c"):
+            if values[kind] is not None:
+                latest[(kind, None)] = (values[kind], now)
+        self.__latest = latest
+
+    def close(self):
+        reader, self.__reader = self.__reader, None
+        self.serial.close()
+        if reader is not None:
+            reader.join(self.timeout)
+        return True
@@ -0,0 +1,204 @@
+import re
+import struct
+import time
+
+# opcodes understood by the sketch, the text protocol sends them as plain numbers
+SET_LOW = 0
+SET_HIGH = 1
+GET_STATE = 2
+ANALOG_WRITE = 3
+ANALOG_READ = 4
+I2C_READ = 5
+MOVE_SERVO = 6
+READ_SERVO = 7
+OUTPUT = 8
+READ_MANY = 9
+SUBSCRIBE = 10
+STREAM = 11
+WRITE_MASK = 12
+CANCEL = 99
+
+# the sketch prints "ready <version>" once it boots, before it asks for the output pins
+FIRMWARE_VERSION = 2
+READY = "ready"
+BOOT_TIMEOUT = 3  # the longest the board takes to boot
+
+# read many: the pins that fit in one request and the flags for the servo and the i2c values
+READ_MANY_MAX_PINS = 28
+READ_SERVO_FLAG = 1
+READ_I2C_FLAG = 2
+
+# write mask: groups of BASE | MASK | VALUES, the pins BASE + bit for the bits set in MASK are set to the bits in VALUES
+MASK_BITS = 16
+
+# framed protocol:
+#   START | LENGTH | SEQUENCE | OPCODE | ARGUMENTS (uint16, little endian) | CHECKSUM
+# LENGTH counts the SEQUENCE, OPCODE and ARGUMENTS bytes, CHECKSUM is the XOR of LENGTH up to the last argument byte
+# the reply has the same layout and echoes the SEQUENCE and OPCODE, ERROR is sent back instead of the OPCODE
+# when the sketch could not make sense of the request
+# SUBSCRIBE takes the period in milliseconds followed by the arguments of READ_MANY, from then on the board pushes
+# the same values in STREAM frames with the STREAM_SEQUENCE every period until it's reset or the period is 0
+FRAME_START = 0xAA
+FRAME_ERROR = 0xFF
+FRAME_MAX_LENGTH = 64
+FRAME_MAX_ARGUMENTS = (FRAME_MAX_LENGTH - 2) // 2
+# the board keeps one subscription and it has to fit in one frame next to the period, the two counts and the flags
+SUBSCRIBE_MAX_PINS = min(READ_MANY_MAX_PINS, FRAME_MAX_ARGUMENTS - 4)
+STREAM_SEQUENCE = 0  # never used by the host for its commands
+
+PIN_PATTERN = re.compile(r"-?\d+")
+
+
+class FrameError(Exception):
+    pass
+
+
+def pin_number(pin):
+    """Return the pin number the sketch sees for the pin name (A0, D13, 2...), same as Serial.parseInt does."""
+    match = PIN_PATTERN.search(str(pin))
+    return int(match.group()) if match else 0
+
+
+def ready_version(line):
+    """Return the firmware version if the line is the banner of the sketch, None otherwise."""
+    words = line.split()
+    if len(words) == 2 and words[0] == READY and words[1].isdigit():
+        return int(words[1])
+    return None
+
+
+def wait_ready(port, timeout=BOOT_TIMEOUT):
+    """Read the lines from the serial port until the banner and return the firmware version, None when
+    it doesn't come in time (the board was already running because opening the port didn't reset it).
+    """
+    previous = port.timeout
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return None
+            port.timeout = left
+            version = ready_version(port.readline().decode('utf-8', 'replace'))
+            if version is not None:
+                return version
+    finally:
+        port.timeout = previous
+
+
+def mask_groups(states):
+    """Return the base, the mask and the values of the groups of the pins for the write mask command,
+    states maps the pin numbers to True (high) or False (low).
+    """
+    groups = {}
+    for pin, high in sorted(states.items()):
+        base = pin - pin % MASK_BITS
+        mask, values = groups.get(base, (0, 0))
+        bit = 1 << (pin - base)
+        groups[base] = (mask | bit, values | bit if high else values)
+    return [(base, mask, values) for base, (mask, values) in groups.items()]
+
+
+class PinStates(object):
+    """The last state written to each digital output, so the hosts don't write the same one again.
+    A pin is unknown from the moment its command is sent until it went through, in case it fails.
+    """
+
+    def __init__(self):
+        self.states = {}
+
+    def clear(self):
+        """Forget them all, like when the board was reset and the outputs are low."""
+        self.states = {}
+
+    def changes(self, states):
+        """Return the states ({pin number: True/False}) the pins aren't known to be in, those are unknown now."""
+        changes = {}
+        for pin, high in states.items():
+            if self.states.get(pin_number(pin)) is not bool(high):
+                changes[pin_number(pin)] = bool(high)
+                self.states.pop(pin_number(pin), None)
+        return changes
+
+    def update(self, states):
+        for pin, high in states.items():
+            self.states[pin_number(pin)] = bool(high)
+
+    def forget(self, pin):
+        self.states.pop(pin_number(pin), None)
+
+
+def checksum(data):
+    result = 0
+    for byte in data:
+        result ^= byte
+    return result
+
+
+def encode_frame(sequence, opcode, *args):
+    body = struct.pack("<BB%dH" % len(args), sequence, opcode, *args)
+    if len(body) > FRAME_MAX_LENGTH:
+        raise FrameError("Frame is too long (%d bytes)." % len(body))
+    head = bytes([len(body)]) + body
+    return bytes([FRAME_START]) + head + bytes([checksum(head)])
+
+
+def decode_frame(length, body, frame_checksum):
+    """Validate the frame read from the wire and return the sequence, the opcode and the values."""
+    if checksum(bytes([length]) + body) != frame_checksum:
+        raise FrameError("Frame checksum mismatch.")
+    if len(body) < 2 or len(body) % 2:
+        raise FrameError("Malformed frame of %d bytes." % len(body))
+    sequence, opcode = body[0], body[1]
+    values = struct.unpack("<%dH" % ((len(body) - 2) // 2), body[2:])
+    return sequence, opcode, values
+
+
+def read_many_flags(servo, i2c):
+    return (READ_SERVO_FLAG if servo else 0) | (READ_I2C_FLAG if i2c else 0)
+
+
+def read_many_chunks(analogPins, digitalPins):
+    """Split the pins of a read many request into the requests the sketch answers in full,
+    READ_MANY_MAX_PINS pins each, as (analogPins, digitalPins) pairs.
+    """
+    analogPins, digitalPins = list(analogPins), list(digitalPins)
+    chunks = []
+    while True:
+        analog = analogPins[:READ_MANY_MAX_PINS]
+        digital = digitalPins[:READ_MANY_MAX_PINS - len(analog)]
+        chunks.append((analog, digital))
+        analogPins, digitalPins = analogPins[len(analog):], digitalPins[len(digital):]
+        if not analogPins and not digitalPins:
+            return chunks
+
+
+def merge_many(result, rest):
+    """Add the values of a later chunk of a read many request to the result of the first one."""
+    if result is None:
+        return rest
+    result["analog"].update(rest["analog"])
+    result["digital"].update(rest["digital"])
+    return result
+
+
+def unpack_many(values, analogPins, digitalPins, servo, i2c):
+    """Map the values answered to the read many request back to the pins they were read from."""
+    values = [int(value) for value in values]
+    expected = len(analogPins) + len(digitalPins) + int(bool(servo)) + int(bool(i2c))
+    if len(values) != expected:
+        raise FrameError("Expected %d values, got %d." % (expected, len(values)))
+    result = {"analog": {}, "digital": {}, "servo": None, "i2c": None}
+    position = 0
+    for pin in analogPins:
+        result["analog"][pin] = values[position]
+        position += 1
+    for pin in digitalPins:
+        result["digital"][pin] = values[position] == 1
+        position += 1
+    if servo:
+        result["servo"] = values[position]
+        position += 1
+    if i2c:
+        result["i2c"] = values[position]
+    return result
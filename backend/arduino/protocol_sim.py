@@ -0,0 +1,105 @@
+from urllib.parse import parse_qs, urlsplit
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError, to_bytes
+from .simulator import BOARDS, SimulatedBoard
+
+OPTIONS = {
+    "byte_latency": float,
+    "command_latency": float,
+    "jitter": float,
+    "drop_rate": float,
+    "boot_time": float,
+    "default": int,
+    "seed": int,
+}
+
+
+def board_from_url(url, baudrate=115200):
+    """Return the board the sim:// URL points to, a new one unless it's named."""
+    parts = urlsplit(url)
+    if parts.scheme != "sim":
+        raise SerialException('expected a string in the form "sim://[name][?option=value...]": {!r}'.format(url))
+    try:
+        options = {option: OPTIONS[option](values[0]) for option, values in parse_qs(parts.query).items()}
+    except (KeyError, ValueError) as e:
+        raise SerialException("unknown or invalid option in {!r}: {}".format(url, e))
+    if parts.netloc:
+        if parts.netloc not in BOARDS:
+            raise SerialException("no simulated board named {!r}".format(parts.netloc))
+        board = BOARDS[parts.netloc]
+        for option, value in options.items():
+            setattr(board, option, value)
+        return board
+    return SimulatedBoard(baudrate=baudrate, **options)
+
+
+class Serial(SerialBase):
+    """pySerial handler for the sim:// URLs, see arduino.simulator."""
+
+    def __init__(self, *args, **kwargs):
+        self.board = None
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        self.board = self.from_url(self.port)
+        self.is_open = True
+        # opening the port resets the board like on the real one
+        self.board.reset()
+
+    def from_url(self, url):
+        return board_from_url(url, self._baudrate)
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.board.halt()
+        super().close()
+
+    def _reconfigure_port(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.board.in_waiting
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.board.read(size, self._timeout)
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+        data = to_bytes(data)
+        self.board.write(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.board.clear_input()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.board.clear_output()
+
+    def _update_dtr_state(self):
+        # the board is held in reset while DTR is low and boots again when it goes high
+        if self.board is None or not self.is_open:
+            return
+        if self._dtr_state:
+            self.board.reset()
+        else:
+            self.board.halt()
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_break_state(self):
+        pass
@@ -0,0 +1,460 @@
+"""A board in the process that behaves like the sketch, for the benchmarks and the load tests.
+
+Open it with the "sim://" URL wherever a serial port path is expected, for example as the path of
+the microcontroller. The options go to the query string, sim://?command_latency=0.002&jitter=0.0005,
+and a board configured in code (waveforms included) can be registered under a name and opened
+as sim://name. Anything needing a real file descriptor (like AsyncArduino) can use serve_pty instead.
+"""
+import math
+import os
+import random
+import threading
+import time
+import tty
+from collections import deque
+from .protocol import (
+    SET_LOW, SET_HIGH, GET_STATE, ANALOG_WRITE, ANALOG_READ, I2C_READ, MOVE_SERVO, READ_SERVO, OUTPUT, READ_MANY,
+    SUBSCRIBE, STREAM, STREAM_SEQUENCE, WRITE_MASK, CANCEL, MASK_BITS, READ_MANY_MAX_PINS, READ_SERVO_FLAG, READ_I2C_FLAG, FRAME_START, FRAME_ERROR, FRAME_MAX_LENGTH,
+    FIRMWARE_VERSION, READY, checksum,
+)
+
+SERIAL_TIMEOUT = 0.005  # Serial.setTimeout in the sketch
+FRAMED = -1
+BOARDS = {}  # named boards for the sim://name URLs
+
+
+def constant(value):
+    return lambda t: value
+
+
+def sine(mean, amplitude, period):
+    return lambda t: mean + amplitude * math.sin(2 * math.pi * t / period)
+
+
+def square(low, high, period):
+    return lambda t: high if t % period < period / 2 else low
+
+
+def ramp(start, end, duration):
+    return lambda t: start + (end - start) * min(t / duration, 1)
+
+
+def noisy(waveform, spread, seed=None):
+    generator = random.Random(seed)
+    return lambda t: waveform(t) + generator.uniform(-spread, spread)
+
+
+def register(name, board):
+    BOARDS[name] = board
+    return board
+
+
+class Reset(Exception):
+    """The board was reset or disconnected, the running sketch quits."""
+
+
+class SimulatedBoard:
+    """Everything about the board that outlives a reset: the configuration, the sensors and the wire.
+
+    Every byte takes byte_latency to cross the wire in both directions (10 bits per byte at the baudrate
+    by default), every command takes command_latency give or take the gaussian jitter to process and
+    drop_rate is the chance of a byte sent to the host getting lost. Whatever the host sends during
+    the boot_time after a reset is lost as well, like with the bootloader of the real board. The waveforms map the analog pin
+    numbers to the functions of time (in seconds since the boot) giving the value read on the pin.
+    """
+
+    def __init__(self, baudrate=115200, byte_latency=None, command_latency=0, jitter=0, drop_rate=0, boot_time=0.1,
+                 waveforms=None, i2c=None, default=512, seed=None):
+        self.byte_latency = 10 / baudrate if byte_latency is None else byte_latency
+        self.command_latency = command_latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.boot_time = boot_time
+        self.waveforms = waveforms if waveforms is not None else {}
+        self.i2c = i2c if i2c is not None else constant(0)
+        self.default = constant(default)
+        self.random = random.Random(seed)
+        self.commands = 0
+        self.sketch = None
+        self._condition = threading.Condition()
+        self._to_board = deque()  # (when the byte arrives, byte)
+        self._to_host = deque()
+        self._generation = 0
+        self._booted = 0  # until when the bootloader ignores what comes in
+
+    # the host side
+    def reset(self):
+        """Restart the sketch, like the DTR toggle does on the real board."""
+        self.halt()
+        with self._condition:
+            generation = self._generation
+            self._booted = time.monotonic() + self.boot_time
+        thread = threading.Thread(target=self._run, args=(generation,), name="simulated-board", daemon=True)
+        thread.start()
+
+    def halt(self):
+        with self._condition:
+            self._generation += 1
+            self._to_board.clear()
+            self._to_host.clear()
+            self._condition.notify_all()
+
+    def write(self, data):
+        with self._condition:
+            if time.monotonic() < self._booted:
+                return
+            self._enqueue(self._to_board, data, drop_rate=0)
+
+    def read(self, size=1, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        data = bytearray()
+        with self._condition:
+            while len(data) < size:
+                now = time.monotonic()
+                while self._to_host and self._to_host[0][0] <= now and len(data) < size:
+                    data.append(self._to_host.popleft()[1])
+                if len(data) == size or (deadline is not None and now >= deadline):
+                    break
+                self._condition.wait(self._wait_time(self._to_host, deadline))
+        return bytes(data)
+
+    @property
+    def in_waiting(self):
+        now = time.monotonic()
+        with self._condition:
+            return sum(1 for arrival, byte in self._to_host if arrival <= now)
+
+    def clear_input(self):
+        with self._condition:
+            self._to_host.clear()
+
+    def clear_output(self):
+        with self._condition:
+            self._to_board.clear()
+
+    def serve_pty(self):
+        """Expose the board on a pseudo terminal and return its path."""
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+
+        def to_board():
+            while True:
+                try:
+                    data = os.read(master, 256)
+                except OSError:
+                    return
+                self.write(data)
+
+        def to_host():
+            while True:
+                data = self.read(1)
+                data += self.read(self.in_waiting, timeout=0)
+                try:
+                    os.write(master, data)
+                except OSError:
+                    return
+
+        threading.Thread(target=to_board, name="simulated-board-rx", daemon=True).start()
+        threading.Thread(target=to_host, name="simulated-board-tx", daemon=True).start()
+        self.reset()
+        return os.ttyname(slave)
+
+    # the wire
+    def _enqueue(self, buffer, data, drop_rate):
+        arrival = max(time.monotonic(), buffer[-1][0] if buffer else 0)
+        for byte in data:
+            if drop_rate and self.random.random() < drop_rate:
+                continue
+            arrival += self.byte_latency
+            buffer.append((arrival, byte))
+        self._condition.notify_all()
+
+    def _wait_time(self, buffer, deadline):
+        now = time.monotonic()
+        timeouts = [buffer[0][0] - now] if buffer else []
+        if deadline is not None:
+            timeouts.append(deadline - now)
+        return max(min(timeouts), 0) if timeouts else None
+
+    def _run(self, generation):
+        try:
+            self._sleep(self.boot_time, generation)
+            self.sketch = Sketch(self, generation)
+            self.sketch.setup()
+            while True:
+                self.sketch.loop()
+        except Reset:
+            pass
+
+    def _sleep(self, seconds, generation):
+        deadline = time.monotonic() + seconds
+        with self._condition:
+            while True:
+                if self._generation != generation:
+                    raise Reset
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                self._condition.wait(left)
+
+    def _delay(self, generation):
+        if self.command_latency or self.jitter:
+            self._sleep(max(0, self.random.gauss(self.command_latency, self.jitter)), generation)
+
+
+class Sketch:
+    """What sketch/sketch.ino does, one instance per boot of the board."""
+
+    def __init__(self, board, generation):
+        self.board = board
+        self.generation = generation
+        self.started = time.monotonic()
+        self.outputs = set()
+        self.digital = {}
+        self.analog = {}
+        self.servo = 0
+        self.frame = b""
+        self.frame_cursor = 0
+        self.subscription = b""
+        self.stream_period = 0  # milliseconds
+        self.stream_last = 0
+
+    # Serial
+    def _check(self):
+        if self.board._generation != self.generation:
+            raise Reset
+
+    def timed_peek(self, timeout=SERIAL_TIMEOUT):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.board._condition:
+            while True:
+                self._check()
+                buffer = self.board._to_board
+                if buffer and buffer[0][0] <= time.monotonic():
+                    return buffer[0][1]
+                if deadline is not None and time.monotonic() >= deadline:
+                    return -1
+                self.board._condition.wait(self.board._wait_time(buffer, deadline))
+
+    def timed_read(self, timeout=SERIAL_TIMEOUT):
+        byte = self.timed_peek(timeout)
+        if byte != -1:
+            with self.board._condition:
+                self.board._to_board.popleft()
+        return byte
+
+    def read_bytes(self, length):
+        data = bytearray()
+        while len(data) < length:
+            byte = self.timed_read()
+            if byte == -1:
+                break
+            data.append(byte)
+        return bytes(data)
+
+    def parse_int(self):
+        # skips anything that's not a digit or a minus, gives 0 when nothing comes in time
+        while True:
+            byte = self.timed_peek()
+            if byte == -1:
+                return 0
+            if chr(byte).isdigit() or byte == ord("-"):
+                break
+            self.timed_read()
+        negative = False
+        value = 0
+        digits = 0
+        while True:
+            byte = self.timed_peek()
+            if byte == ord("-") and not digits:
+                negative = True
+            elif byte != -1 and chr(byte).isdigit():
+                value = value * 10 + byte - ord("0")
+                digits += 1
+            else:
+                break
+            self.timed_read()
+        return -value if negative else value
+
+    def write(self, data):
+        self._check()
+        with self.board._condition:
+            self.board._enqueue(self.board._to_host, data, self.board.drop_rate)
+
+    def println(self, value):
+        self.write(("%s\r\n" % value).encode("utf-8"))
+
+    # the board
+    def millis(self):
+        return time.monotonic() - self.started
+
+    def analog_read(self, pin):
+        value = self.board.waveforms.get(pin, self.board.default)(self.millis())
+        return int(min(max(value, 0), 1023))
+
+    def digital_read(self, pin):
+        return self.digital.get(pin, 0)
+
+    def digital_write(self, pin, value):
+        self.digital[pin] = value
+
+    def analog_write(self, pin, value):
+        self.analog[pin] = value
+
+    def servo_write(self, value):
+        self.servo = int(min(max(value, 0), 180))
+
+    def check(self):
+        return int(self.board.i2c(self.millis()))
+
+    # sketch.ino
+    def setup(self):
+        self.println("%s %d" % (READY, FIRMWARE_VERSION))
+        count = self.read_data()
+        for i in range(count):
+            self.outputs.add(self.read_data())
+
+    def loop(self):
+        command = self.read_data()
+        self.board.commands += 1
+        self.board._delay(self.generation)
+        if command == FRAMED:
+            self.handle_frame()
+        elif command == SET_LOW:
+            self.digital_write(self.read_data(), 0)
+        elif command == SET_HIGH:
+            self.digital_write(self.read_data(), 1)
+        elif command == GET_STATE:
+            self.println(self.digital_read(self.read_data()))
+        elif command == ANALOG_WRITE:
+            self.analog_write(self.read_data(), self.read_data())
+        elif command == ANALOG_READ:
+            self.println(self.analog_read(self.read_data()))
+        elif command == I2C_READ:
+            self.println(self.check())
+        elif command == MOVE_SERVO:
+            self.servo_write(self.read_data())
+        elif command == READ_SERVO:
+            self.println(self.servo)
+        elif command == WRITE_MASK:
+            for i in range(self.read_data()):
+                base, mask, values = self.read_data(), self.read_data(), self.read_data()
+                self.write_mask(base, mask, values)
+        elif command == READ_MANY:
+            self.println(",".join(str(value) for value in self.read_many(False)))
+        elif command == CANCEL:
+            pass
+
+    def read_data(self):
+        self.println("w")
+        while self.timed_peek(self.stream_timeout()) == -1:
+            self.stream()
+        if self.timed_peek() == FRAME_START:
+            return FRAMED
+        return self.parse_int()
+
+    def stream_timeout(self):
+        if not self.stream_period:
+            return None
+        return max(self.stream_last + self.stream_period / 1000 - self.millis(), 0)
+
+    def stream(self):
+        if not self.stream_period or self.millis() - self.stream_last < self.stream_period / 1000:
+            return
+        self.stream_last = self.millis()
+        self.frame = self.subscription
+        self.frame_cursor = 1
+        self.reply_frame(STREAM_SEQUENCE, STREAM, self.read_many(True))
+
+    def frame_argument(self, index):
+        if 3 + 2 * index >= len(self.frame):
+            return 0
+        return self.frame[2 + 2 * index] | (self.frame[3 + 2 * index] << 8)
+
+    def next_argument(self, framed):
+        if framed:
+            self.frame_cursor += 1
+            return self.frame_argument(self.frame_cursor - 1)
+        return self.read_data()
+
+    def read_many(self, framed):
+        values = []
+        for i in range(self.next_argument(framed)):
+            pin = self.next_argument(framed)
+            if len(values) < READ_MANY_MAX_PINS:
+                values.append(self.analog_read(pin))
+        for i in range(self.next_argument(framed)):
+            pin = self.next_argument(framed)
+            if len(values) < READ_MANY_MAX_PINS:
+                values.append(self.digital_read(pin))
+        flags = self.next_argument(framed)
+        if flags & READ_SERVO_FLAG:
+            values.append(self.servo)
+        if flags & READ_I2C_FLAG:
+            values.append(self.check())
+        return values
+
+    def write_mask(self, base, mask, values):
+        for bit in range(MASK_BITS):
+            if mask & (1 << bit):
+                self.digital_write(base + bit, (values >> bit) & 1)
+
+    def reply_frame(self, sequence, opcode, values=()):
+        body = bytes([2 + 2 * len(values), sequence, opcode])
+        for value in values:
+            body += bytes([value & 0xFF, (value >> 8) & 0xFF])
+        self.write(bytes([FRAME_START]) + body + bytes([checksum(body)]))
+
+    def handle_frame(self):
+        self.timed_read()  # FRAME_START
+        length = self.timed_read()
+        if length < 2 or length > FRAME_MAX_LENGTH:
+            return
+        data = self.read_bytes(length + 1)
+        if len(data) != length + 1:
+            return
+        self.frame = data[:length]
+        self.frame_cursor = 0
+        sequence, opcode = data[0], data[1]
+        if checksum(bytes([length]) + self.frame) != data[length] or length % 2:
+            self.reply_frame(sequence, FRAME_ERROR)
+            return
+        argument = self.frame_argument
+        if opcode == SET_LOW:
+            self.digital_write(argument(0), 0)
+            self.reply_frame(sequence, opcode)
+        elif opcode == SET_HIGH:
+            self.digital_write(argument(0), 1)
+            self.reply_frame(sequence, opcode)
+        elif opcode == GET_STATE:
+            self.reply_frame(sequence, opcode, [self.digital_read(argument(0))])
+        elif opcode == ANALOG_WRITE:
+            self.analog_write(argument(0), argument(1))
+            self.reply_frame(sequence, opcode)
+        elif opcode == ANALOG_READ:
+            self.reply_frame(sequence, opcode, [self.analog_read(argument(0))])
+        elif opcode == I2C_READ:
+            self.reply_frame(sequence, opcode, [self.check()])
+        elif opcode == MOVE_SERVO:
+            self.servo_write(argument(0))
+            self.reply_frame(sequence, opcode)
+        elif opcode == READ_SERVO:
+            self.reply_frame(sequence, opcode, [self.servo])
+        elif opcode == OUTPUT:
+            for i in range((length - 2) // 2):
+                self.outputs.add(argument(i))
+            self.reply_frame(sequence, opcode)
+        elif opcode == READ_MANY:
+            self.reply_frame(sequence, opcode, self.read_many(True))
+        elif opcode == WRITE_MASK:
+            for i in range(0, (length - 2) // 2 - 2, 3):
+                self.write_mask(argument(i), argument(i + 1), argument(i + 2))
+            self.reply_frame(sequence, opcode)
+        elif opcode == SUBSCRIBE:
+            self.stream_period = argument(0)
+            self.subscription = self.frame
+            self.stream_last = self.millis() - self.stream_period / 1000
+            self.reply_frame(sequence, opcode)
+        else:
+            self.reply_frame(sequence, FRAME_ERROR)
@@ -7,8 +7,11 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
+import atexit
 import os
+import sys
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
@@ -29,3 +32,18 @@ application = ProtocolTypeRouter({
         ),
     ),
 })
+
+if settings.GREENHOUSE_LOOP == "asyncio" and not settings.TESTING:
+    from common.notifier import notifier, STOP_TIMEOUT
+    from common.supervisor import AsyncSupervisor
+    supervisor = AsyncSupervisor()
+    # the alerts held go out after the states are saved, the handlers run in the reverse order
+    atexit.register(notifier.stop, STOP_TIMEOUT)
+    # the last transitions aren't lost when the process stops between two flushes
+    atexit.register(supervisor.save_states)
+    # the server runs its loop only after it imported the application, the supervisor is started from there
+    application = supervisor.wrap(application)
+    if "twisted.internet.reactor" in sys.modules:
+        # daphne sends no lifespan scope, the loop of its reactor starts it without waiting for a connection
+        from twisted.internet import reactor
+        reactor.callLater(0, supervisor.start)
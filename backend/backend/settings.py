@@ -167,3 +167,32 @@ TESTING = 'test' in sys.argv
 MIGRATIONS = ('makemigrations' in sys.argv) or ('migrate' in sys.argv)
 COLLECTING_STATIC = 'collectstatic' in sys.argv
 RUNNING_SHELL = 'shell' in sys.argv
+BENCHMARKING = 'benchmark' in sys.argv
+RUNNING_GREENHOUSE = 'run_greenhouse' in sys.argv
+
+# the sensors without their own sampling period are read this often in seconds, faster close to the edges of their thresholds
+POLLING_MIN_PERIOD = float(os.environ.get('POLLING_MIN_PERIOD', 0.5))
+POLLING_MAX_PERIOD = float(os.environ.get('POLLING_MAX_PERIOD', 30))
+
+# "thread" runs the managers in their own threads, "asyncio" on the event loop of the ASGI server and "process" in
+# the manage.py run_greenhouse process, the changes get there over the channel layer
+GREENHOUSE_LOOP = os.environ.get('GREENHOUSE_LOOP', 'thread')
+
+# "full" sends all the readings to the websocket every time, "delta" only the ones that changed, at most
+# PUBLISH_MAX_RATE frames a second and all of them again every PUBLISH_KEYFRAME seconds
+PUBLISH_MODE = os.environ.get('PUBLISH_MODE', 'full')
+PUBLISH_MAX_RATE = float(os.environ.get('PUBLISH_MAX_RATE', 1))
+PUBLISH_KEYFRAME = float(os.environ.get('PUBLISH_KEYFRAME', 30))
+
+# the alerts go through this function from their own thread, "common.notifier.log_transport" only logs them,
+# the same alert isn't sent again for NOTIFY_DEDUP_WINDOW seconds and a device gets one every NOTIFY_DEVICE_INTERVAL
+NOTIFY_TRANSPORT = os.environ.get(
+    'NOTIFY_TRANSPORT', 'common.notifier.log_transport' if TESTING or BENCHMARKING else 'common.notifier.telegram_transport'
+)
+NOTIFY_DEDUP_WINDOW = float(os.environ.get('NOTIFY_DEDUP_WINDOW', 600))
+NOTIFY_DEVICE_INTERVAL = float(os.environ.get('NOTIFY_DEVICE_INTERVAL', 60))
+
+# the captures of the profiler of the control loop are saved here as pstats files, see common/profiler.py
+PROFILE_ROOT = os.environ.get('PROFILE_ROOT', os.path.join(BASE_DIR, 'profiles'))
+# the run_greenhouse process writes its metrics here for the web processes, see common/metrics.py
+METRICS_FILE = os.environ.get('METRICS_FILE', os.path.join(PROFILE_ROOT, 'metrics.json'))
@@ -20,13 +20,17 @@ from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import include, path
 from rest_framework import routers
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from common.views import PlantViewSet, ShamrockViewSet, ProfileViewSet, SnapShotViewSet, DeviceViewSet
+from common.views import (
+    PlantViewSet, ShamrockViewSet, ProfileViewSet, SnapShotViewSet, DeviceViewSet, MetricsViewSet, CaptureViewSet
+)
 router = routers.DefaultRouter()
 router.register(r'plant', PlantViewSet)
 router.register(r'shamrock', ShamrockViewSet, "shamrock")
 router.register(r'profile', ProfileViewSet)
 router.register(r'device', DeviceViewSet)
 router.register(r'snapshot', SnapShotViewSet)
+router.register(r'metrics', MetricsViewSet, "metrics")
+router.register(r'capture', CaptureViewSet, "capture")
 
 urlpatterns = [
     path("api/v1/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
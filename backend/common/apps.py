@@ -1,6 +1,7 @@
 from django.apps import AppConfig
 from django.conf import settings
 from threading import Thread
+import atexit
 import os
 
 
@@ -9,19 +10,28 @@ class CommonConfig(AppConfig):
     name = 'common'
 
     def ready(self):
-        from .signals import post_save_update_devices, post_delete_update_devices
+        from .signals import (
+            post_save_update_devices, post_delete_update_devices, post_save_update_microcontrollers, post_delete_update_microcontrollers,
+        )
         # needed to spawn only *one* thread
-        if os.environ.get('RUN_MAIN', None) != 'true' and not (settings.TESTING or settings.MIGRATIONS or settings.COLLECTING_STATIC or settings.RUNNING_SHELL):
+        if os.environ.get('RUN_MAIN', None) != 'true' and not (settings.TESTING or settings.MIGRATIONS or settings.COLLECTING_STATIC or settings.RUNNING_SHELL or settings.BENCHMARKING or settings.RUNNING_GREENHOUSE):
+            if settings.GREENHOUSE_LOOP == "asyncio":
+                # started by backend/asgi.py on the loop of the server
+                return
+            if settings.GREENHOUSE_LOOP == "process":
+                # run by manage.py run_greenhouse
+                return
             thread = Thread(target=self.initialize_manager, daemon=True)
             thread.start()
 
     def initialize_manager(self):
         # need to be imported in the thread
-        from .models import Device, Microcontroller
-        from .loop_manager import GreenHouseManager
-        devices = Device.objects.all()
-        # could hardcode, but leaving as is for now
-        microcontroller = Microcontroller.objects.first()
-        if microcontroller:
-            manager = GreenHouseManager(microcontroller, devices)
-            manager.run()
+        from .notifier import notifier, STOP_TIMEOUT
+        from .supervisor import Supervisor
+        # one manager for each microcontroller, more are started as they are added
+        supervisor = Supervisor()
+        # the alerts held go out after the states are saved, the handlers run in the reverse order
+        atexit.register(notifier.stop, STOP_TIMEOUT)
+        # the last transitions aren't lost when the process stops between two flushes
+        atexit.register(supervisor.save_states)
+        supervisor.run()
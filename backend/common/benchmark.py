@@ -0,0 +1,187 @@
+"""Throughput and latency of the serial protocol and of the manager ticks, see the benchmark command.
+
+Every figure is measured against a simulated board (or a real one, given its path) so the runs can be
+repeated and compared before a change goes to the greenhouse.
+"""
+import datetime
+import platform
+import queue
+import sys
+import time
+from channels.layers import InMemoryChannelLayer
+from django.db import transaction
+from .choices import Category, FSMClass, Protocol
+from .loop_manager import GreenHouseManager, q
+from .models import Device, Microcontroller
+
+ANALOG_PINS = ["A0", "A1", "A2", "A3", "A4", "A5"]
+OUTPUT_PIN = 13
+DEVICE_COUNTS = (1, 10, 100, 500)
+
+# the host methods measured and the arguments they are called with
+METHODS = {
+    "analogRead": ("A0",),
+    "getState": (OUTPUT_PIN,),
+    "setHigh": (OUTPUT_PIN,),
+    "setLow": (OUTPUT_PIN,),
+    "i2cRead": (),
+    "moveServo": (90,),
+    "readServo": (),
+}
+# called, untimed, before every call of the method, the boards skip writing the state the pin already has
+PREPARE = {
+    "setHigh": ("setLow", (OUTPUT_PIN,)),
+    "setLow": ("setHigh", (OUTPUT_PIN,)),
+}
+
+
+def percentile(samples, percent):
+    """Return the value under which the given percentage of the samples fall."""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+def summarize(latencies, elapsed):
+    return {
+        "count": len(latencies),
+        "per_second": len(latencies) / elapsed if elapsed else None,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else None,
+    }
+
+
+def measure(function, count, *args, prepare=None):
+    """Call the function count times and return the statistics of the calls, the latencies are in seconds.
+    prepare is called before every call and isn't counted.
+    """
+    latencies = []
+    elapsed = 0
+    for _ in range(count):
+        if prepare is not None:
+            prepare()
+        before = time.perf_counter()
+        function(*args)
+        latencies.append(time.perf_counter() - before)
+        elapsed += latencies[-1]
+    return summarize(latencies, elapsed)
+
+
+def open_board(path, protocol):
+    backend = Microcontroller(path=path, protocol=protocol).get_backend()
+    board = backend(path)
+    board.waitReady()
+    board.output([OUTPUT_PIN])
+    return board
+
+
+def preparation(board, name):
+    if name not in PREPARE:
+        return None
+    method, args = PREPARE[name]
+    return lambda: getattr(board, method)(*args)
+
+
+def benchmark_methods(path, protocol=Protocol.TEXT, count=200):
+    """Measure every host method of the board on its own."""
+    board = open_board(path, protocol)
+    try:
+        return {
+            name: measure(getattr(board, name), count, *args, prepare=preparation(board, name))
+            for name, args in METHODS.items()
+        }
+    finally:
+        board.close()
+
+
+def drain_queue():
+    """Forget the device changes the benchmark itself made, otherwise the first ticks reload everything."""
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
+        q.task_done()
+
+
+def create_devices(microcontroller, count):
+    for index in range(count):
+        Device.objects.create(
+            name=f"benchmark_{index}",
+            fsm_class=FSMClass.ANALOG_SENSOR,
+            category=Category.TEMPERATURE,
+            pin=ANALOG_PINS[index % len(ANALOG_PINS)],
+            microcontroller=microcontroller,
+            thresholds={
+                "very_low": [0, 127],
+                "low": [128, 255],
+                "medium": [256, 767],
+                "high": [768, 895],
+                "very_high": [896, 1024],
+            },
+            desired_state="medium",
+        )
+    drain_queue()
+    return Device.objects.filter(microcontroller=microcontroller)
+
+
+def benchmark_ticks(path, protocol=Protocol.TEXT, device_counts=DEVICE_COUNTS, ticks=20):
+    """Measure whole manager ticks with the given numbers of devices. The devices only exist inside
+    a transaction that is rolled back at the end, so the database is left as it was.
+    """
+    results = {}
+    for device_count in device_counts:
+        with transaction.atomic():
+            microcontroller = Microcontroller.objects.create(name="benchmark", path=path, protocol=protocol)
+            devices = create_devices(microcontroller, device_count)
+            manager = GreenHouseManager(microcontroller, devices)
+            # nobody listens, but the readings are still encoded and sent like with redis
+            manager.channel_layer = InMemoryChannelLayer()
+            try:
+                latencies = []
+                started = time.perf_counter()
+                for _ in range(ticks):
+                    before = time.perf_counter()
+                    manager.tick()
+                    latencies.append(time.perf_counter() - before)
+                results[str(device_count)] = summarize(latencies, time.perf_counter() - started)
+            finally:
+                microcontroller.stop()
+                transaction.set_rollback(True)
+        drain_queue()
+    return results
+
+
+def benchmark_restarts(path, protocol=Protocol.TEXT, count=5):
+    """Measure how long the board is gone while the microcontroller restarts."""
+    latencies = []
+    with transaction.atomic():
+        microcontroller = Microcontroller.objects.create(name="benchmark", path=path, protocol=protocol)
+        microcontroller.start()
+        try:
+            started = time.perf_counter()
+            for _ in range(count):
+                microcontroller.restart()
+                latencies.append(microcontroller.restart_latency)
+            result = summarize(latencies, time.perf_counter() - started)
+        finally:
+            microcontroller.stop()
+            transaction.set_rollback(True)
+    return result
+
+
+def run(path, protocol=Protocol.TEXT, count=200, device_counts=DEVICE_COUNTS, ticks=20, restarts=5):
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "path": path,
+            "protocol": protocol,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        "methods": benchmark_methods(path, protocol, count),
+        "ticks": benchmark_ticks(path, protocol, device_counts, ticks),
+        "restarts": benchmark_restarts(path, protocol, restarts),
+    }
@@ -15,6 +15,19 @@ class FSMClass(models.TextChoices):
     I2C = "I2C", _("I2C")
 
 
+class Protocol(models.TextChoices):
+    TEXT = "text", _("Text")
+    FRAMED = "framed", _("Framed")
+    # the text sketch driven by the event loop with GREENHOUSE_LOOP = "asyncio", the blocking text host otherwise
+    ASYNC = "async", _("Text (asyncio)")
+
+
+class Filter(models.TextChoices):
+    MEDIAN = "median", _("Sliding median")
+    EWMA = "ewma", _("Exponentially weighted moving average")
+    TRIMMED_MEAN = "trimmed_mean", _("Trimmed mean")
+
+
 class CurrentState(models.IntegerChoices):
     # https://en.wikipedia.org/wiki/BBCH-scale
     GERMINATING = 0, _("Germination, sprouting, bud development")
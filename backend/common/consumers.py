@@ -1,6 +1,5 @@
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 # from asgiref.sync import async_to_sync
-import json
 
 
 class MicrocontrollerConsumer(AsyncJsonWebsocketConsumer):
@@ -23,8 +22,6 @@ class MicrocontrollerConsumer(AsyncJsonWebsocketConsumer):
         print("Received event: {}".format(content))
         await self.send_json(content)
 
-    # is this used?
     async def display_reading(self, event):
-        message = event['message']
-        # Send message to WebSocket
-        await self.send_json(json.loads(message))
+        # the manager already encoded it once for all the clients
+        await self.send(text_data=event['message'])
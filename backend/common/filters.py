@@ -0,0 +1,133 @@
+import bisect
+import heapq
+import itertools
+from .choices import Filter
+
+TRIM = 0.2  # the share of the window left out at each end by the trimmed mean
+
+
+class SlidingMedian:
+    """The median of the last window values. They are kept in two heaps, the lower half in a max-heap and the
+    upper half in a min-heap, so a new value costs O(log window). The value that falls out of the window isn't
+    looked for, it's only marked and dropped once it gets to the top of its heap.
+    """
+
+    def __init__(self, window, value):
+        self.window = window
+        self._values = [value] * window  # the window as a ring
+        self._index = 0
+        self._rebuild()
+        self.value = value
+
+    def _rebuild(self):
+        values = sorted(self._values)
+        # the lower half has the middle value when the window is odd
+        self._low_size, self._high_size = (self.window + 1) // 2, self.window // 2  # without the dropped ones
+        self._low = [-value for value in reversed(values[:self._low_size])]  # negated, the top is the biggest of the lower half
+        self._high = values[self._low_size:]  # both sorted, so they're heaps already
+        self._dropped = {}  # value: how many times it's still in the heaps after it fell out of the window
+
+    def push(self, value):
+        dropped = self._values[self._index]
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self.window
+        if value <= -self._low[0]:
+            heapq.heappush(self._low, -value)
+            self._low_size += 1
+        else:
+            heapq.heappush(self._high, value)
+            self._high_size += 1
+        self._balance()
+        self._dropped[dropped] = self._dropped.get(dropped, 0) + 1
+        if dropped <= -self._low[0]:
+            self._low_size -= 1
+            if dropped == -self._low[0]:
+                self._prune(self._low, -1)
+        else:
+            self._high_size -= 1
+            if dropped == self._high[0]:
+                self._prune(self._high, 1)
+        self._balance()
+        if len(self._low) + len(self._high) > 2 * self.window:
+            # the dropped ones deep in the heaps could pile up
+            self._rebuild()
+        if self.window % 2:
+            self.value = -self._low[0]
+        else:
+            self.value = (-self._low[0] + self._high[0]) / 2
+        return self.value
+
+    def _balance(self):
+        if self._low_size > self._high_size + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+            self._low_size -= 1
+            self._high_size += 1
+            self._prune(self._low, -1)
+        elif self._low_size < self._high_size:
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+            self._high_size -= 1
+            self._low_size += 1
+            self._prune(self._high, 1)
+
+    def _prune(self, heap, sign):
+        while heap:
+            value = sign * heap[0]
+            count = self._dropped.get(value)
+            if not count:
+                return
+            if count == 1:
+                del self._dropped[value]
+            else:
+                self._dropped[value] = count - 1
+            heapq.heappop(heap)
+
+
+class Ewma:
+    """The exponentially weighted moving average, the weight of a new value is the one of a window long
+    simple moving average, 2 / (window + 1).
+    """
+
+    def __init__(self, window, value):
+        self.window = window
+        self.alpha = 2 / (window + 1)
+        self.value = value
+
+    def push(self, value):
+        self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class TrimmedMean:
+    """The mean of the last window values without the TRIM of the lowest and the highest ones. The window is
+    kept sorted as well, a new value is put in its place and the one that falls out is taken from it.
+    """
+
+    def __init__(self, window, value):
+        self.window = window
+        self.trim = int(window * TRIM)
+        self._values = [value] * window
+        self._index = 0
+        self._sorted = [value] * window
+        self.value = value
+
+    def push(self, value):
+        dropped = self._values[self._index]
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self.window
+        del self._sorted[bisect.bisect_left(self._sorted, dropped)]
+        bisect.insort(self._sorted, value)
+        kept = self.window - 2 * self.trim
+        self.value = sum(itertools.islice(self._sorted, self.trim, self.trim + kept)) / kept
+        return self.value
+
+
+FILTERS = {
+    Filter.MEDIAN: SlidingMedian,
+    Filter.EWMA: Ewma,
+    Filter.TRIMMED_MEAN: TrimmedMean,
+}
+
+
+def make_filter(kind, window, value):
+    """Return the filter of the kind over the window, started as if the value had been read window times."""
+    return FILTERS[kind](window, value)
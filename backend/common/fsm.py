@@ -1,9 +1,9 @@
-import telegram
 from operator import itemgetter
 from automat import MethodicalMachine
 from .utils import invert_analog_value, normalize_value
-from .telebot import bot, CHANNEL
 from .choices import Category
+from .metrics import metrics
+from .notifier import notifier
 
 
 class DigitalActuator:
@@ -38,7 +38,8 @@ class DigitalActuator:
     @_machine.output()
     def save_state(self):
         self.device.blob = self.save()
-        self.device.save()
+        self.microcontroller.persister.save(self.device)
+        metrics.increment("transitions")
         return self.device.blob["state"]
 
     @_machine.output()
@@ -123,7 +124,8 @@ class AnalogSensor:
     @_machine.output()
     def save_state(self):
         self.device.blob = self.save()
-        self.device.save()
+        self.microcontroller.persister.save(self.device)
+        metrics.increment("transitions")
         return self.device.blob["state"]
 
     @_machine.output()
@@ -178,19 +180,23 @@ class AnalogSensor:
     def notify_user(self):
         blob = self.save()
         message = f'{self.device.name} is {blob["state"]}.'
-        bot.send_message(chat_id=CHANNEL, text=message, parse_mode=telegram.ParseMode.HTML)
+        # sent from the thread of the notifier, the loop goes on right away
+        notifier.notify(self.device.name, message)
         return blob
 
     @_machine.output()
     def turn_off(self):
-        for child in self.children:
-            getattr(self, child.name).decrease()
+        # the children switch together in one command
+        with self.microcontroller.batch_writes():
+            for child in self.children:
+                getattr(self, child.name).decrease()
         return False
 
     @_machine.output()
     def turn_on(self):
-        for child in self.children:
-            getattr(self, child.name).increase()
+        with self.microcontroller.batch_writes():
+            for child in self.children:
+                getattr(self, child.name).increase()
         return True
 
 
@@ -250,7 +256,8 @@ class I2C:
     @_machine.output()
     def save_state(self):
         self.device.blob = self.save()
-        self.device.save()
+        self.microcontroller.persister.save(self.device)
+        metrics.increment("transitions")
         return self.device.blob["state"]
 
     @_machine.output()
@@ -298,19 +305,23 @@ class I2C:
     def notify_user(self):
         blob = self.save()
         message = f'{self.device.name} is {blob["state"]}.'
-        bot.send_message(chat_id=CHANNEL, text=message, parse_mode=telegram.ParseMode.HTML)
+        # sent from the thread of the notifier, the loop goes on right away
+        notifier.notify(self.device.name, message)
         return blob
 
     @_machine.output()
     def turn_off(self):
-        for child in self.children:
-            getattr(self, child.name).decrease()
+        # the children switch together in one command
+        with self.microcontroller.batch_writes():
+            for child in self.children:
+                getattr(self, child.name).decrease()
         return False
 
     @_machine.output()
     def turn_on(self):
-        for child in self.children:
-            getattr(self, child.name).increase()
+        with self.microcontroller.batch_writes():
+            for child in self.children:
+                getattr(self, child.name).increase()
         return True
 
 
@@ -370,7 +381,8 @@ class PWM:
     @_machine.output()
     def save_state(self):
         self.device.blob = self.save()
-        self.device.save()
+        self.microcontroller.persister.save(self.device)
+        metrics.increment("transitions")
         return self.device.blob["state"]
 
     @_machine.output()
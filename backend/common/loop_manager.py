@@ -1,71 +1,159 @@
+import asyncio
 import datetime
-import json
+import logging
 import queue
-import statistics
+import threading
 import time
+from django.conf import settings
 from django.utils import timezone
-from django.core.serializers.json import DjangoJSONEncoder
+from channels.db import database_sync_to_async
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from .models import SnapShot, Device
+from .filters import make_filter
+from .metrics import metrics
+from .publisher import Publisher, dumps
+from .scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
 
 DELAY = datetime.timedelta(seconds=2)  # how often to query for the readings
 DELTA_SNAPSHOT = 300  # how often to save the snapshot for the trend graphs, 300 seconds, 5 minutes
 DELTA_INPUT = 3  # how often to run the inputs, 3 seconds
+DELTA_DEVICES = 0.5  # how often to look for the device changes, half a second
 q = queue.Queue()  # global queue accessible from other threads (the signals from main Django thread)
 
 
+class Reading:
+    """The values and the state of one device. The fields can be read and set like the keys of a dict as well.
+    The median is what the filter of the device makes of the values read so far, not always a median,
+    the actuators aren't filtered and their median is the last value.
+    """
+
+    __slots__ = (
+        "parent", "name", "kind", "fsm_instance", "median_old", "median", "archive", "old", "new", "timestamp", "state", "filter",
+    )
+
+    def __init__(self, parent, name, kind, fsm_instance, value, timestamp, state, filter):
+        self.parent = parent
+        self.name = name
+        self.kind = kind
+        self.fsm_instance = fsm_instance
+        self.median_old = self.median = self.archive = self.old = self.new = value
+        self.timestamp = timestamp
+        self.state = state
+        self.filter = filter
+
+    @property
+    def device(self):
+        return self.fsm_instance.device
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def keys(self):
+        return self.__slots__
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def update(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    def keep_history(self, other):
+        """Take over the values of the reading the device had before it changed."""
+        self.median_old, self.median = other.median_old, other.median
+        self.archive, self.old, self.new = other.archive, other.old, other.new
+        self.timestamp = other.timestamp
+        if (self.device.filter, self.device.filter_window) == (other.device.filter, other.device.filter_window):
+            self.filter = other.filter
+
+    def as_dict(self):
+        """Return the fields except the fsm_instance and the filter, as they go to the websocket."""
+        return {key: getattr(self, key) for key in self.__slots__ if key not in ("fsm_instance", "filter")}
+
+
 class GreenHouseManager:
-    def __init__(self, microcontroller, devices):
+    task_prefix = ""  # the tasks are the methods with this prefix
+    def __init__(self, microcontroller, devices, changes=q, supervisor=None):
         """
             Initialize the manager:
                 - the channel layer for Django channels
-                - start the passing microcontroller (should be a setting instead)
+                - start the passing microcontroller, the manager owns it and only its devices
                 - setup all the devices with all the information previously saved in the DB
                 - as well as the associated readings
-                - initialize the starting timestamp
+            With more microcontrollers the supervisor passes each manager its own queue of the changes
+            and merges the readings of all of them before they go to the websocket.
         """
         self.channel_layer = get_channel_layer()
+        self.changes = changes
+        self.supervisor = supervisor
+        # with more microcontrollers the supervisor's one numbers the frames of all of them
+        self.publisher = supervisor.publisher if supervisor is not None else Publisher.from_settings()
+        self.stopped = threading.Event()
         self.microcontroller = microcontroller
         self.microcontroller.start()
         self.devices = devices
+        self.periods = {}  # device id: seconds between its readings
+        self.next_sample = {}  # device id: time.monotonic() when it's read again
         self.readings = self.setup_readings()
-        self.timestamp_snapshot = timezone.now()
-        self.timestamp_input = timezone.now()
+        self.scheduler = None
+        self.readings_task = None
 
     def setup_readings(self):
         """Setup all readings according to the each device passed to the manager so they are
         regularly updated against the state of the system.
         """
-        readings = []
-        for device in self.devices:
-            fsm_instance = device.get_fsm(self.microcontroller)
-            value = fsm_instance.query_value()
-            parent = None
-            if device.parent is not None:
-                parent = device.parent.name
-            readings.append({
-                "parent": parent,
-                "name": device.name,
-                "kind": device.get_kind(),
-                "fsm_instance": fsm_instance,
-                "median_old": value,
-                "median": value,
-                "archive": value,
-                "old": value,
-                "new": value,
-                "timestamp": timezone.now(),
-                "state": device.blob["state"]
-            })
+        self.microcontroller.read_data_batch(self.devices)
+        readings = [self.setup_reading(device) for device in self.devices]
+        now = time.monotonic()
+        self.periods, self.next_sample = {}, {}
+        for reading in readings:
+            self.schedule_sample(reading, now)
         return readings
 
+    def setup_reading(self, device, value=None):
+        """Return the reading of the device with its FSM instance, the value is queried unless it's given."""
+        fsm_instance = device.get_fsm(self.microcontroller)
+        if value is None:
+            value = fsm_instance.query_value()
+        parent = None
+        if device.parent is not None:
+            parent = device.parent.name
+        return Reading(
+            parent, device.name, device.get_kind(), fsm_instance, value, timezone.now(), device.blob["state"],
+            make_filter(device.filter, device.filter_window, value),
+        )
+
+    @property
+    def readings(self):
+        return self._readings
+
+    @readings.setter
+    def readings(self, readings):
+        """Index the readings once here, so the ticks don't look for them every time."""
+        self._readings = readings
+        self.readings_by_id = {reading.device.id: reading for reading in readings}
+        self.readings_by_name = {reading.name: reading for reading in readings}
+        self.sensors = [reading for reading in readings if reading.kind == "sensor"]
+        # the actuators without a parent sensor, they follow the time
+        self.root_actuators = [reading for reading in readings if reading.kind == "actuator" and reading.parent is None]
+
     def is_value_increasing(self, reading):
         """ Return True if the value is increasing, False if decreasing and None
         if it stays the same.
         """
-        if reading["median"] > reading["median_old"]:
+        if reading.median > reading.median_old:
             return True
-        elif reading["median"] < reading["median_old"]:
+        elif reading.median < reading.median_old:
             return False
 
     def can_proceed(self, timestamp):
@@ -75,9 +163,9 @@ class GreenHouseManager:
     def will_state_change(self, reading):
         """Return boolean if the state is meant to change according to the set up thresholds for the device.
         """
-        device = reading["fsm_instance"].device
-        fsm_threshold = device.thresholds[reading["state"]]
-        return not (fsm_threshold[0] <= reading["median"] <= fsm_threshold[1])
+        device = reading.device
+        fsm_threshold = device.thresholds[reading.state]
+        return not (fsm_threshold[0] <= reading.median <= fsm_threshold[1])
 
     def within_range(self, fsm):
         """Return boolean if the current time falls between before and after times set for the device.
@@ -89,6 +177,21 @@ class GreenHouseManager:
         )
 
 
+    def setup_scheduler(self):
+        """Each part of the event loop runs at its own period, the same periods keep this order."""
+        scheduler = Scheduler()
+
+        def every(period, name, delay=0):
+            return scheduler.every(period, getattr(self, self.task_prefix + name), name, delay)
+        # the states switched in the last pass are written first, so their changes are picked up right after
+        every(DELTA_DEVICES, "save_states")
+        every(DELTA_DEVICES, "update_devices")
+        self.readings_task = every(self.readings_period(), "update_readings")
+        every(DELTA_INPUT, "run_inputs", delay=DELTA_INPUT)
+        every(DELAY.total_seconds(), "communicate_state")
+        every(DELTA_SNAPSHOT, "save_snapshot", delay=DELTA_SNAPSHOT)
+        return scheduler
+
     def run(self):
         """
             The main event loop which controls:
@@ -97,95 +200,303 @@ class GreenHouseManager:
                 - state changes on the actuators depending on the sensor readings
                 - communicating state to the websocket
                 - storing the snapshot of the state for trend graphs
+            and sleeps in between.
         """
-        while True:
-            self.update_devices()
-            self.update_readings()
-            self.run_inputs()
-            self.communicate_state()
-            self.save_snapshot()
+        self.scheduler = self.setup_scheduler()
+        try:
+            self.scheduler.run(self.stopped)
+        finally:
+            self.save_states()
+            self.microcontroller.stop()
+
+    def stop(self):
+        """Let the running task finish and leave the loop."""
+        self.stopped.set()
 
+    def tick(self):
+        """One pass of every part of the event loop regardless of the periods."""
+        self.save_states()
+        self.update_devices()
+        self.update_readings(every_device=True)
+        self.run_inputs()
+        self.communicate_state()
+        self.save_snapshot()
+
+    @metrics.timed("phase.update_devices")
     def update_devices(self):
         """q is a global queue that multiple threads have access to. The signal will update the queue
-        and in turn, in the event loop, things are refreshed immediately.
-        """
-        if not q.empty():
-            obj = q.get()
-            # ORM can do a much better job than to handle pure python lists here so
-            # there's no logic that would update the python list of model instances
-            # the signals send the correct object and operation regardless
-            self.devices = Device.objects.all()
-            # refresh readings
-            self.readings = self.setup_readings()
-            q.task_done()
-
-    def update_readings(self):
-        """Retrieve the readings from the sensors and store them in the instance dictionary.
-        """
-        for reading in self.readings:
-            reading['archive'] = reading['old']
-            reading['old'] = reading['new']
-            reading['new'] = reading["fsm_instance"].query_value()
-            reading['median_old'] = reading['median']
-            # normalize median value for readings to eliminate the outliers
-            reading['median'] = statistics.median([
-                reading['archive'], reading['old'], reading['new']
-            ])
+        and in turn, in the event loop, things are refreshed immediately. All the pending changes are
+        taken at once and only the readings of those devices are set up again.
+        """
+        changes = {}  # device id: the last thing that happened to it
+        while True:
+            try:
+                change = self.changes.get_nowait()
+            except queue.Empty:
+                break
+            for action, device_id in change.items():
+                if action in ("created", "updated", "deleted"):
+                    changes[device_id] = action
+            self.changes.task_done()
+        if changes:
+            self.patch_readings(changes)
+            if self.readings_task is not None:
+                self.readings_task.period = self.readings_period()
+            load = self.serial_load()
+            logger.info(
+                "%s reads %.1f values in %.1f requests per second.",
+                self.microcontroller, load["values_per_second"], load["requests_per_second"],
+            )
 
+    def patch_readings(self, changes):
+        """Set up the readings of the created and updated devices again and drop the deleted ones, together with
+        their parents whose FSM instances switch them. The other readings are left alone and the devices that
+        only changed their state keep their values, so nothing is read from the board for them.
+        """
+        affected = set(changes)
+        for device_id in changes:
+            reading = self.readings_by_id.get(device_id)
+            if reading is not None and reading.device.parent_id is not None:
+                affected.add(reading.device.parent_id)
+        wanted = {device_id for device_id in affected if changes.get(device_id) != "deleted"}
+        devices = {}
+        while wanted:
+            # the devices could have got new parents
+            for device in Device.objects.filter(id__in=wanted, microcontroller=self.microcontroller).select_related("parent"):
+                devices[device.id] = device
+            wanted = {device.parent_id for device in devices.values() if device.parent_id is not None} - affected
+            affected |= wanted
+        readings, fresh = [], []
+        for device_id, reading in self.readings_by_id.items():
+            if device_id not in affected:
+                readings.append(reading)
+            elif device_id in devices:
+                device = devices.pop(device_id)
+                if (device.pin, device.fsm_class) == (reading.device.pin, reading.device.fsm_class):
+                    patched = self.setup_reading(device, reading.new)
+                    patched.keep_history(reading)
+                    readings.append(patched)
+                    if device.sampling_period != reading.device.sampling_period:
+                        self.schedule_sample(patched, time.monotonic())
+                else:
+                    fresh.append(device)
+            else:
+                self.periods.pop(device_id, None)
+                self.next_sample.pop(device_id, None)
+        # the new ones and the ones on another pin are read right away
+        fresh.extend(devices.values())
+        if fresh:
+            # the board keeps pushing the pins it pushes, the next update of the readings subscribes to them all
+            self.microcontroller.read_data_batch(fresh, subscribe=False)
+            now = time.monotonic()
+            for device in fresh:
+                reading = self.setup_reading(device)
+                readings.append(reading)
+                self.schedule_sample(reading, now)
+        self.readings = readings
+        self.devices = [reading.device for reading in readings]
+
+    def readings_period(self):
+        """Return how often the readings are updated in seconds, often enough for the device sampled the most."""
+        periods = [DELAY.total_seconds()]
+        for device in self.devices:
+            if device.sampling_period:
+                periods.append(device.sampling_period / 1000)
+            elif device.get_kind() == "sensor":
+                periods.append(settings.POLLING_MIN_PERIOD)
+        return min(periods)
+
+    def sampling_period(self, reading):
+        """Return in how many seconds the device is read again. The sensors without their own sampling period
+        adapt it to their readings, the other devices are read every DELAY.
+        """
+        device = reading.device
+        if device.sampling_period:
+            return device.sampling_period / 1000
+        if reading.kind == "sensor":
+            return self.adaptive_period(reading)
+        return DELAY.total_seconds()
+
+    def adaptive_period(self, reading):
+        """Return the sampling period of a sensor between the POLLING_MIN_PERIOD and POLLING_MAX_PERIOD settings,
+        the closer the median is to an edge of the thresholds band of its state and the faster it moves, the shorter.
+        """
+        shortest, longest = settings.POLLING_MIN_PERIOD, settings.POLLING_MAX_PERIOD
+        device = reading.device
+        band = device.thresholds.get(reading.state)
+        if not band:
+            return max(shortest, min(longest, DELAY.total_seconds()))
+        low, high = band
+        distance = min(reading.median - low, high - reading.median)
+        if distance <= 0:
+            # on the edge or already out of the band, the state is about to change
+            return shortest
+        # the farthest it can get from both edges is the middle of the band
+        period = shortest + (longest - shortest) * min(1, 2 * distance / max(high - low, 1))
+        change = abs(reading.median - reading.median_old)
+        if change:
+            # moving this much every period, it's read at least twice before it gets to the edge
+            period = min(period, self.periods.get(device.id, shortest) * distance / change / 2)
+        return max(shortest, min(longest, period))
 
+    def schedule_sample(self, reading, now):
+        device = reading.device
+        self.periods[device.id] = self.sampling_period(reading)
+        self.next_sample[device.id] = now + self.periods[device.id]
+
+    def serial_load(self):
+        """Return how many values are read from the board per second and in how many requests at most,
+        together with the period of every device in seconds. Nothing is asked while the board streams.
+        """
+        period = self.readings_period()
+        devices = {reading.name: self.periods[reading.device.id] for reading in self.readings}
+        streaming = self.microcontroller.streaming()
+        return {
+            "values_per_second": 0 if streaming else sum(1 / each for each in devices.values()),
+            "requests_per_second": 0 if streaming or not devices else 1 / period,
+            "devices": devices,
+        }
+
+    @metrics.timed("phase.update_readings")
+    def update_readings(self, every_device=False):
+        """Retrieve the readings from the sensors whose sampling period is up and store them in the instance dictionary.
+        All the values are read from the board in one request and each FSM instance picks up its own.
+        """
+        now = time.monotonic()
+        if not (every_device or self.microcontroller.streaming()):
+            # the board pushes all the values anyway when it streams, a bit early is better than a whole pass late
+            due = now + self.readings_period() / 2
+            readings = [reading for reading in self.readings if self.next_sample.get(reading.device.id, 0) <= due]
+        else:
+            readings = self.readings
+        if not readings:
+            return
+        self.microcontroller.read_data_batch([reading.device for reading in readings])
+        for reading in readings:
+            reading.archive = reading.old
+            reading.old = reading.new
+            with metrics.timer("device." + reading.name):
+                reading.new = reading.fsm_instance.query_value()
+            reading.median_old = reading.median
+            if reading.kind == "sensor":
+                # normalize median value for readings to eliminate the outliers
+                reading.median = reading.filter.push(reading.new)
+            else:
+                # the states of the actuators are taken as they are, True stays True
+                reading.median = reading.new
+            self.schedule_sample(reading, now)
+
+
+    @metrics.timed("phase.run_inputs")
     def run_inputs(self):
         """For each sensor in the readings member, because the design is such that sensors trigger children, a number of checks are
         executed to see if the state machine can be triggered to change.
         """
-        now = timezone.now()
-        delta = now - self.timestamp_input
-        if delta.total_seconds() > DELTA_INPUT:
-            self.timestamp_input = now
-            for reading in [value for value in self.readings if value["kind"] == "sensor"]:
-                if self.can_proceed(reading['timestamp']) and self.will_state_change(reading) and self.within_range(reading["fsm_instance"]):
-                    value_state = self.is_value_increasing(reading)
-                    if value_state is True:
-                        state = reading["fsm_instance"].increase()
-                    elif value_state is False:
-                        state = reading["fsm_instance"].decrease()
-                    else:
-                        state = reading["state"]
-                    reading["state"] = state
-                    reading['timestamp'] = timezone.now()
-            # check root level actuators (time dependant code)
-            for reading in [value for value in self.readings if value["kind"] == "actuator" and value["parent"] is None]:
-                if self.can_proceed(reading['timestamp']):
-                    current_state = reading["state"]
-                    desired_state = reading["fsm_instance"].device.desired_state
-                    if self.within_range(reading["fsm_instance"]):
-                        if current_state != desired_state:
-                            reading["state"] = reading["fsm_instance"].increase() if current_state == "off" else reading["fsm_instance"].decrease()
-                            reading['timestamp'] = timezone.now()
-                    else:
-                        if current_state == desired_state:
-                            reading["state"] = reading["fsm_instance"].increase() if current_state == "off" else reading["fsm_instance"].decrease()
-                            reading['timestamp'] = timezone.now()
+        for reading in self.sensors:
+            if self.can_proceed(reading.timestamp) and self.will_state_change(reading) and self.within_range(reading.fsm_instance):
+                value_state = self.is_value_increasing(reading)
+                if value_state is True:
+                    state = reading.fsm_instance.increase()
+                elif value_state is False:
+                    state = reading.fsm_instance.decrease()
+                else:
+                    state = reading.state
+                reading.state = state
+                reading.timestamp = timezone.now()
+        # check root level actuators (time dependant code)
+        for reading in self.root_actuators:
+            if self.can_proceed(reading.timestamp):
+                current_state = reading.state
+                desired_state = reading.device.desired_state
+                if self.within_range(reading.fsm_instance):
+                    if current_state != desired_state:
+                        reading.state = reading.fsm_instance.increase() if current_state == "off" else reading.fsm_instance.decrease()
+                        reading.timestamp = timezone.now()
+                else:
+                    if current_state == desired_state:
+                        reading.state = reading.fsm_instance.increase() if current_state == "off" else reading.fsm_instance.decrease()
+                        reading.timestamp = timezone.now()
 
+    @metrics.timed("phase.communicate_state")
     def communicate_state(self):
-        """Send the readings except the fsm_instance member to the websocket."""
-        clean_readings = []
-        for reading in self.readings:
-            clean_readings.append({key: value for key, value in reading.items() if key != "fsm_instance"})
-        message = json.dumps(clean_readings, cls=DjangoJSONEncoder)
-        async_to_sync(self.channel_layer.group_send)('events', {'type': 'display.reading', 'message': message})
+        """Send the readings except the fsm_instance member to the websocket, together with the latest
+        readings of the other microcontrollers if there are more. The publisher can hold them back
+        or leave out the ones that didn't change.
+        """
+        event = self.state_event()
+        if event is not None:
+            async_to_sync(self.channel_layer.group_send)('events', event)
 
+    def state_event(self):
+        clean_readings = [reading.as_dict() for reading in self.readings]
+        if self.supervisor is not None:
+            clean_readings = self.supervisor.publish(self.microcontroller.id, clean_readings)
+        frame = self.publisher.frame(clean_readings)
+        if frame is None:
+            return None
+        # encoded once here, the consumers send the text as it is to every client
+        message = dumps(frame)
+        return {'type': 'display.reading', 'message': message}
+
+    @metrics.timed("phase.save_states")
+    def save_states(self):
+        """Write the states the FSM instances switched to since the last time in one query. The devices switched by
+        their parents have readings of their own, those get the new states too, nothing is read again.
+        """
+        for device in self.microcontroller.persister.flush():
+            reading = self.readings_by_id.get(device.id)
+            if reading is not None and reading.device is not device:
+                reading.device.blob = device.blob
+                reading.state = device.blob["state"]
+
+    @metrics.timed("phase.save_snapshot")
     def save_snapshot(self):
-        """Create a new SnapShot instance in the database if enough time passed. They are used later for displaying trends.
-        """
-        now = timezone.now()
-        delta = now - self.timestamp_snapshot
-        if delta.total_seconds() > DELTA_SNAPSHOT:
-            self.timestamp_snapshot = now
-            for device in self.devices:
-                if device.get_kind() == "sensor":
-                    reading = [reading for reading in self.readings if reading["name"] == device.name][0]
-                    SnapShot.objects.create(
-                        device=device,
-                        timestamp=reading["timestamp"],
-                        value=reading["median"]
-                    )
+        """Create a new SnapShot instance in the database for every sensor. They are used later for displaying trends.
+        """
+        for reading in self.sensors:
+            SnapShot.objects.create(
+                device=reading.device,
+                timestamp=reading.timestamp,
+                value=reading.median
+            )
+
+
+class AsyncGreenHouseManager(GreenHouseManager):
+    """The same tasks as coroutines on the event loop of the ASGI server, see the GREENHOUSE_LOOP setting.
+    The board is read and the inputs run in the threads of the executor (the serial worker still owns the port,
+    or the loop itself with the async protocol), the database work goes through database_sync_to_async, and the
+    readings are sent to the channel layer right from the loop.
+    The manager is created in the executor as well, it starts the board and reads the devices. Whatever waits
+    on the board stays off the one thread the thread sensitive calls of the server share.
+    """
+    task_prefix = "async_"
+
+    async def async_run(self):
+        self.stopped = asyncio.Event()
+        self.scheduler = self.setup_scheduler()
+        try:
+            await self.scheduler.async_run(self.stopped)
+        finally:
+            await self.async_save_states()
+            await sync_to_async(self.microcontroller.stop, thread_sensitive=False)()
+
+    async def async_update_devices(self):
+        await database_sync_to_async(self.update_devices)()
+
+    async def async_update_readings(self):
+        await sync_to_async(self.update_readings, thread_sensitive=False)()
+
+    async def async_run_inputs(self):
+        await sync_to_async(self.run_inputs, thread_sensitive=False)()
+
+    @metrics.timed("phase.communicate_state")
+    async def async_communicate_state(self):
+        event = self.state_event()
+        if event is not None:
+            await self.channel_layer.group_send('events', event)
+
+    async def async_save_states(self):
+        await database_sync_to_async(self.save_states)()
+
+    async def async_save_snapshot(self):
+        await database_sync_to_async(self.save_snapshot)()
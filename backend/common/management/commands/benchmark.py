@@ -0,0 +1,33 @@
+import json
+from arduino.protocol_sim import board_from_url
+from django.core.management.base import BaseCommand
+from ...benchmark import DEVICE_COUNTS, run
+from ...choices import Protocol
+
+
+class Command(BaseCommand):
+    help = "Measure the commands per second and the latencies of the board and of the manager ticks, the results are printed as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="sim://", help="Serial port or sim:// URL of the board (default: %(default)s).")
+        parser.add_argument("--protocol", choices=Protocol.values, default=Protocol.TEXT)
+        parser.add_argument("--pty", action="store_true", help="Serve the sim:// board on a pseudo terminal and go through the real serial port code.")
+        parser.add_argument("--count", type=int, default=200, help="Calls of every board method.")
+        parser.add_argument("--devices", type=int, nargs="+", default=list(DEVICE_COUNTS), help="Device counts for the manager ticks.")
+        parser.add_argument("--ticks", type=int, default=20, help="Manager ticks measured for every device count.")
+        parser.add_argument("--restarts", type=int, default=5, help="Restarts of the microcontroller measured.")
+        parser.add_argument("--output", help="Write the results to this file instead of the standard output.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if options["pty"]:
+            path = board_from_url(path).serve_pty()
+        results = run(path, options["protocol"], options["count"], options["devices"], options["ticks"], options["restarts"])
+        if options["pty"]:
+            results["environment"]["pty"] = options["path"]
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
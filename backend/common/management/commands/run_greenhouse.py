@@ -0,0 +1,48 @@
+import asyncio
+import atexit
+import signal
+import sys
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ... import relay
+from ...metrics import metrics
+from ...notifier import notifier, STOP_TIMEOUT
+from ...supervisor import Supervisor
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the control loop of every microcontroller in this process, with GREENHOUSE_LOOP set to "process". '
+        "The web processes send it the changes over the channel layer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--timeout", type=float, default=10, help="Seconds each manager gets to stop (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        if settings.GREENHOUSE_LOOP != "process":
+            raise CommandError('Set GREENHOUSE_LOOP to "process", the web server runs the control loop otherwise.')
+        # the changes sent while the boards are starting wait in the queue
+        threading.Thread(target=asyncio.run, args=(relay.listen(),), name="relay", daemon=True).start()
+        # stopped like with ctrl+c, so the managers save the states and stop the boards
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        supervisor = Supervisor()
+        atexit.register(supervisor.save_states)
+        # the web processes read the metrics of this one from the file
+        metrics_stopped = threading.Event()
+        metrics_thread = threading.Thread(
+            target=metrics.dump_every, args=(settings.METRICS_FILE, metrics_stopped), name="metrics", daemon=True
+        )
+        metrics_thread.start()
+        self.stdout.write("Running the control loop, the changes come from the %r channel." % relay.CHANNEL)
+        try:
+            supervisor.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            supervisor.stop(options["timeout"])
+            # the last transitions of the managers could have held some alerts back
+            notifier.stop(STOP_TIMEOUT)
+            metrics_stopped.set()
+            metrics_thread.join(options["timeout"])
@@ -0,0 +1,156 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# the upper bounds of the buckets in seconds, from a microsecond to 100 seconds, each a fourth of an octave above
+# the one before, so a percentile is off by 19 % at most and a sample costs a binary search of 108 bounds
+BOUNDS = [1e-6 * 2 ** (step / 4) for step in range(108)]
+DUMP_PERIOD = 5  # how often the run_greenhouse process writes its snapshot for the web processes, in seconds
+
+
+class Histogram:
+    """Counts the durations in the BOUNDS buckets, nothing is kept per sample."""
+
+    __slots__ = ("counts", "count", "total", "max", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)  # the last one is for everything over the bounds
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        index = bisect.bisect_left(BOUNDS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, percent):
+        """Return the duration under which the given percentage of the samples fall, None without any."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = max(1, self.count * percent / 100)
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    break
+            # the upper bound of the bucket, never over the longest one
+            return min(BOUNDS[index] if index < len(BOUNDS) else self.max, self.max)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+        }
+
+
+class Metrics:
+    """The histograms of the durations and the counters of the things that happened in this process,
+    recorded by the managers, the microcontrollers and the scheduler.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def record(self, name, seconds):
+        self.histogram(name).record(seconds)
+
+    def increment(self, name, count=1):
+        with self._lock:
+            self.counters[name] += count
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Record how long the block took, also when it raised."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def timed(self, name):
+        """Decorate the function or the coroutine function to record how long each call took."""
+        def decorator(function):
+            if asyncio.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with self.timer(name):
+                        return await function(*args, **kwargs)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    with self.timer(name):
+                        return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Return the summaries of the histograms and the counters, as lists so the names go out untouched."""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        return {
+            "histograms": [dict(name=name, **histogram.summary()) for name, histogram in histograms],
+            "counters": [{"name": name, "value": value} for name, value in counters],
+        }
+
+    def dump(self, path):
+        """Write the snapshot to the file, the readers get the old one or the new one as a whole."""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".part", "w") as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + ".part", path)
+        except OSError:
+            logger.exception("The metrics weren't written to %s.", path)
+
+    def dump_every(self, path, stopped, period=DUMP_PERIOD):
+        """Write the snapshot to the file every period seconds and once more when the stopped event is set."""
+        while not stopped.wait(period):
+            self.dump(path)
+        self.dump(path)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = collections.Counter()
+
+
+metrics = Metrics()
+
+
+def load_snapshot(path):
+    """Return the snapshot another process wrote to the file with dump, None when there's none."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
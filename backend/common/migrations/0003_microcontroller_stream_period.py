@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_microcontroller_protocol'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='microcontroller',
+            name='stream_period',
+            field=models.PositiveIntegerField(default=0, verbose_name='stream period'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_microcontroller_stream_period'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='sampling_period',
+            field=models.PositiveIntegerField(default=0, verbose_name='sampling period'),
+        ),
+    ]
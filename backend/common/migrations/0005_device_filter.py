@@ -0,0 +1,24 @@
+# Generated by Django 3.2.4 on 2026-10-18 18:20
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_device_sampling_period'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='filter',
+            field=models.CharField(choices=[('median', 'Sliding median'), ('ewma', 'Exponentially weighted moving average'), ('trimmed_mean', 'Trimmed mean')], default='median', max_length=50, verbose_name='filter'),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='filter_window',
+            field=models.PositiveSmallIntegerField(default=3, validators=[django.core.validators.MinValueValidator(1)], verbose_name='filter window'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_device_filter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='microcontroller',
+            name='protocol',
+            field=models.CharField(choices=[('text', 'Text'), ('framed', 'Framed'), ('async', 'Text (asyncio)')], default='text', max_length=50, verbose_name='protocol'),
+        ),
+    ]
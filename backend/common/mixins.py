@@ -1,67 +1,358 @@
 # The Mixin classes are extending the models with the non-DB members
-from arduino import Arduino
+from arduino import Arduino, AsyncArduino, FramedArduino
+from arduino.protocol import BOOT_TIMEOUT, FIRMWARE_VERSION, SUBSCRIBE_MAX_PINS
+from asgiref.sync import sync_to_async
+from .choices import FSMClass, Protocol
+from .metrics import metrics
+from .persister import Persister
+from .serial_worker import SerialWorker, CONTROL, POLL
+import asyncio
+import contextlib
+import logging
+import threading
 import time
 
+logger = logging.getLogger(__name__)
+
+RESET_PULSE = 0.05  # how long DTR is held low to reset the board
+STREAM_MAX_AGE = 3  # in stream periods, older pushed values are read from the board again
+
 
 class MicrocontrollerMixin(object):
     def __init__(self, *args, **kwargs):
         super(MicrocontrollerMixin, self).__init__(*args, **kwargs)
         self._devices = None
         self._microcontroller = None
+        self._batch = {}
+        self._loop = None
+        self._worker = None
+        self._subscription = None  # the pins the board pushes the values of
+        self._writes = threading.local()  # the digital writes held back by batch_writes in each thread
+        self.persister = Persister()  # the states its FSMs switched to, the manager writes them
+        # seconds from opening the port until the board was ready, and of the last whole restart
+        self.ready_latency = None
+        self.restart_latency = None
+
+    def _get_output_pins(self):
+        # several devices can share the pin, it's registered once
+        return list(dict.fromkeys(device.pin for device in self.device_set.all() if device.pin))
 
     def _register_devices(self):
-        self._devices = [device.pin for device in self.device_set.all() if device.pin]
+        self._devices = self._get_output_pins()
         self._microcontroller.output(self._devices)
 
+    def get_backend(self):
+        """Return the host class speaking the protocol selected for the microcontroller. The async one speaks
+        the text protocol, it runs on the event loop only when it's started with async_start.
+        """
+        if self.protocol == Protocol.FRAMED:
+            return FramedArduino
+        return Arduino
+
+    def _check_ready(self, version):
+        if version is None:
+            # the port didn't reset the board, it's most likely running already
+            logger.warning("No ready banner from %s in %d seconds.", self.path, BOOT_TIMEOUT)
+        elif version != FIRMWARE_VERSION:
+            logger.warning("%s runs the firmware %d, expected %d.", self.path, version, FIRMWARE_VERSION)
+
     def start(self):
-        self._microcontroller = Arduino(self.path)
-        time.sleep(1)
+        if self._loop is not None:
+            # already running on the event loop
+            return
+        started = time.monotonic()
+        self._microcontroller = self.get_backend()(self.path)
+        self._check_ready(self._microcontroller.waitReady(BOOT_TIMEOUT))
         self._register_devices()
-        time.sleep(1)
+        self.ready_latency = time.monotonic() - started
+        metrics.record("microcontroller.ready", self.ready_latency)
+        self._worker = SerialWorker(name=f"serial-{self.path}")
+        self._worker.start()
+
+    def _call(self, priority, function, *args):
+        """Run the function on the serial worker if there is one, that way only one thread uses the port."""
+        # the time in the queue of the worker included
+        with self._command(getattr(function, "__name__", "command")):
+            # stop() can drop the worker in the meantime, the one taken here refuses the command then
+            worker = self._worker
+            if worker is None:
+                return function(*args)
+            return worker.call(priority, function, *args)
+
+    @contextlib.contextmanager
+    def _command(self, name):
+        """Record how long the serial command took and count it when it failed."""
+        try:
+            with metrics.timer("serial." + name.lstrip("_")):
+                yield
+        except Exception:
+            metrics.increment("serial_errors")
+            raise
 
     def restart(self):
+        started = time.monotonic()
         self.stop()
         self.start()
+        self.restart_latency = time.monotonic() - started
+        metrics.record("microcontroller.restart", self.restart_latency)
+        logger.info("%s restarted in %.3f seconds.", self.path, self.restart_latency)
 
     def stop(self):
+        """Stop the worker and close the port. The one started with async_start is closed on its loop,
+        which isn't the thread calling this.
+        """
+        self._batch = {}
+        self._subscription = None
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.async_stop(), self._loop).result()
+            return
+        if self._worker:
+            self._worker.stop()
+            self._worker = None
         if self._microcontroller:
-            self.flush()
+            # the board boots while the port is closed, nobody waits for it
+            self.flush(wait=False)
             self._microcontroller.close()
             self._microcontroller = None
 
-    def flush(self):
+    def flush(self, wait=True):
+        """Reset the board and drop what it sent so far, then wait until it's ready again unless wait is False."""
         if self._microcontroller:
-            self._microcontroller.serial.setDTR(False)
-            time.sleep(2)
+            try:
+                self._microcontroller.serial.setDTR(False)
+            except OSError:
+                # no modem lines to reset the board with, like on a pseudo terminal
+                self._microcontroller.serial.reset_input_buffer()
+                return
+            time.sleep(RESET_PULSE)
             self._microcontroller.serial.reset_input_buffer()
             self._microcontroller.serial.setDTR(True)
+            if wait:
+                self._check_ready(self._microcontroller.waitReady(BOOT_TIMEOUT))
             # self._microcontroller.serial.flush()
             # self._microcontroller.serial.reset_input_buffer()
             # self._microcontroller.serial.reset_output_buffer()
 
-    def read_data(self, device):
-        if device.fsm_class == 'PWM':
-            return int(self._microcontroller.readServo())
-        elif device.fsm_class == "I2C":
-            return int(self._microcontroller.i2cRead())
-        elif device.fsm_class == 'AnalogSensor':
+    async def async_start(self):
+        """Start the asyncio backend instead of the blocking one. The synchronous read_data and write_data
+        keep working from the other threads (like the FSM outputs) by running on the loop of the backend.
+        """
+        started = time.monotonic()
+        self._loop = asyncio.get_running_loop()
+        self._microcontroller = await AsyncArduino.open(self.path)
+        self._check_ready(await self._microcontroller.waitReady(BOOT_TIMEOUT))
+        self._devices = await sync_to_async(self._get_output_pins)()
+        await self._microcontroller.output(self._devices)
+        self.ready_latency = time.monotonic() - started
+        metrics.record("microcontroller.ready", self.ready_latency)
+
+    async def async_stop(self):
+        if self._microcontroller:
+            self._microcontroller.close()
+            self._microcontroller = None
+        self._loop = None
+
+    def _run(self, coroutine):
+        with self._command(getattr(coroutine, "__name__", "command")):
+            return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _get_batch_request(self, devices):
+        analog_pins, digital_pins, servo, i2c = [], [], False, False
+        for device in devices:
+            if device.fsm_class == FSMClass.ANALOG_SENSOR and device.pin not in analog_pins:
+                analog_pins.append(device.pin)
+            elif device.fsm_class == FSMClass.DIGITAL_ACTUATOR and device.pin not in digital_pins:
+                digital_pins.append(device.pin)
+            elif device.fsm_class == FSMClass.PWM:
+                servo = True
+            elif device.fsm_class == FSMClass.I2C:
+                i2c = True
+        return analog_pins, digital_pins, servo, i2c
+
+    def _map_values(self, devices, values):
+        """Pick the value of each device from the answer to the read many request, the missing ones are left out."""
+        result = {}
+        for device in devices:
+            if device.fsm_class == FSMClass.ANALOG_SENSOR and device.pin in values["analog"]:
+                result[device.id] = values["analog"][device.pin]
+            elif device.fsm_class == FSMClass.DIGITAL_ACTUATOR and device.pin in values["digital"]:
+                result[device.id] = values["digital"][device.pin]
+            elif device.fsm_class == FSMClass.PWM and values["servo"] is not None:
+                result[device.id] = values["servo"]
+            elif device.fsm_class == FSMClass.I2C and values["i2c"] is not None:
+                result[device.id] = values["i2c"]
+        return result
+
+    def _set_batch(self, devices, values):
+        self._batch = self._map_values(devices, values)
+        return self._batch
+
+    def streaming(self):
+        return bool(self.stream_period) and self.protocol == Protocol.FRAMED
+
+    def _read_latest(self, devices):
+        """Return the values the board pushed for the devices, as long as they are recent enough."""
+        if self._subscription is None:
+            return {}
+        values = self._microcontroller.readLatest(
+            *self._get_batch_request(devices), maxAge=STREAM_MAX_AGE * self.stream_period / 1000
+        )
+        return self._map_values(devices, values)
+
+    def _read_stream(self, devices, subscribe=True):
+        """Subscribe to the values of the devices unless the board already pushes them, then take the latest ones.
+        Those the board doesn't push, like when there are more pins than one subscription takes or subscribe is False,
+        are read in one request.
+        """
+        request = self._get_batch_request(devices)
+        if subscribe and request != self._subscription and len(request[0]) + len(request[1]) <= SUBSCRIBE_MAX_PINS:
             try:
-                return int(self._microcontroller.analogRead(device.pin))
+                self._call(POLL, self._microcontroller.subscribe, self.stream_period, *request)
             except Exception as e:
-                return 0
-        elif device.fsm_class == "DigitalActuator":
-            return self._microcontroller.getState(device.pin)
-
-    def write_data(self, value, device):
-        if device.fsm_class == 'PWM':
-            self._microcontroller.moveServo(value)
-        elif device.fsm_class == "AnalogSensor":
-            self._microcontroller.analogWrite(device.pin, value)
-        else:
-            if value > 0:
-                self._microcontroller.setHigh(device.pin)
-            else:
-                self._microcontroller.setLow(device.pin)
+                # polled until the next try
+                logger.warning("Subscribe failed: %r", e)
+                return self._batch
+            self._subscription = request
+        batch = self._read_latest(devices)
+        missing = [device for device in devices if device.id not in batch]
+        if any(self._get_batch_request(missing)):
+            batch.update(self._read_many(missing))
+        self._batch = batch
+        return self._batch
+
+    def _read_many(self, devices):
+        try:
+            values = self._call(POLL, self._microcontroller.readMany, *self._get_batch_request(devices))
+        except Exception as e:
+            # every device falls back to its own request
+            logger.warning("Batch read failed: %r", e)
+            return {}
+        return self._map_values(devices, values)
+
+    def read_data_batch(self, devices, subscribe=True):
+        """Read the values of all the devices in a single request. They are kept until each device asks
+        for its value with read_data so the FSM instances can be queried as usual without going to the board.
+        When the board streams, the values it pushed last are taken instead and only the others are requested.
+        It subscribes to the devices given unless subscribe is False, for the reads of a few devices on the side.
+        """
+        self._batch = {}
+        if not self._microcontroller:
+            return self._batch
+        if self._loop is not None:
+            return self._run(self.async_read_data_batch(devices))
+        if self.streaming():
+            return self._read_stream(devices, subscribe)
+        self._batch = self._read_many(devices)
+        return self._batch
+
+    async def async_read_data_batch(self, devices):
+        self._batch = {}
+        if not self._microcontroller:
+            return self._batch
+        try:
+            values = await self._microcontroller.readMany(*self._get_batch_request(devices))
+        except Exception as e:
+            logger.warning("Batch read failed: %r", e)
+            return self._batch
+        return self._set_batch(devices, values)
+
+    async def async_read_data(self, device):
+        if device.id in self._batch:
+            return self._batch.pop(device.id)
+        name, args = self._read_request(device)
+        if name is None:
+            return None
+        try:
+            return self._convert_read(device, await getattr(self._microcontroller, name)(*args))
+        except Exception:
+            if device.fsm_class != FSMClass.ANALOG_SENSOR:
+                raise
+            return 0
+
+    async def async_write_data(self, value, device):
+        name, args = self._write_request(value, device)
+        await getattr(self._microcontroller, name)(*args)
+        return value
+
+    def read_data(self, device):
+        if device.id in self._batch:
+            return self._batch.pop(device.id)
+        if self.streaming():
+            latest = self._read_latest([device])
+            if device.id in latest:
+                return latest[device.id]
+        if self._loop is not None:
+            return self._run(self.async_read_data(device))
+        return self._call(POLL, self._read_data, device)
+
+    def _read_request(self, device):
+        """Return the name of the host method reading the device and its arguments, None for the unknown kinds."""
+        if device.fsm_class == FSMClass.PWM:
+            return "readServo", ()
+        elif device.fsm_class == FSMClass.I2C:
+            return "i2cRead", ()
+        elif device.fsm_class == FSMClass.ANALOG_SENSOR:
+            return "analogRead", (device.pin,)
+        elif device.fsm_class == FSMClass.DIGITAL_ACTUATOR:
+            return "getState", (device.pin,)
+        return None, ()
+
+    def _convert_read(self, device, value):
+        if device.fsm_class == FSMClass.DIGITAL_ACTUATOR:
+            return value
+        return int(value)
+
+    def _read_data(self, device):
+        name, args = self._read_request(device)
+        if name is None:
+            return None
+        try:
+            return self._convert_read(device, getattr(self._microcontroller, name)(*args))
+        except Exception:
+            # the analog sensors read 0 when the board doesn't answer
+            if device.fsm_class != FSMClass.ANALOG_SENSOR:
+                raise
+            return 0
+
+    @contextlib.contextmanager
+    def batch_writes(self, priority=CONTROL):
+        """Hold back the digital writes of this thread and send them all in one write mask command at the end,
+        the nested ones join the outer one.
+        """
+        if getattr(self._writes, "pending", None) is not None or self._loop is not None:
+            yield
+            return
+        self._writes.pending = {}
+        try:
+            yield
+        finally:
+            pending, self._writes.pending = self._writes.pending, None
+            if pending and self._microcontroller:
+                self._call(priority, self._microcontroller.writeMask, pending)
+
+    def write_data(self, value, device, priority=CONTROL):
+        """Write the value to the device, the commands somebody asked for should pass the USER priority
+        to get ahead of the ones already waiting.
+        """
+        pending = getattr(self._writes, "pending", None)
+        if pending is not None and device.fsm_class == FSMClass.DIGITAL_ACTUATOR:
+            pending[device.pin] = value > 0
+            return value
+        if self._loop is not None:
+            return self._run(self.async_write_data(value, device))
+        return self._call(priority, self._write_data, value, device)
+
+    def _write_request(self, value, device):
+        """Return the name of the host method writing the value to the device and its arguments."""
+        if device.fsm_class == FSMClass.PWM:
+            return "moveServo", (value,)
+        elif device.fsm_class == FSMClass.ANALOG_SENSOR:
+            return "analogWrite", (device.pin, value)
+        return ("setHigh" if value > 0 else "setLow"), (device.pin,)
+
+    def _write_data(self, value, device):
+        name, args = self._write_request(value, device)
+        getattr(self._microcontroller, name)(*args)
         return value
 
 
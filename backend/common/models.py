@@ -1,11 +1,12 @@
 import json
 import keyword
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from .mixins import DeviceMixin, MicrocontrollerMixin
-from .choices import Category, FSMClass, CurrentState, ANALOG_SENSOR_BLOBS, DIGITAL_ACTUATOR_BLOBS, PWM_BLOBS, I2C_BLOBS
+from .choices import Category, FSMClass, CurrentState, Filter, Protocol, ANALOG_SENSOR_BLOBS, DIGITAL_ACTUATOR_BLOBS, PWM_BLOBS, I2C_BLOBS
 from django.contrib.auth import get_user_model
 from mptt.models import MPTTModel, TreeForeignKey
 # the following are imported in the global namespace, and used later dynamically so it's not a direct call
@@ -17,6 +18,9 @@ class Microcontroller(models.Model, MicrocontrollerMixin):
     name = models.CharField(_("name"), max_length=50)
     description = models.TextField(_("description"), blank=True, default="")
     path = models.CharField(_("path"), max_length=255)  # /dev/ttyACM0
+    protocol = models.CharField(_("protocol"), max_length=50, choices=Protocol.choices, default=Protocol.TEXT)
+    # milliseconds between the values the board pushes on its own, 0 means they are polled
+    stream_period = models.PositiveIntegerField(_("stream period"), default=0)
 
     class Meta:
         verbose_name = _("Microcontroller")
@@ -26,6 +30,10 @@ class Microcontroller(models.Model, MicrocontrollerMixin):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.stream_period and self.protocol != Protocol.FRAMED:
+            raise ValidationError(_("Only the framed protocol can stream the values."))
+
 
 def default_blob():
     return {"state": "medium"}
@@ -57,6 +65,11 @@ class Device(MPTTModel, DeviceMixin):
     thresholds = models.JSONField(_("thresholds"), default=dict)
     created = models.DateTimeField(_("created"), auto_now_add=True)
     desired_state = models.CharField(_("desired state"), max_length=50, default="")
+    # milliseconds between the readings of the device, 0 lets the manager pick it (see adaptive_period)
+    sampling_period = models.PositiveIntegerField(_("sampling period"), default=0)
+    # how the readings are smoothed, over how many of the last ones (see common/filters.py)
+    filter = models.CharField(_("filter"), max_length=50, choices=Filter.choices, default=Filter.MEDIAN)
+    filter_window = models.PositiveSmallIntegerField(_("filter window"), default=3, validators=[MinValueValidator(1)])
 
     class MPTTMeta:
         order_insertion_by = ['name']
@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .telebot import get_bot, CHANNEL
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100  # the alerts waiting for the sender, the ones over it are dropped
+BATCH_WINDOW = 1  # how long the sender waits for more alerts to send them in one message, in seconds
+STOP_TIMEOUT = 5  # how long the sender gets to send the alerts held when the process stops, in seconds
+
+
+def telegram_transport(text):
+    """Send the text to the Telegram channel."""
+    import telegram
+    get_bot().send_message(chat_id=CHANNEL, text=text, parse_mode=telegram.ParseMode.HTML)
+
+
+def log_transport(text):
+    """Only log the text, for the tests, the benchmarks and the setups without Telegram."""
+    logger.info("Notification: %s", text)
+
+
+class Notifier:
+    """Sends the alerts of the FSM transitions from its own thread, so a slow or unreachable transport doesn't
+    hold up the control loop. The alerts that come within the BATCH_WINDOW go out in one message, the same alert
+    again within the dedup window is dropped and a device gets at most one alert every device interval, the
+    latest one it had in the meantime goes out once the interval is over, or when the sender stops.
+    """
+
+    def __init__(self, transport=None, dedup_window=600, device_interval=60, clock=time.monotonic):
+        self._transport = transport
+        self.dedup_window = dedup_window
+        self.device_interval = device_interval
+        self.clock = clock
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.thread = None
+        self._lock = threading.Lock()
+        self._held = {}  # device name: the latest alert waiting for the interval of the device
+        self._sent_texts = {}  # alert: when it was sent
+        self._sent_devices = {}  # device name: when its alert was sent
+
+    @classmethod
+    def from_settings(cls):
+        return cls(None, settings.NOTIFY_DEDUP_WINDOW, settings.NOTIFY_DEVICE_INTERVAL)
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            self._transport = import_string(settings.NOTIFY_TRANSPORT)
+        return self._transport
+
+    def notify(self, device_name, text):
+        """Put the alert on the queue without waiting, return False when it was full and the alert dropped."""
+        self.start()
+        try:
+            self.queue.put_nowait((device_name, text))
+        except queue.Full:
+            logger.warning("Dropped the notification %r, too many are waiting.", text)
+            return False
+        return True
+
+    def start(self):
+        with self._lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="notifier", daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=None):
+        """Send everything held and stop the sender."""
+        with self._lock:
+            thread = self.thread
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning(
+                    "The notifier didn't stop in time, the alerts held are lost: %r", list(self._held.values())
+                )
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            try:
+                alert = self.queue.get(timeout=self.wait())
+            except queue.Empty:
+                alert = ()
+            # the alerts of one cascade go together
+            deadline = self.clock() + BATCH_WINDOW
+            while alert:
+                self.receive(*alert)
+                try:
+                    alert = self.queue.get(timeout=max(0, deadline - self.clock()))
+                except queue.Empty:
+                    alert = ()
+            stopped = alert is None
+            # the held ones go out as well, there's no next time
+            self.send(self.due(everything=stopped))
+
+    def wait(self):
+        """Return how long the sender can wait for new alerts, None with no alert held."""
+        if not self._held:
+            return None
+        now = self.clock()
+        return max(0, min(self._sent_devices.get(name, now) + self.device_interval for name in self._held) - now)
+
+    def receive(self, device_name, text):
+        now = self.clock()
+        self.forget(now)
+        sent = self._sent_texts.get(text)
+        if sent is not None and now - sent < self.dedup_window:
+            logger.debug("Dropped the repeated notification %r.", text)
+            return
+        # only the latest state of the device is worth sending
+        self._held[device_name] = text
+
+    def forget(self, now):
+        """Drop the sent alerts whose dedup window is over, they can't hold the same one back any more."""
+        self._sent_texts = {text: sent for text, sent in self._sent_texts.items() if now - sent < self.dedup_window}
+
+    def due(self, everything=False):
+        """Return the alerts whose devices can get one now, all the held ones with everything, and forget them."""
+        now = self.clock()
+        texts = []
+        for device_name, text in list(self._held.items()):
+            sent = self._sent_devices.get(device_name)
+            if everything or sent is None or now - sent >= self.device_interval:
+                texts.append(text)
+                del self._held[device_name]
+                self._sent_devices[device_name] = now
+                self._sent_texts[text] = now
+        return texts
+
+    def send(self, texts):
+        if not texts:
+            return
+        try:
+            self.transport("\n".join(texts))
+        except Exception:
+            logger.exception("Couldn't send the notification %r.", texts)
+
+
+notifier = Notifier.from_settings()
@@ -0,0 +1,48 @@
+import logging
+import threading
+from django.apps import apps
+
+logger = logging.getLogger(__name__)
+
+
+class Persister:
+    """Writes the states the FSMs switch to behind the control loop. Every microcontroller has its own, a
+    transition only puts its device here, the same device switching again before the flush is written once
+    and all of them go in one query. Nothing is validated, the blob comes from the FSM serializer and the tree
+    doesn't change.
+    """
+
+    def __init__(self):
+        self._pending = {}  # device id: the device with the state to write
+        self._lock = threading.Lock()
+
+    def save(self, device):
+        with self._lock:
+            self._pending[device.id] = device
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write the pending states and return their devices, the ones that failed are kept for the next flush."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return []
+        try:
+            apps.get_model("common", "Device").objects.bulk_update(pending.values(), ["blob"])
+        except Exception:
+            with self._lock:
+                # the ones switched again in the meantime are newer
+                for device_id, device in pending.items():
+                    self._pending.setdefault(device_id, device)
+            raise
+        return list(pending.values())
+
+    def flush_quietly(self):
+        """Flush, logging instead of raising, for when the process stops."""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("The states of %d devices weren't saved.", self.pending())
@@ -0,0 +1,155 @@
+import contextlib
+import cProfile
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+NAME = re.compile(r"^\d{8}-\d{6}-\d{6}$")  # the names of the captures, their files have ".prof" after it
+IDLE = contextlib.nullcontext()
+
+
+def capture_path(name):
+    """Return the file of the capture, None for a name that isn't one."""
+    if not NAME.match(name):
+        return None
+    return os.path.join(settings.PROFILE_ROOT, name + ".prof")
+
+
+class Capture:
+    """A cProfile of the passes of the schedulers until the ticks or the seconds are over. It profiles one thread
+    at a time, a pass of another thread in the meantime runs without it (since Python 3.12 only one profiler can
+    be enabled at once). With the asyncio loop the passes overlap on the event loop thread and the profile also
+    gets the coroutines that run while a pass awaits. It goes in a pstats file once the last pass is over.
+    """
+
+    def __init__(self, seconds=None, ticks=None, clock=time.monotonic):
+        self.name = timezone.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.seconds = seconds
+        self.ticks = ticks
+        self.clock = clock
+        self.started = clock()
+        self.passes = 0
+        self.done = False
+        self.saved = False
+        self.error = None
+        self._profile = cProfile.Profile()
+        self._owner = None  # the id of the thread being profiled
+        self._depth = 0  # how many of its passes are running
+        self._lock = threading.Lock()
+
+    def is_over(self):
+        if self.ticks is not None and self.passes >= self.ticks:
+            return True
+        return self.seconds is not None and self.clock() - self.started >= self.seconds
+
+    @contextlib.contextmanager
+    def profile(self):
+        if not self._enter():
+            yield
+            return
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._depth -= 1
+                if not self._depth:
+                    self._profile.disable()
+                    self._owner = None
+                self.passes += 1
+                self.done = self.done or self.is_over()
+                save = self.done and not self._depth and not self.saved
+                self.saved = self.saved or save
+            if save:
+                self.save()
+
+    def _enter(self):
+        """Return True when the pass of this thread is profiled."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            if self.done or self._owner not in (None, thread_id):
+                return False
+            if not self._depth:
+                try:
+                    self._profile.enable()
+                except ValueError as error:
+                    # another profiler is enabled, the capture is given up instead of waiting for it
+                    logger.warning("The capture %s was given up: %s", self.name, error)
+                    self.error = str(error)
+                    self.done = True
+                    return False
+                self._owner = thread_id
+            self._depth += 1
+            return True
+
+    def save(self):
+        try:
+            stats = pstats.Stats(self._profile)
+            os.makedirs(settings.PROFILE_ROOT, exist_ok=True)
+            # the unfinished file isn't offered for download
+            stats.dump_stats(capture_path(self.name) + ".part")
+            os.replace(capture_path(self.name) + ".part", capture_path(self.name))
+        except Exception:
+            logger.exception("The capture %s wasn't saved.", self.name)
+        else:
+            logger.info("Saved the capture %s of %d passes.", self.name, self.passes)
+
+    def as_dict(self):
+        return {
+            "name": self.name, "seconds": self.seconds, "ticks": self.ticks, "passes": self.passes, "saved": self.saved,
+            "error": self.error,
+        }
+
+
+class Profiler:
+    """Starts the captures of the control loop of this process. The schedulers run every pass in profile(),
+    which costs them a look at the running capture when there is none.
+    """
+
+    def __init__(self):
+        self.capture = None  # the last one started
+        self._lock = threading.Lock()
+
+    def start(self, seconds=None, ticks=None):
+        """Start capturing the next passes and return the capture, None when another one is still running."""
+        with self._lock:
+            if self.capture is not None and not self.capture.done:
+                return None
+            self.capture = Capture(seconds, ticks)
+            return self.capture
+
+    def running(self):
+        capture = self.capture
+        if capture is not None and not capture.done:
+            return capture
+
+    def profile(self):
+        capture = self.capture
+        if capture is None or capture.done:
+            return IDLE
+        return capture.profile()
+
+    def captures(self):
+        """Return the saved captures, the latest first."""
+        try:
+            names = os.listdir(settings.PROFILE_ROOT)
+        except FileNotFoundError:
+            return []
+        captures = []
+        for name in sorted(names, reverse=True):
+            name, extension = os.path.splitext(name)
+            if extension == ".prof" and NAME.match(name):
+                stat = os.stat(capture_path(name))
+                captures.append({
+                    "name": name, "size": stat.st_size, "created": timezone.datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+                })
+        return captures
+
+
+profiler = Profiler()
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FULL = "full"  # every reading in every frame, a plain list like it always was
+DELTA = "delta"  # only the readings that changed since the last frame
+
+
+def dumps(value):
+    """Encode the value to the JSON text sent to the websocket as it is, with orjson when it's installed.
+    The dates and the decimals come out the same way as with the DjangoJSONEncoder either way.
+    """
+    if orjson is None:
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return orjson.dumps(value, default=DjangoJSONEncoder().default, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+
+
+class Publisher:
+    """Decides what goes to the websocket. In the delta mode a frame has only the readings that changed since
+    the last frame that went out, the frames go out at most max_rate times a second (the changes in between
+    are sent together with the next one) and every keyframe seconds all the readings are sent so the new
+    clients catch up. The frames are numbered, so the clients can tell when they missed one:
+
+        {"seq": 42, "keyframe": false, "readings": [{"name": "temperature", ...}]}
+    """
+
+    def __init__(self, mode=FULL, max_rate=1, keyframe=30, clock=time.monotonic):
+        self.mode = mode
+        self.max_rate = max_rate
+        self.keyframe = keyframe
+        self.clock = clock
+        self.seq = 0
+        self._sent = {}  # name: the reading as it went out last
+        self._sent_at = None
+        self._keyframe_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.PUBLISH_MODE, settings.PUBLISH_MAX_RATE, settings.PUBLISH_KEYFRAME)
+
+    def frame(self, readings):
+        """Return what to send for the readings, None when there's nothing to send yet."""
+        if self.mode == FULL:
+            return readings
+        with self._lock:
+            now = self.clock()
+            if self._sent_at is not None and now - self._sent_at < 1 / self.max_rate:
+                return None
+            keyframe = self._keyframe_at is None or now - self._keyframe_at >= self.keyframe
+            if keyframe:
+                changed = readings
+                self._sent = {}
+                self._keyframe_at = now
+            else:
+                changed = [reading for reading in readings if self._sent.get(reading["name"]) != reading]
+                if not changed:
+                    return None
+            for reading in changed:
+                self._sent[reading["name"]] = reading
+            self._sent_at = now
+            self.seq += 1
+            return {"seq": self.seq, "keyframe": keyframe, "readings": changed}
@@ -0,0 +1,66 @@
+import asyncio
+import functools
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from .loop_manager import q
+from .profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "greenhouse.loop"  # the channel the run_greenhouse process listens on
+RETRY = 5  # seconds the listener waits before it tries the channel layer again
+
+
+def is_local():
+    """Return True when the control loop runs in this process."""
+    return settings.GREENHOUSE_LOOP != "process" or settings.RUNNING_GREENHOUSE
+
+
+def put(change):
+    """Hand the change to the managers, over the channel layer once the transaction is committed when they run
+    in the run_greenhouse process, so they don't read the devices before the change is there.
+    """
+    if is_local():
+        q.put(change)
+    else:
+        transaction.on_commit(functools.partial(send, {"type": "change", "change": change}))
+
+
+def send(message):
+    """Send the message to the run_greenhouse process. It's dropped when the channel layer is unreachable or full,
+    the managers read all the devices again when the process starts.
+    """
+    try:
+        async_to_sync(get_channel_layer().send)(CHANNEL, message)
+    except Exception:
+        logger.exception("Couldn't send %r to the control loop.", message)
+        return False
+    return True
+
+
+def handle(message):
+    if message["type"] == "change":
+        q.put(message["change"])
+    elif message["type"] == "capture":
+        if profiler.start(message.get("seconds"), message.get("ticks")) is None:
+            logger.warning("A capture is already running, the one asked for wasn't started.")
+    else:
+        logger.warning("Unknown message %r.", message)
+
+
+async def listen(channel_layer=None):
+    """Hand the messages of the web processes to the control loop of this process, until it's cancelled."""
+    channel_layer = channel_layer or get_channel_layer()
+    while True:
+        try:
+            message = await channel_layer.receive(CHANNEL)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Couldn't receive from the channel layer, trying again in %d seconds.", RETRY)
+            await asyncio.sleep(RETRY)
+            continue
+        handle(message)
@@ -0,0 +1,121 @@
+import asyncio
+import collections
+import contextlib
+import heapq
+import itertools
+import logging
+import math
+import time
+from .metrics import metrics
+from .profiler import IDLE, profiler
+
+logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def profiled():
+    """Run the pass in the running capture of the profiler, the pass runs anyway when the profiler fails."""
+    context = profiler.profile()
+    try:
+        context.__enter__()
+    except Exception:
+        logger.exception("Couldn't profile the pass.")
+        context = IDLE
+    try:
+        yield
+    finally:
+        try:
+            context.__exit__(None, None, None)
+        except Exception:
+            logger.exception("Couldn't finish profiling the pass.")
+
+
+class Task:
+    def __init__(self, order, name, period, function):
+        self.order = order
+        self.name = name
+        self.period = period
+        self.function = function
+        self.deadline = None
+
+    def __lt__(self, other):
+        # due at the same time they run in the order they were added
+        return (self.deadline, self.order) < (other.deadline, other.order)
+
+
+class Scheduler:
+    """Runs every task at its own period from a heap of monotonic deadlines and sleeps until the next one
+    is due. A task that falls behind by more than its period is reported as an overrun and the runs it missed
+    are skipped instead of all being made up at once.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.tasks = []
+        self.overruns = collections.Counter()  # task name: how many times it overran
+        self.started = clock()
+        self._order = itertools.count()
+
+    def every(self, period, function, name=None, delay=0):
+        """Run the function every period seconds, the first time the delay after the scheduler was created."""
+        # partials have no name of their own
+        name = name or getattr(function, "__name__", repr(function))
+        task = Task(next(self._order), name, period, function)
+        task.deadline = self.started + delay
+        heapq.heappush(self.tasks, task)
+        return task
+
+    def run_pending(self):
+        """Run the tasks that are due and return how many seconds are left until the next one."""
+        if self.tasks and self.tasks[0].deadline <= self.clock():
+            metrics.increment("ticks")
+            with profiled():
+                while self.tasks and self.tasks[0].deadline <= self.clock():
+                    task = heapq.heappop(self.tasks)
+                    try:
+                        task.function()
+                    finally:
+                        self._reschedule(task)
+                        heapq.heappush(self.tasks, task)
+        if not self.tasks:
+            return None
+        return max(0, self.tasks[0].deadline - self.clock())
+
+    async def async_run_pending(self):
+        """Same as run_pending, but the tasks are coroutine functions and they are awaited."""
+        if self.tasks and self.tasks[0].deadline <= self.clock():
+            metrics.increment("ticks")
+            with profiled():
+                while self.tasks and self.tasks[0].deadline <= self.clock():
+                    task = heapq.heappop(self.tasks)
+                    try:
+                        await task.function()
+                    finally:
+                        self._reschedule(task)
+                        heapq.heappush(self.tasks, task)
+        if not self.tasks:
+            return None
+        return max(0, self.tasks[0].deadline - self.clock())
+
+    def _reschedule(self, task):
+        task.deadline += task.period
+        late = self.clock() - task.deadline
+        if late >= 0:
+            self.overruns[task.name] += 1
+            metrics.increment("overruns." + task.name)
+            logger.warning("%s overran its deadline by %.3f seconds.", task.name, late)
+            # the deadlines stay on the same grid, so the tasks with the same period keep running together
+            task.deadline += task.period * (math.floor(late / task.period) + 1)
+
+    def run(self, stopped):
+        """Run the tasks until the stopped event is set, which also cuts the sleep short."""
+        while not stopped.is_set():
+            stopped.wait(self.run_pending())
+
+    async def async_run(self, stopped):
+        """Run the coroutine tasks until the stopped asyncio event is set."""
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(stopped.wait(), await self.async_run_pending())
+            except asyncio.TimeoutError:
+                pass
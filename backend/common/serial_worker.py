@@ -0,0 +1,116 @@
+import collections
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# the lower the number, the sooner the command goes to the board
+USER = 0  # actuator commands somebody asked for
+CONTROL = 1  # outputs of the FSM transitions
+POLL = 2  # routine readings
+STOP = 3  # ends the worker once everything queued before it ran
+
+LATENCY_SAMPLES = 1000  # how many command latencies are kept for the statistics
+
+
+class WorkerStopped(Exception):
+    """The command came after the worker was stopped, it never went to the board."""
+
+
+class Command:
+    def __init__(self, priority, sequence, function, args):
+        self.priority = priority
+        self.sequence = sequence
+        self.function = function
+        self.args = args
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+    def __lt__(self, other):
+        # same priority keeps the order of submission
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class SerialWorker(threading.Thread):
+    """The only thread talking to the serial port of one microcontroller. Commands are taken from
+    the priority queue one after another and their results are handed back through the futures.
+    """
+
+    def __init__(self, name="serial"):
+        super().__init__(name=name, daemon=True)
+        self.queue = queue.PriorityQueue()
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stopping = False  # nothing is queued once it's set
+
+    def submit(self, priority, function, *args):
+        with self._lock:
+            if self._stopping:
+                future = Future()
+                future.set_exception(WorkerStopped(f"{self.name} was stopped."))
+                return future
+            command = Command(priority, next(self._sequence), function, args)
+            self.queue.put(command)
+        return command.future
+
+    def call(self, priority, function, *args):
+        """Submit the command and wait for its result, unless this is the worker itself asking or it was never
+        started. After the worker was stopped it raises WorkerStopped.
+        """
+        if threading.current_thread() is self or not (self.is_alive() or self._stopping):
+            return function(*args)
+        return self.submit(priority, function, *args).result()
+
+    def run(self):
+        try:
+            while True:
+                command = self.queue.get()
+                if command.priority == STOP:
+                    command.future.set_result(True)
+                    return
+                if not command.future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    command.future.set_result(command.function(*command.args))
+                except Exception as e:
+                    command.future.set_exception(e)
+                # from the submission until the result, the time in the queue included
+                self.latencies.append(time.monotonic() - command.submitted)
+        finally:
+            with self._lock:
+                self._stopping = True
+            # nothing waits for ever on the ones left behind
+            self._cancel_pending()
+
+    def _cancel_pending(self):
+        while True:
+            try:
+                command = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            command.future.cancel()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            stopping, self._stopping = self._stopping, True
+            if not stopping:
+                # it goes after the commands already queued, the writes included, the ones after are refused
+                command = Command(STOP, next(self._sequence), None, ())
+                self.queue.put(command)
+        if self.is_alive():
+            if not stopping:
+                command.future.result(timeout)
+            self.join(timeout)
+
+    def get_latency(self, percentile):
+        """Return the latency in seconds under which the given percentage of the recent commands finished."""
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
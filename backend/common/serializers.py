@@ -1,7 +1,6 @@
 from django.db import IntegrityError, transaction
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
-from shamrock import Shamrock, ShamrockException
 from .choices import FSMClass, ANALOG_SENSOR_BLOBS, DIGITAL_ACTUATOR_BLOBS, I2C_BLOBS, PWM_BLOBS
 from .models import Device, Plant, Profile, SnapShot, Microcontroller
 from .utils import normalize_value
@@ -34,6 +33,8 @@ class DynamicFieldsModelSerializer(serializers.ModelSerializer):
 class DeviceSerializer(DynamicFieldsModelSerializer):
     image_url = serializers.SerializerMethodField()
     parent = serializers.SerializerMethodField()
+    # the first one when it's not given, like when there was a single microcontroller
+    microcontroller = serializers.PrimaryKeyRelatedField(queryset=Microcontroller.objects.all(), required=False)
 
     def get_image_url(self, obj):
         return obj.image.url if obj.image else ""
@@ -44,7 +45,7 @@ class DeviceSerializer(DynamicFieldsModelSerializer):
 
     class Meta:
         model = Device
-        fields = ("id", "name", "pin", "fsm_class", "category", "image_url", "parent", "thresholds", "desired_state")
+        fields = ("id", "name", "pin", "fsm_class", "category", "image_url", "parent", "thresholds", "desired_state", "microcontroller", "sampling_period", "filter", "filter_window")
 
     def create(self, validated_data):
         if validated_data["fsm_class"] == FSMClass.ANALOG_SENSOR:
@@ -63,7 +64,8 @@ class DeviceSerializer(DynamicFieldsModelSerializer):
             raise serializers.ValidationError(_(f"{validated_data['fsm_class']} devices cannot set the initial blob."))
         if validated_data["desired_state"] not in validated_data["thresholds"]:
             raise serializers.ValidationError(_(f'The desired state "{validated_data["desired_state"]}" is not found in the thresholds ({validated_data["thresholds"]}).'))
-        validated_data["microcontroller_id"] = Microcontroller.objects.first().id
+        if "microcontroller" not in validated_data:
+            validated_data["microcontroller"] = Microcontroller.objects.first()
         return super().create(validated_data)
 
 
@@ -92,6 +94,7 @@ class PlantSerializer(serializers.ModelSerializer):
 
     def get_shamrock_data(self, remote_id):
         """Invoke Shamrock to get the other data remotely and assign it to the instance."""
+        from shamrock import Shamrock, ShamrockException
         shamrock = Shamrock(self.context["request"].user.profile.remote_token, "https://api.floracodex.com/")
         name = ""
         image_url = ""
@@ -147,3 +150,14 @@ class ProfileSerializer(serializers.ModelSerializer):
             logger.error(message)
             logger.error(repr(ex))
             raise serializers.ValidationError({"detail": message})
+
+
+class CaptureSerializer(serializers.Serializer):
+    """The length of a profiler capture of the control loop, in seconds or in ticks."""
+    seconds = serializers.FloatField(required=False, min_value=0.1, max_value=3600)
+    ticks = serializers.IntegerField(required=False, min_value=1, max_value=100000)
+
+    def validate(self, data):
+        if ("seconds" in data) == ("ticks" in data):
+            raise serializers.ValidationError({"detail": _("Set either the seconds or the ticks to capture.")})
+        return data
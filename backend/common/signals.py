@@ -2,7 +2,7 @@ from django.contrib.auth import get_user_model
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .loop_manager import q
+from . import relay
 from .models import Profile
 
 User = get_user_model()
@@ -10,12 +10,22 @@ User = get_user_model()
 
 @receiver(post_save, sender='common.Device', dispatch_uid="common.post_save_update_devices")
 def post_save_update_devices(sender, instance, created, raw, **kwargs):
-    q.put({"updated" if not created else "created": instance.id})
+    relay.put({"updated" if not created else "created": instance.id})
 
 
 @receiver(post_delete, sender='common.Device', dispatch_uid="common.post_delete_update_devices")
 def post_delete_update_devices(sender, instance, **kwargs):
-    q.put({"deleted": instance.id})
+    relay.put({"deleted": instance.id})
+
+
+@receiver(post_save, sender='common.Microcontroller', dispatch_uid="common.post_save_update_microcontrollers")
+def post_save_update_microcontrollers(sender, instance, created, raw, **kwargs):
+    relay.put({"microcontroller_updated" if not created else "microcontroller_created": instance.id})
+
+
+@receiver(post_delete, sender='common.Microcontroller', dispatch_uid="common.post_delete_update_microcontrollers")
+def post_delete_update_microcontrollers(sender, instance, **kwargs):
+    relay.put({"microcontroller_deleted": instance.id})
 
 
 @receiver(post_save, sender=User, dispatch_uid="common.post_save_create_profile")
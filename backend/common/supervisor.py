@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import queue
+import threading
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from .choices import Protocol
+from .loop_manager import AsyncGreenHouseManager, GreenHouseManager, DELTA_DEVICES, q
+from .models import Microcontroller
+from .publisher import Publisher
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """Runs one GreenHouseManager per microcontroller, each in its own thread with its own serial port
+    and only the devices assigned to its microcontroller, so the boards are polled side by side.
+
+    The signals keep putting the changes in the global q, the supervisor hands each of them to every
+    manager (a device could have moved from one microcontroller to another) and starts, restarts or
+    stops the managers when the microcontrollers themselves change.
+    """
+
+    def __init__(self):
+        self.managers = {}  # microcontroller id: manager, once it started
+        self.threads = {}
+        self.changes = {}
+        self._readings = {}
+        self._lock = threading.Lock()
+        self.publisher = Publisher.from_settings()
+
+    def run(self):
+        for microcontroller in Microcontroller.objects.all():
+            self.start_manager(microcontroller)
+        while True:
+            self.dispatch(q.get())
+            q.task_done()
+
+    def dispatch(self, change):
+        if self.is_microcontroller_change(change):
+            self.dispatch_microcontroller(change)
+        else:
+            with self._lock:
+                changes = list(self.changes.values())
+            for each in changes:
+                each.put(change)
+
+    @staticmethod
+    def is_microcontroller_change(change):
+        return any(key.startswith("microcontroller_") for key in change)
+
+    def dispatch_microcontroller(self, change):
+        if "microcontroller_created" in change or "microcontroller_updated" in change:
+            microcontroller_id = change.get("microcontroller_created", change.get("microcontroller_updated"))
+            # the path or the protocol could have changed, the port is opened again
+            self.stop_manager(microcontroller_id)
+            microcontroller = Microcontroller.objects.filter(id=microcontroller_id).first()
+            if microcontroller is not None:
+                self.start_manager(microcontroller)
+        elif "microcontroller_deleted" in change:
+            self.stop_manager(change["microcontroller_deleted"])
+
+    def start_manager(self, microcontroller):
+        changes = queue.Queue()
+        with self._lock:
+            self.changes[microcontroller.id] = changes
+        thread = threading.Thread(
+            target=self._run_manager, args=(microcontroller, changes), name=f"manager-{microcontroller.path}", daemon=True
+        )
+        self.threads[microcontroller.id] = thread
+        thread.start()
+        return thread
+
+    def _run_manager(self, microcontroller, changes):
+        # the board is started in the thread of the manager so a slow one doesn't hold up the others
+        try:
+            manager = GreenHouseManager(microcontroller, microcontroller.device_set.all(), changes=changes, supervisor=self)
+            with self._lock:
+                if self.changes.get(microcontroller.id) is not changes:
+                    # stopped while it was starting
+                    microcontroller.stop()
+                    return
+                self.managers[microcontroller.id] = manager
+            manager.run()
+        except Exception:
+            logger.exception("The manager of %s stopped.", microcontroller)
+
+    def stop_manager(self, microcontroller_id, timeout=None):
+        with self._lock:
+            self.changes.pop(microcontroller_id, None)
+            manager = self.managers.pop(microcontroller_id, None)
+            self._readings.pop(microcontroller_id, None)
+        thread = self.threads.pop(microcontroller_id, None)
+        if manager is not None:
+            manager.stop()
+        if thread is not None:
+            thread.join(timeout)
+        with self._lock:
+            # the last tick could have published again
+            self._readings.pop(microcontroller_id, None)
+
+    def stop(self, timeout=None):
+        for microcontroller_id in list(self.threads):
+            self.stop_manager(microcontroller_id, timeout)
+
+    def save_states(self):
+        """Write the states the managers haven't written yet, for when the process exits between two flushes."""
+        with self._lock:
+            managers = list(self.managers.values())
+        for manager in managers:
+            manager.microcontroller.persister.flush_quietly()
+
+    def publish(self, microcontroller_id, readings):
+        """Keep the latest readings of the microcontroller and return the readings of all of them."""
+        with self._lock:
+            self._readings[microcontroller_id] = readings
+            return [reading for readings in self._readings.values() for reading in readings]
+
+
+class AsyncSupervisor(Supervisor):
+    """The supervisor for the GREENHOUSE_LOOP = "asyncio" setting: the managers are AsyncGreenHouseManager
+    tasks on the event loop of the ASGI server instead of threads and the global q is looked at every
+    DELTA_DEVICES seconds instead of waiting on it. The microcontrollers with the async protocol are started
+    on this loop as well, with AsyncArduino in place of the serial worker.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.task = None
+
+    def start(self):
+        """Start running on the running loop, the calls after the first one do nothing. The ASGI servers import
+        the application before they run their loop, so it's called from the loop once it runs.
+        """
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def wrap(self, application):
+        """Return the ASGI application starting the supervisor with the first scope, the lifespan one on the
+        servers that send it.
+        """
+        async def wrapper(scope, receive, send):
+            self.start()
+            return await application(scope, receive, send)
+        return wrapper
+
+    async def run(self):
+        for microcontroller in await database_sync_to_async(list)(Microcontroller.objects.all()):
+            self.start_manager(microcontroller)
+        while True:
+            await self.dispatch_pending()
+            await asyncio.sleep(DELTA_DEVICES)
+
+    async def dispatch_pending(self):
+        while True:
+            try:
+                change = q.get_nowait()
+            except queue.Empty:
+                return
+            if self.is_microcontroller_change(change):
+                await self.async_dispatch_microcontroller(change)
+            else:
+                self.dispatch(change)
+            q.task_done()
+
+    async def async_dispatch_microcontroller(self, change):
+        if "microcontroller_created" in change or "microcontroller_updated" in change:
+            microcontroller_id = change.get("microcontroller_created", change.get("microcontroller_updated"))
+            await self.async_stop_manager(microcontroller_id)
+            microcontroller = await database_sync_to_async(Microcontroller.objects.filter(id=microcontroller_id).first)()
+            if microcontroller is not None:
+                self.start_manager(microcontroller)
+        elif "microcontroller_deleted" in change:
+            await self.async_stop_manager(change["microcontroller_deleted"])
+
+    def start_manager(self, microcontroller):
+        changes = queue.Queue()
+        with self._lock:
+            self.changes[microcontroller.id] = changes
+        task = asyncio.get_running_loop().create_task(self._async_run_manager(microcontroller, changes))
+        self.threads[microcontroller.id] = task
+        return task
+
+    async def _async_run_manager(self, microcontroller, changes):
+        try:
+            if microcontroller.protocol == Protocol.ASYNC:
+                # the manager finds it running, it's read and written on this loop from then on
+                await microcontroller.async_start()
+            # it waits for the board, so not on the thread shared by the thread sensitive calls
+            manager = await database_sync_to_async(AsyncGreenHouseManager, thread_sensitive=False)(
+                microcontroller, microcontroller.device_set.all(), changes=changes, supervisor=self
+            )
+            with self._lock:
+                stopped = self.changes.get(microcontroller.id) is not changes
+                if not stopped:
+                    self.managers[microcontroller.id] = manager
+            if stopped:
+                # stopped while it was starting
+                await sync_to_async(microcontroller.stop, thread_sensitive=False)()
+                return
+            await manager.async_run()
+        except Exception:
+            logger.exception("The manager of %s stopped.", microcontroller)
+
+    async def async_stop_manager(self, microcontroller_id):
+        with self._lock:
+            self.changes.pop(microcontroller_id, None)
+            manager = self.managers.pop(microcontroller_id, None)
+            self._readings.pop(microcontroller_id, None)
+        task = self.threads.pop(microcontroller_id, None)
+        if manager is not None:
+            manager.stop()
+        if task is not None:
+            # one that is still starting sees it was stopped and stops the board itself
+            await task
+        with self._lock:
+            self._readings.pop(microcontroller_id, None)
+
+    async def async_stop(self):
+        for microcontroller_id in list(self.threads):
+            await self.async_stop_manager(microcontroller_id)
@@ -1,7 +1,12 @@
+import functools
 import os
-import telegram
 
 TOKEN = os.environ.get('TELEGRAM_TOKEN')
 CHANNEL = os.environ.get('TELEGRAM_CHANNEL')
 
-bot = telegram.Bot(token=TOKEN)
+
+@functools.lru_cache(maxsize=None)
+def get_bot():
+    """Return the bot, telegram is imported and the bot built only when the first message goes out."""
+    import telegram
+    return telegram.Bot(token=TOKEN)
@@ -2,8 +2,8 @@ from unittest import mock
 from unittest.mock import patch
 from django.test import TestCase, override_settings
 from django.apps import apps
-from .factories import MicrocontrollerFactory
 from ..apps import Thread
+from ..notifier import notifier, STOP_TIMEOUT
 from django.conf import settings
 
 
@@ -20,16 +20,20 @@ class CommonConfigTestCase(TestCase):
             self.common_config.ready()
             mock_Thread_instance.start.assert_called_once()
 
-    @patch("common.loop_manager.GreenHouseManager")
-    def test_initialize_manager_no_microcontroller(self, mock_GreenHouseManager):
-        mock_GreenHouseManager_instance = mock_GreenHouseManager.return_value
-        self.common_config.initialize_manager()
-        mock_GreenHouseManager_instance.assert_not_called()
+    @override_settings(TESTING=False, MIGRATIONS=False, GREENHOUSE_LOOP="asyncio")
+    @patch("common.apps.Thread")
+    def test_ready_asyncio(self, mock_Thread):
+        with patch.dict('os.environ', {'RUN_MAIN': "false"}, clear=True):
+            self.common_config.ready()
+            mock_Thread.assert_not_called()
 
-    @patch("common.loop_manager.GreenHouseManager")
-    def test_initialize_manager_microcontroller(self, mock_GreenHouseManager):
-        mock_GreenHouseManager_instance = mock_GreenHouseManager.return_value
-        microcontroller = MicrocontrollerFactory()
-        with patch.object(microcontroller, "start"), patch.object(mock_GreenHouseManager_instance, "_setup_readings"), patch.object(mock_GreenHouseManager_instance, "run") as mock_run:
-            self.common_config.initialize_manager()
-            mock_run.assert_called_once()
+    @patch("common.apps.atexit.register")
+    @patch("common.supervisor.Supervisor")
+    def test_initialize_manager(self, mock_Supervisor, mock_register):
+        self.common_config.initialize_manager()
+        mock_Supervisor.return_value.run.assert_called_once_with()
+        # only the process running the loop writes the states when it exits, then sends the alerts held
+        self.assertEqual(
+            mock_register.call_args_list,
+            [mock.call(notifier.stop, STOP_TIMEOUT), mock.call(mock_Supervisor.return_value.save_states)],
+        )
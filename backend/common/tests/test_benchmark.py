@@ -0,0 +1,71 @@
+import json
+from arduino.simulator import SimulatedBoard, register
+from django.core.management import call_command
+from django.test import TestCase
+from io import StringIO
+from unittest.mock import patch
+
+from .. import benchmark
+from ..choices import Protocol
+from ..loop_manager import q
+from ..models import Device, Microcontroller
+
+
+class BenchmarkTestCase(TestCase):
+    def test_percentile(self):
+        samples = list(range(100, 0, -1))
+        self.assertEqual(benchmark.percentile(samples, 50), 51)
+        self.assertEqual(benchmark.percentile(samples, 99), 100)
+        self.assertEqual(benchmark.percentile(samples, 100), 100)
+        self.assertIsNone(benchmark.percentile([], 50))
+
+    def test_summarize(self):
+        result = benchmark.summarize([0.1, 0.2, 0.3, 0.4], 2)
+        self.assertEqual(result["count"], 4)
+        self.assertEqual(result["per_second"], 2)
+        self.assertEqual(result["p50"], 0.3)
+        self.assertEqual(result["p99"], 0.4)
+        self.assertEqual(result["max"], 0.4)
+
+    def test_benchmark_methods(self):
+        for protocol in (Protocol.TEXT, Protocol.FRAMED):
+            with self.subTest(protocol=protocol):
+                result = benchmark.benchmark_methods("sim://", protocol, count=3)
+                self.assertEqual(set(result), set(benchmark.METHODS))
+                for statistics in result.values():
+                    self.assertEqual(statistics["count"], 3)
+                    self.assertGreater(statistics["per_second"], 0)
+                    self.assertLessEqual(statistics["p50"], statistics["p99"])
+
+    def test_benchmark_methods_writes(self):
+        board = register("writes", SimulatedBoard())
+        for protocol in (Protocol.TEXT, Protocol.FRAMED):
+            with self.subTest(protocol=protocol), patch.dict(benchmark.METHODS, clear=True, setHigh=(benchmark.OUTPUT_PIN,)):
+                board.commands = 0
+                benchmark.benchmark_methods("sim://writes", protocol, count=3)
+                # every one goes to the board, not only the first one
+                self.assertGreaterEqual(board.commands, 6)
+
+    def test_benchmark_ticks(self):
+        result = benchmark.benchmark_ticks("sim://", Protocol.FRAMED, device_counts=(1, 7), ticks=2)
+        self.assertEqual(set(result), {"1", "7"})
+        self.assertEqual(result["7"]["count"], 2)
+        # everything was rolled back
+        self.assertFalse(Microcontroller.objects.exists())
+        self.assertFalse(Device.objects.exists())
+        self.assertTrue(q.empty())
+
+    def test_benchmark_restarts(self):
+        result = benchmark.benchmark_restarts("sim://", Protocol.TEXT, count=2)
+        self.assertEqual(result["count"], 2)
+        # the simulated board boots in 0.1 seconds, restarts used to take 4 seconds of sleeping
+        self.assertLess(result["p99"], 1)
+        self.assertFalse(Microcontroller.objects.exists())
+
+    @patch("common.management.commands.benchmark.run")
+    def test_command(self, mock_run):
+        mock_run.return_value = {"environment": {}, "methods": {}, "ticks": {}}
+        out = StringIO()
+        call_command("benchmark", "--count", "5", "--devices", "1", "10", "--ticks", "3", stdout=out)
+        mock_run.assert_called_once_with("sim://", Protocol.TEXT, 5, [1, 10], 3, 5)
+        self.assertEqual(json.loads(out.getvalue()), mock_run.return_value)
@@ -1,3 +1,4 @@
+from unittest.mock import AsyncMock, patch
 from django.test import SimpleTestCase
 from channels.testing import WebsocketCommunicator
 from ..consumers import MicrocontrollerConsumer
@@ -16,3 +17,9 @@ class MicrocontrollerConsumerTestCase(SimpleTestCase):
         self.assertEqual(response, {"hello": "world"})
 
         await communicator.disconnect()
+
+    async def test_display_reading(self):
+        consumer = MicrocontrollerConsumer()
+        with patch.object(consumer, "send", new_callable=AsyncMock) as mock_send:
+            await consumer.display_reading({"type": "display.reading", "message": '[{"name": "temperature"}]'})
+        mock_send.assert_called_once_with(text_data='[{"name": "temperature"}]')
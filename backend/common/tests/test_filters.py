@@ -0,0 +1,48 @@
+import collections
+import random
+import statistics
+from django.test import SimpleTestCase
+from ..choices import Filter
+from ..filters import Ewma, SlidingMedian, TrimmedMean, make_filter
+
+
+class FiltersTestCase(SimpleTestCase):
+    def test_sliding_median(self):
+        randomizer = random.Random(0)
+        for window in range(1, 12):
+            sliding_median = SlidingMedian(window, 20.0)
+            values = collections.deque([20.0] * window, maxlen=window)
+            for _ in range(200):
+                # the repeated ones as well
+                value = randomizer.choice([randomizer.randint(15, 25), randomizer.uniform(15, 25), 20.0])
+                values.append(value)
+                self.assertEqual(sliding_median.push(value), statistics.median(values))
+                # the dropped values don't pile up
+                self.assertLessEqual(len(sliding_median._low) + len(sliding_median._high), 2 * window)
+
+    def test_sliding_median_outlier(self):
+        sliding_median = SlidingMedian(3, 34.0)
+        self.assertEqual(sliding_median.push(1000.0), 34.0)
+        self.assertEqual(sliding_median.push(20.0), 34.0)
+        self.assertEqual(sliding_median.push(20.0), 20.0)
+
+    def test_ewma(self):
+        ewma = Ewma(3, 10.0)
+        self.assertEqual(ewma.push(20.0), 15.0)
+        self.assertEqual(ewma.push(20.0), 17.5)
+        self.assertEqual(Ewma(1, 10.0).push(20.0), 20.0)
+
+    def test_trimmed_mean(self):
+        trimmed_mean = TrimmedMean(5, 20.0)
+        self.assertEqual(trimmed_mean.trim, 1)
+        # the lowest and the highest are left out
+        for value in (1000.0, 21.0, 22.0, 23.0):
+            trimmed_mean.push(value)
+        self.assertEqual(trimmed_mean.value, 22.0)
+        self.assertEqual(trimmed_mean.push(-1000.0), 22.0)
+
+    def test_make_filter(self):
+        self.assertIsInstance(make_filter(Filter.MEDIAN, 5, 1.0), SlidingMedian)
+        self.assertIsInstance(make_filter(Filter.EWMA, 5, 1.0), Ewma)
+        self.assertIsInstance(make_filter(Filter.TRIMMED_MEAN, 5, 1.0), TrimmedMean)
+        self.assertEqual(make_filter("median", 5, 1.0).window, 5)
@@ -1,10 +1,9 @@
-import telegram
 from django.test import TestCase
 from unittest.mock import patch
 from .factories import MicrocontrollerFactory, DeviceFactory
 from ..choices import FSMClass, Category
 from ..fsm import DigitalActuator, AnalogSensor, I2C, PWM
-from ..telebot import bot, CHANNEL
+from ..notifier import notifier
 
 
 class DigitalActuatorTestCase(TestCase):
@@ -65,20 +64,20 @@ class DigitalActuatorTestCase(TestCase):
         result = self.digital_actuator.decrease()
         self.assertEqual(result, "off")
         # off.upon(increase, enter=on, outputs=[save_state, make_on], collector=itemgetter(0))
-        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.digital_actuator.device, "save") as mock_save:
+        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.digital_actuator.increase()
             self.assertEqual(result, "on")
             mock_write_data.assert_called_once_with(1, self.microcontroller)
             mock_save.assert_called_once()
         # on.upon(decrease, enter=off, outputs=[save_state, make_off], collector=itemgetter(0))
-        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.digital_actuator.device, "save") as mock_save:
+        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.digital_actuator.decrease()
             self.assertEqual(result, "off")
             mock_write_data.assert_called_once_with(0, self.microcontroller)
             mock_save.assert_called_once()
         # on.upon(increase, enter=on, outputs=[report_state], collector=itemgetter(0))
         # make it on first
-        with patch.object(self.device, "write_data"), patch.object(self.digital_actuator.device, "save"):
+        with patch.object(self.device, "write_data"), patch.object(self.microcontroller.persister, "save"):
             self.digital_actuator.increase()
         # now continue
         result = self.digital_actuator.increase()
@@ -91,7 +90,7 @@ class DigitalActuatorTestCase(TestCase):
             self.assertEqual(value, True)
         # off.upon(query_value, enter=off, outputs=[read_value], collector=itemgetter(0))
         # make it off first
-        with patch.object(self.device, "write_data"), patch.object(self.digital_actuator.device, "save"):
+        with patch.object(self.device, "write_data"), patch.object(self.microcontroller.persister, "save"):
             self.digital_actuator.decrease()
         # now continue
         with patch.object(self.device, "read_data") as mock_read_data:
@@ -203,7 +202,7 @@ class AnalogSensorTestCase(TestCase):
             mock_read_data.assert_called_once_with(self.microcontroller)
             self.assertEqual(value, 923)
         # medium.upon(decrease, enter=low, outputs=[save_state, turn_on], collector=itemgetter(0))
-        with patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.decrease()
             self.assertEqual(result, "low")
             mock_save.assert_called_once()
@@ -239,11 +238,11 @@ class AnalogSensorTestCase(TestCase):
             mock_read_data.assert_called_once_with(self.microcontroller)
             self.assertEqual(value, 923)
         # low.upon(decrease, enter=very_low, outputs=[save_state, notify_user], collector=itemgetter(0))
-        with patch.object(bot, "send_message") as mock_send_message, patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(notifier, "notify") as mock_notify, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.decrease()
             self.assertEqual(result, "very_low")
             message = f'{self.analog_sensor.device.name} is {result}.'
-            mock_send_message.assert_called_once_with(chat_id=CHANNEL, text=message, parse_mode=telegram.ParseMode.HTML)
+            mock_notify.assert_called_once_with(self.analog_sensor.device.name, message)
             mock_save.assert_called_once()
         # very_low.upon(query_value, enter=very_low, outputs=[read_value], collector=itemgetter(0))
         # temperature
@@ -280,17 +279,17 @@ class AnalogSensorTestCase(TestCase):
         result = self.analog_sensor.decrease()
         self.assertEqual(result, "very_low")
         # very_low.upon(increase, enter=low, outputs=[save_state], collector=itemgetter(0))
-        with patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.increase()
             self.assertEqual(result, "low")
             mock_save.assert_called_once()
         # low.upon(increase, enter=medium, outputs=[save_state, turn_off], collector=itemgetter(0))
-        with patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.increase()
             self.assertEqual(result, "medium")
             mock_save.assert_called_once()
         # medium.upon(increase, enter=high, outputs=[save_state, turn_off], collector=itemgetter(0))
-        with patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.increase()
             self.assertEqual(result, "high")
             mock_save.assert_called_once()
@@ -326,11 +325,11 @@ class AnalogSensorTestCase(TestCase):
             mock_read_data.assert_called_once_with(self.microcontroller)
             self.assertEqual(value, 923)
         # high.upon(increase, enter=very_high, outputs=[save_state, notify_user], collector=itemgetter(0))
-        with patch.object(bot, "send_message") as mock_send_message, patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(notifier, "notify") as mock_notify, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.increase()
             self.assertEqual(result, "very_high")
             message = f'{self.analog_sensor.device.name} is {result}.'
-            mock_send_message.assert_called_once_with(chat_id=CHANNEL, text=message, parse_mode=telegram.ParseMode.HTML)
+            mock_notify.assert_called_once_with(self.analog_sensor.device.name, message)
             mock_save.assert_called_once()
         # very_high.upon(query_value, enter=very_high, outputs=[read_value], collector=itemgetter(0))
         # temperature
@@ -367,12 +366,12 @@ class AnalogSensorTestCase(TestCase):
         result = self.analog_sensor.increase()
         self.assertEqual(result, "very_high")
         # very_high.upon(decrease, enter=high, outputs=[save_state], collector=itemgetter(0))
-        with patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.decrease()
             self.assertEqual(result, "high")
             mock_save.assert_called_once()
         # high.upon(decrease, enter=medium, outputs=[save_state, turn_off], collector=itemgetter(0))
-        with patch.object(self.analog_sensor.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.analog_sensor.decrease()
             self.assertEqual(result, "medium")
             mock_save.assert_called_once()
@@ -457,7 +456,7 @@ class I2CTestCase(TestCase):
             mock_read_data.assert_called_once_with(self.microcontroller)
             self.assertEqual(value, 100)
         # medium.upon(decrease, enter=low, outputs=[save_state, turn_on], collector=itemgetter(0))
-        with patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.decrease()
             self.assertEqual(result, "low")
             mock_save.assert_called_once()
@@ -471,11 +470,11 @@ class I2CTestCase(TestCase):
             mock_read_data.assert_called_once_with(self.microcontroller)
             self.assertEqual(value, 100)
         # low.upon(decrease, enter=very_low, outputs=[save_state, notify_user], collector=itemgetter(0))
-        with patch.object(bot, "send_message") as mock_send_message, patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(notifier, "notify") as mock_notify, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.decrease()
             self.assertEqual(result, "very_low")
             message = f'{self.i2c.device.name} is {result}.'
-            mock_send_message.assert_called_once_with(chat_id=CHANNEL, text=message, parse_mode=telegram.ParseMode.HTML)
+            mock_notify.assert_called_once_with(self.i2c.device.name, message)
             mock_save.assert_called_once()
         # very_low.upon(query_value, enter=very_low, outputs=[read_value], collector=itemgetter(0))
         # temperature
@@ -490,17 +489,17 @@ class I2CTestCase(TestCase):
         result = self.i2c.decrease()
         self.assertEqual(result, "very_low")
         # very_low.upon(increase, enter=low, outputs=[save_state], collector=itemgetter(0))
-        with patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.increase()
             self.assertEqual(result, "low")
             mock_save.assert_called_once()
         # low.upon(increase, enter=medium, outputs=[save_state, turn_off], collector=itemgetter(0))
-        with patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.increase()
             self.assertEqual(result, "medium")
             mock_save.assert_called_once()
         # medium.upon(increase, enter=high, outputs=[save_state, turn_off], collector=itemgetter(0))
-        with patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.increase()
             self.assertEqual(result, "high")
             mock_save.assert_called_once()
@@ -514,11 +513,11 @@ class I2CTestCase(TestCase):
             mock_read_data.assert_called_once_with(self.microcontroller)
             self.assertEqual(value, 100)
         # high.upon(increase, enter=very_high, outputs=[save_state, notify_user], collector=itemgetter(0))
-        with patch.object(bot, "send_message") as mock_send_message, patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(notifier, "notify") as mock_notify, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.increase()
             self.assertEqual(result, "very_high")
             message = f'{self.i2c.device.name} is {result}.'
-            mock_send_message.assert_called_once_with(chat_id=CHANNEL, text=message, parse_mode=telegram.ParseMode.HTML)
+            mock_notify.assert_called_once_with(self.i2c.device.name, message)
             mock_save.assert_called_once()
         # very_high.upon(query_value, enter=very_high, outputs=[read_value], collector=itemgetter(0))
         # temperature
@@ -533,12 +532,12 @@ class I2CTestCase(TestCase):
         result = self.i2c.increase()
         self.assertEqual(result, "very_high")
         # very_high.upon(decrease, enter=high, outputs=[save_state], collector=itemgetter(0))
-        with patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.decrease()
             self.assertEqual(result, "high")
             mock_save.assert_called_once()
         # high.upon(decrease, enter=medium, outputs=[save_state, turn_off], collector=itemgetter(0))
-        with patch.object(self.i2c.device, "save") as mock_save:
+        with patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.i2c.decrease()
             self.assertEqual(result, "medium")
             mock_save.assert_called_once()
@@ -601,20 +600,20 @@ class PWMTestCase(TestCase):
         result = self.pwm.decrease()
         self.assertEqual(result, "closed")
         # closed.upon(increase, enter=opened, outputs=[save_state, make_opened], collector=itemgetter(0))
-        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.pwm.device, "save") as mock_save:
+        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.pwm.increase()
             self.assertEqual(result, "opened")
             mock_write_data.assert_called_once_with(164, self.microcontroller)
             mock_save.assert_called_once()
         # opened.upon(decrease, enter=closed, outputs=[save_state, make_closed], collector=itemgetter(0))
-        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.pwm.device, "save") as mock_save:
+        with patch.object(self.device, "write_data") as mock_write_data, patch.object(self.microcontroller.persister, "save") as mock_save:
             result = self.pwm.decrease()
             self.assertEqual(result, "closed")
             mock_write_data.assert_called_once_with(0, self.microcontroller)
             mock_save.assert_called_once()
         # opened.upon(increase, enter=opened, outputs=[report_state], collector=itemgetter(0))
         # make it opened first
-        with patch.object(self.device, "write_data"), patch.object(self.pwm.device, "save"):
+        with patch.object(self.device, "write_data"), patch.object(self.microcontroller.persister, "save"):
             self.pwm.increase()
         # now continue
         result = self.pwm.increase()
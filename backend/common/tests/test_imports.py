@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# only imported when they're used, nobody should pay for them on every start
+LAZY_MODULES = ("telegram", "shamrock")
+# the most of the import time our own modules can take, with what only they import, it's a few percent now
+OWN_IMPORT_SHARE = 0.1
+
+
+def run(code, *options):
+    """Run the code with the settings of the tests in a new interpreter, so what the other tests imported doesn't count."""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE="backend.settings")
+    return subprocess.run(
+        [sys.executable, *options, "-c", code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+
+
+def imported_modules(code):
+    """Return the names of the modules imported by the code."""
+    return set(run(code + "\nimport sys\nprint('\\n'.join(sys.modules))").stdout.split())
+
+
+def import_times(code):
+    """Return the depth, the name and the cumulative microseconds of every import of the code as -X importtime
+    reports them, the modules imported by another one come right before it one level deeper.
+    """
+    times = []
+    for line in run(code, "-X", "importtime").stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times.append(((len(name) - len(name.lstrip())) // 2, name.strip(), max(int(cumulative), 0)))
+    return times
+
+
+def own_share(times, package="common"):
+    """Return the share of the import time spent in the modules of the package, what they import first included.
+    It's relative, so it doesn't change with the speed of the machine like the times themselves.
+    """
+    total = sum(cumulative for depth, name, cumulative in times if depth == 0)
+    own, inside = 0, None
+    # from the end every module comes before the ones it imported
+    for depth, name, cumulative in reversed(times):
+        if inside is not None and depth > inside:
+            continue
+        inside = None
+        if name.split(".")[0] == package:
+            own += cumulative
+            inside = depth
+    return own / total
+
+
+class ImportTestCase(SimpleTestCase):
+    def assert_lazy(self, modules):
+        for name in LAZY_MODULES:
+            self.assertNotIn(name, modules)
+
+    def test_setup(self):
+        # what every manage.py command pays
+        self.assert_lazy(imported_modules("import django; django.setup()"))
+
+    def test_asgi(self):
+        # and daphne before the first connection
+        modules = imported_modules("import backend.asgi")
+        self.assertIn("common.consumers", modules)
+        self.assert_lazy(modules)
+
+    def test_loop(self):
+        modules = imported_modules(
+            "import django; django.setup()\n"
+            "import common.loop_manager, common.notifier, common.supervisor, common.management.commands.run_greenhouse"
+        )
+        self.assertIn("common.fsm", modules)
+        self.assert_lazy(modules)
+
+    def test_urls(self):
+        # the views and the serializers import them when the remote service is asked
+        modules = imported_modules("import django; django.setup(); import backend.urls")
+        self.assertIn("common.serializers", modules)
+        self.assert_lazy(modules)
+
+    def test_import_time(self):
+        for code in ("import django; django.setup()", "import backend.asgi"):
+            with self.subTest(code=code):
+                self.assertLess(own_share(import_times(code)), OWN_IMPORT_SHARE)
@@ -1,20 +1,28 @@
+import asyncio
 import copy
 import datetime
-from unittest.mock import patch
-from django.core.serializers.json import DjangoJSONEncoder
-from django.test import TestCase
+import json
+import queue
+import time
+from unittest.mock import AsyncMock, patch
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from .factories import MicrocontrollerFactory, DeviceFactory
+from ..choices import Filter, Protocol
 from ..fsm import AnalogSensor
-from ..loop_manager import GreenHouseManager, DELAY, q, DELTA_INPUT
+from ..loop_manager import AsyncGreenHouseManager, GreenHouseManager, DELAY, DELTA_INPUT, DELTA_SNAPSHOT, q
+from ..metrics import metrics
 from ..models import Device, SnapShot
+from ..filters import Ewma, make_filter
+from ..publisher import DELTA, Publisher
+from ..supervisor import Supervisor
 
 
 class GreenHouseManagerTestCase(TestCase):
     def setUp(self):
         self.microcontroller = MicrocontrollerFactory()
-        device_1 = DeviceFactory(microcontroller=self.microcontroller)
-        device_2 = DeviceFactory(microcontroller=self.microcontroller, parent=device_1)
+        device_1 = DeviceFactory(name="Sensor", microcontroller=self.microcontroller)
+        device_2 = DeviceFactory(name="Child", microcontroller=self.microcontroller, parent=device_1)
         self.devices = Device.objects.all()
         with patch.object(self.microcontroller, "start") as mock_start:
             self.green_house_manager = GreenHouseManager(self.microcontroller, self.devices)
@@ -44,18 +52,49 @@ class GreenHouseManagerTestCase(TestCase):
         self.assertTrue(isinstance(self.green_house_manager.readings[1]["timestamp"], datetime.datetime))
         self.assertEqual(self.green_house_manager.readings[1]["state"], "medium")
 
+    def test_reading(self):
+        reading = self.green_house_manager.readings[0]
+        self.assertEqual(reading["median"], reading.median)
+        reading["median"] = 40.0
+        self.assertEqual(reading.median, 40.0)
+        self.assertEqual(reading.device, self.devices[0])
+        with self.assertRaises(KeyError):
+            reading["foo"]
+        with self.assertRaises(KeyError):
+            reading["foo"] = 1
+        with self.assertRaises(AttributeError):
+            reading.foo = 1
+        self.assertEqual(list(reading.as_dict()), [key for key in reading.keys() if key not in ("fsm_instance", "filter")])
+
+    def test_readings_indexes(self):
+        sensor, child = self.green_house_manager.readings
+        child.kind = "actuator"
+        self.green_house_manager.readings = [sensor, child]
+        self.assertEqual(self.green_house_manager.readings_by_id, {self.devices[0].id: sensor, self.devices[1].id: child})
+        self.assertEqual(self.green_house_manager.readings_by_name[child.name], child)
+        self.assertEqual(self.green_house_manager.sensors, [sensor])
+        # the child actuator follows its sensor
+        self.assertEqual(self.green_house_manager.root_actuators, [])
+        child.parent = None
+        self.green_house_manager.readings = [child]
+        self.assertEqual(self.green_house_manager.sensors, [])
+        self.assertEqual(self.green_house_manager.root_actuators, [child])
+
     def test_is_value_increasing_increasing(self):
-        reading = {"median": 38.0 ,"median_old": 37.0}
+        reading = self.green_house_manager.readings[0]
+        reading.update(median=38.0, median_old=37.0)
         result = self.green_house_manager.is_value_increasing(reading)
         self.assertTrue(result)
 
     def test_is_value_increasing_decreasing(self):
-        reading = {"median": 37.0 ,"median_old": 38.0}
+        reading = self.green_house_manager.readings[0]
+        reading.update(median=37.0, median_old=38.0)
         result = self.green_house_manager.is_value_increasing(reading)
         self.assertFalse(result)
 
     def test_is_value_increasing_no(self):
-        reading = {"median": 37.0 ,"median_old": 37.0}
+        reading = self.green_house_manager.readings[0]
+        reading.update(median=37.0, median_old=37.0)
         result = self.green_house_manager.is_value_increasing(reading)
         self.assertIsNone(result)
         
@@ -70,20 +109,14 @@ class GreenHouseManagerTestCase(TestCase):
         self.assertFalse(result)
 
     def test_will_state_change_yes(self):
-        reading = {
-            "fsm_instance": self.green_house_manager.readings[0]["fsm_instance"],
-            "state": "medium",
-            "median": 37.0,
-        }
+        reading = self.green_house_manager.readings[0]
+        reading.update(state="medium", median=37.0)
         result = self.green_house_manager.will_state_change(reading)
         self.assertTrue(result)
 
     def test_will_state_change_no(self):
-        reading = {
-            "fsm_instance": self.green_house_manager.readings[0]["fsm_instance"],
-            "state": "medium",
-            "median": 500.0,
-        }
+        reading = self.green_house_manager.readings[0]
+        reading.update(state="medium", median=500.0)
         result = self.green_house_manager.will_state_change(reading)
         self.assertFalse(result)
 
@@ -115,14 +148,133 @@ class GreenHouseManagerTestCase(TestCase):
 
     def test_update_devices_queue_full(self):
         q.queue.clear()
-        DeviceFactory(microcontroller=self.microcontroller)
+        device = DeviceFactory(name="Added", microcontroller=self.microcontroller)
         self.assertEqual(self.green_house_manager.devices.count(), 2)
         with patch.object(self.green_house_manager, "setup_readings") as mock_setup_readings:
             self.green_house_manager.update_devices()
-            mock_setup_readings.assert_called_once()
-        self.assertEqual(self.green_house_manager.devices.count(), 3)
+            mock_setup_readings.assert_not_called()
+        self.assertEqual(len(self.green_house_manager.devices), 3)
+        self.assertEqual(self.green_house_manager.readings_by_id[device.id].name, device.name)
+        self.assertTrue(q.empty())
+
+    def test_update_devices_own_queue(self):
+        changes = queue.Queue()
+        self.green_house_manager.changes = changes
+        q.queue.clear()
+        device = DeviceFactory(name="Added", microcontroller=self.microcontroller)
+        # the other microcontroller's devices stay with the other manager
+        other = DeviceFactory(name="Other", microcontroller=MicrocontrollerFactory(name="Bench 2"))
+        with patch.object(self.green_house_manager, "patch_readings") as mock_patch_readings:
+            self.green_house_manager.update_devices()
+            mock_patch_readings.assert_not_called()
+        changes.put({"created": device.id})
+        changes.put({"created": other.id})
+        self.green_house_manager.update_devices()
+        self.assertEqual(len(self.green_house_manager.devices), 3)
+        self.assertNotIn(other.id, self.green_house_manager.readings_by_id)
+        self.assertTrue(changes.empty())
+
+    def test_update_devices_coalesce(self):
+        changes = queue.Queue()
+        self.green_house_manager.changes = changes
+        sensor, child = self.green_house_manager.readings
+        device = DeviceFactory(name="Added", microcontroller=self.microcontroller)
+        changes.put({"updated": child.device.id})
+        changes.put({"created": device.id})
+        changes.put({"updated": device.id})
+        changes.put({"deleted": device.id})
+        changes.put({"microcontroller_updated": self.microcontroller.id})
+        with patch.object(self.green_house_manager, "patch_readings") as mock_patch_readings:
+            self.green_house_manager.update_devices()
+            mock_patch_readings.assert_called_once_with({child.device.id: "updated", device.id: "deleted"})
+        self.assertTrue(changes.empty())
+
+    def test_patch_readings_keeps_history(self):
+        sensor, child = self.green_house_manager.readings
+        sensor.update(median_old=30.0, median=31.0, archive=29.0, old=30.0, new=31.0)
+        child.update(median_old=40.0, median=41.0, archive=39.0, old=40.0, new=41.0)
+        timestamp = child.timestamp
+        Device.objects.filter(id=child.device.id).update(blob={"state": "high"})
+        with patch.object(self.microcontroller, "read_data_batch") as mock_read_data_batch:
+            self.green_house_manager.patch_readings({child.device.id: "updated"})
+            mock_read_data_batch.assert_not_called()
+        patched = self.green_house_manager.readings_by_id[child.device.id]
+        self.assertIsNot(patched, child)
+        self.assertEqual(patched.state, "high")
+        self.assertEqual((patched.archive, patched.old, patched.new, patched.median), (39.0, 40.0, 41.0, 41.0))
+        self.assertEqual(patched.timestamp, timestamp)
+        # the parent switches the child, its FSM instance is set up again
+        self.assertIsNot(self.green_house_manager.readings_by_id[sensor.device.id], sensor)
+        self.assertEqual(self.green_house_manager.readings_by_id[sensor.device.id].median, 31.0)
+
+    def test_patch_readings_filter(self):
+        sensor, child = self.green_house_manager.readings
+        Device.objects.filter(id=child.device.id).update(blob={"state": "high"})
+        Device.objects.filter(id=sensor.device.id).update(filter=Filter.EWMA, filter_window=10)
+        with patch.object(self.microcontroller, "read_data_batch"):
+            self.green_house_manager.patch_readings({child.device.id: "updated", sensor.device.id: "updated"})
+        # the window goes on unless the filter changed
+        self.assertIs(self.green_house_manager.readings_by_id[child.device.id].filter, child.filter)
+        patched = self.green_house_manager.readings_by_id[sensor.device.id].filter
+        self.assertIsInstance(patched, Ewma)
+        self.assertEqual((patched.window, patched.value), (10, sensor.new))
+
+    def test_patch_readings_unaffected(self):
+        device = DeviceFactory(name="Added", microcontroller=self.microcontroller)
+        sensor, child = self.green_house_manager.readings
+        self.green_house_manager.patch_readings({device.id: "created"})
+        self.assertIs(self.green_house_manager.readings_by_id[sensor.device.id], sensor)
+        self.assertIs(self.green_house_manager.readings_by_id[child.device.id], child)
+        self.assertEqual(len(self.green_house_manager.readings), 3)
+
+    def test_patch_readings_deleted(self):
+        sensor, child = self.green_house_manager.readings
+        child_id = child.device.id
+        Device.objects.filter(id=child_id).delete()
+        self.green_house_manager.patch_readings({child_id: "deleted"})
+        self.assertEqual([reading.name for reading in self.green_house_manager.readings], [sensor.name])
+        self.assertNotIn(child_id, self.green_house_manager.periods)
+        self.assertNotIn(child_id, self.green_house_manager.next_sample)
+        self.assertEqual(self.green_house_manager.devices, [self.green_house_manager.readings[0].device])
+
+    def test_patch_readings_pin_changed(self):
+        sensor, child = self.green_house_manager.readings
+        child.update(median=41.0)
+        Device.objects.filter(id=child.device.id).update(pin="A5")
+        with patch.object(self.microcontroller, "read_data_batch") as mock_read_data_batch:
+            self.green_house_manager.patch_readings({child.device.id: "updated"})
+            self.assertEqual([device.id for device in mock_read_data_batch.call_args[0][0]], [child.device.id])
+            # the subscription of the board is left alone
+            self.assertEqual(mock_read_data_batch.call_args[1], {"subscribe": False})
+        self.assertNotEqual(self.green_house_manager.readings_by_id[child.device.id].median, 41.0)
+
+    def test_run_stop(self):
+        with (
+            patch.object(self.green_house_manager, "save_states") as mock_save_states,
+            patch.object(self.green_house_manager, "update_devices") as mock_update_devices,
+            patch.object(self.green_house_manager, "communicate_state") as mock_communicate_state,
+            patch.object(self.microcontroller, "stop") as mock_stop,
+        ):
+            mock_communicate_state.side_effect = self.green_house_manager.stop
+            self.green_house_manager.run()
+            # once more when it stops
+            self.assertEqual(mock_save_states.call_count, 2)
+            mock_update_devices.assert_called_once_with()
+            mock_communicate_state.assert_called_once_with()
+            mock_stop.assert_called_once_with()
+
+    def test_setup_scheduler(self):
+        scheduler = self.green_house_manager.setup_scheduler()
+        tasks = sorted(scheduler.tasks)
+        self.assertEqual(
+            [task.name for task in tasks],
+            ["save_states", "update_devices", "update_readings", "communicate_state", "run_inputs", "save_snapshot"],
+        )
+        self.assertEqual([task.period for task in tasks[3:]], [DELAY.total_seconds(), DELTA_INPUT, DELTA_SNAPSHOT])
 
     def test_update_readings(self):
+        # all of them are due
+        self.green_house_manager.next_sample.clear()
         initial_readings = self.green_house_manager.readings
         for reading in initial_readings:
             self.assertEqual(reading['archive'], 34.0)
@@ -144,11 +296,112 @@ class GreenHouseManagerTestCase(TestCase):
             self.assertEqual(reading['median_old'], 34.0)
             self.assertEqual(reading['median'], 34.0)
 
+    def test_update_readings_filter(self):
+        self.green_house_manager.next_sample.clear()
+        sensor = self.green_house_manager.readings[0]
+        sensor.filter = make_filter(Filter.EWMA, 3, 34.0)
+        with patch.object(sensor.fsm_instance, "query_value", return_value=20.0):
+            self.green_house_manager.update_readings()
+        self.assertEqual((sensor.new, sensor.median_old, sensor.median), (20.0, 34.0, 27.0))
+
+    def test_update_readings_actuator_not_filtered(self):
+        self.green_house_manager.next_sample.clear()
+        actuator = self.green_house_manager.readings[1]
+        actuator.update(kind="actuator", new=False, median=False)
+        actuator.filter = make_filter(Filter.EWMA, 3, 0)
+        with patch.object(actuator.fsm_instance, "query_value", return_value=True):
+            self.green_house_manager.update_readings()
+        self.assertIs(actuator.median, True)
+
+    def test_update_readings_batch(self):
+        self.green_house_manager.next_sample.clear()
+        with patch.object(self.microcontroller, "read_data_batch") as mock_read_data_batch:
+            self.green_house_manager.update_readings()
+            mock_read_data_batch.assert_called_once_with([reading["fsm_instance"].device for reading in self.green_house_manager.readings])
+
+    def test_update_readings_sampling_period(self):
+        slow, fast = [reading["fsm_instance"].device for reading in self.green_house_manager.readings]
+        slow.sampling_period = 60000
+        self.green_house_manager.next_sample = {slow.id: time.monotonic() + 60}
+        with patch.object(self.microcontroller, "read_data_batch") as mock_read_data_batch:
+            self.green_house_manager.update_readings()
+            mock_read_data_batch.assert_called_once_with([fast])
+            mock_read_data_batch.reset_mock()
+            self.green_house_manager.update_readings(every_device=True)
+            mock_read_data_batch.assert_called_once_with([slow, fast])
+        self.assertGreater(self.green_house_manager.next_sample[slow.id], time.monotonic() + 59)
+
+    def test_update_readings_nothing_due(self):
+        for reading in self.green_house_manager.readings:
+            self.green_house_manager.next_sample[reading["fsm_instance"].device.id] = time.monotonic() + 60
+        with patch.object(self.microcontroller, "read_data_batch") as mock_read_data_batch:
+            self.green_house_manager.update_readings()
+            mock_read_data_batch.assert_not_called()
+
+    @override_settings(POLLING_MIN_PERIOD=1)
+    def test_serial_load(self):
+        readings = self.green_house_manager.readings
+        devices = [reading["fsm_instance"].device for reading in readings]
+        self.green_house_manager.devices = devices
+        # the adaptive sensors
+        self.assertEqual(self.green_house_manager.readings_period(), 1)
+        devices[0].sampling_period = 500
+        devices[1].sampling_period = 10000
+        for reading in readings:
+            self.green_house_manager.schedule_sample(reading, time.monotonic())
+        self.assertEqual(self.green_house_manager.readings_period(), 0.5)
+        self.assertEqual(self.green_house_manager.serial_load(), {
+            "values_per_second": 2.1,
+            "requests_per_second": 2,
+            "devices": {devices[0].name: 0.5, devices[1].name: 10},
+        })
+        devices[0].sampling_period = devices[1].sampling_period = 3000
+        self.assertEqual(self.green_house_manager.readings_period(), DELAY.total_seconds())
+        self.microcontroller.stream_period = 20
+        self.microcontroller.protocol = Protocol.FRAMED
+        load = self.green_house_manager.serial_load()
+        self.assertEqual((load["values_per_second"], load["requests_per_second"]), (0, 0))
+
+    @override_settings(POLLING_MIN_PERIOD=0.5, POLLING_MAX_PERIOD=30)
+    def test_adaptive_period(self):
+        reading = self.green_house_manager.readings[0]
+        device = reading["fsm_instance"].device
+        device.thresholds = {"medium": [0, 100]}
+        reading.update(state="medium", median=50, median_old=50)
+        # stable in the middle of the band
+        self.assertEqual(self.green_house_manager.adaptive_period(reading), 30)
+        reading.update(median=25, median_old=25)
+        self.assertEqual(self.green_house_manager.adaptive_period(reading), 15.25)
+        # close to the edge
+        reading.update(median=99, median_old=99)
+        self.assertAlmostEqual(self.green_house_manager.adaptive_period(reading), 1.09)
+        # out of the band
+        reading.update(median=120, median_old=99)
+        self.assertEqual(self.green_house_manager.adaptive_period(reading), 0.5)
+        # in the middle, but moving fast towards the edge
+        self.green_house_manager.periods[device.id] = 10
+        reading.update(median=50, median_old=40)
+        self.assertEqual(self.green_house_manager.adaptive_period(reading), 25)
+        reading.update(median=50, median_old=10)
+        self.assertEqual(self.green_house_manager.adaptive_period(reading), 6.25)
+        # the state has no band
+        reading.update(state="high")
+        self.assertEqual(self.green_house_manager.adaptive_period(reading), DELAY.total_seconds())
+
+    def test_sampling_period(self):
+        sensor, actuator = self.green_house_manager.readings
+        actuator["kind"] = "actuator"
+        self.assertEqual(self.green_house_manager.sampling_period(actuator), DELAY.total_seconds())
+        with patch.object(self.green_house_manager, "adaptive_period", return_value=7) as mock_adaptive_period:
+            self.assertEqual(self.green_house_manager.sampling_period(sensor), 7)
+            mock_adaptive_period.assert_called_once_with(sensor)
+        sensor["fsm_instance"].device.sampling_period = 200
+        self.assertEqual(self.green_house_manager.sampling_period(sensor), 0.2)
+
     def test_run_inputs_value_stays(self):
         self.green_house_manager.readings = [self.green_house_manager.readings[0]]
         old_readings = self.green_house_manager.readings
         old_timestamp = copy.deepcopy(old_readings[0]["timestamp"])
-        self.green_house_manager.timestamp_input -= datetime.timedelta(seconds=DELTA_INPUT+1)
         with (
             patch.object(self.green_house_manager, "can_proceed") as mock_can_proceed,
             patch.object(self.green_house_manager, "will_state_change") as mock_will_state_change,
@@ -170,7 +423,6 @@ class GreenHouseManagerTestCase(TestCase):
         self.green_house_manager.readings = [self.green_house_manager.readings[0]]
         old_readings = self.green_house_manager.readings
         old_timestamp = copy.deepcopy(old_readings[0]["timestamp"])
-        self.green_house_manager.timestamp_input -= datetime.timedelta(seconds=DELTA_INPUT+1)
         with (
             patch.object(self.green_house_manager, "can_proceed") as mock_can_proceed,
             patch.object(self.green_house_manager, "will_state_change") as mock_will_state_change,
@@ -193,7 +445,6 @@ class GreenHouseManagerTestCase(TestCase):
         self.green_house_manager.readings = [self.green_house_manager.readings[0]]
         old_readings = self.green_house_manager.readings
         old_timestamp = copy.deepcopy(old_readings[0]["timestamp"])
-        self.green_house_manager.timestamp_input -= datetime.timedelta(seconds=DELTA_INPUT+1)
         with (
             patch.object(self.green_house_manager, "can_proceed") as mock_can_proceed,
             patch.object(self.green_house_manager, "will_state_change") as mock_will_state_change,
@@ -212,20 +463,74 @@ class GreenHouseManagerTestCase(TestCase):
         self.assertNotEqual(old_timestamp, self.green_house_manager.readings[0]["timestamp"])
 
     @patch("common.loop_manager.async_to_sync")
-    @patch("json.dumps")
+    @patch("common.loop_manager.dumps")
     def test_communicate_state(self, mock_dumps, mock_async_to_sync):
         self.green_house_manager.communicate_state()
         clean_readings = []
         for reading in self.green_house_manager.readings:
-            clean_readings.append({key: value for key, value in reading.items() if key != "fsm_instance"})
-        mock_dumps.assert_called_once_with(clean_readings, cls=DjangoJSONEncoder)
+            clean_readings.append({key: value for key, value in reading.items() if key not in ("fsm_instance", "filter")})
+        mock_dumps.assert_called_once_with(clean_readings)
         mock_async_to_sync.assert_called_once_with(self.green_house_manager.channel_layer.group_send)
 
+    @patch("common.loop_manager.async_to_sync")
+    @patch("common.loop_manager.dumps")
+    def test_communicate_state_supervisor(self, mock_dumps, mock_async_to_sync):
+        self.green_house_manager.supervisor = Supervisor()
+        self.green_house_manager.supervisor.publish(0, [{"name": "other"}])
+        self.green_house_manager.communicate_state()
+        readings = mock_dumps.call_args[0][0]
+        self.assertEqual(len(readings), 3)
+        self.assertEqual(readings[0], {"name": "other"})
+
+    @patch("common.loop_manager.async_to_sync")
+    def test_communicate_state_nothing_changed(self, mock_async_to_sync):
+        self.green_house_manager.publisher = Publisher(DELTA)
+        self.green_house_manager.communicate_state()
+        self.assertEqual(mock_async_to_sync.return_value.call_args[0][0], "events")
+        frame = json.loads(mock_async_to_sync.return_value.call_args[0][1]["message"])
+        self.assertEqual((frame["seq"], frame["keyframe"], len(frame["readings"])), (1, True, 2))
+        mock_async_to_sync.reset_mock()
+        self.green_house_manager.communicate_state()
+        mock_async_to_sync.assert_not_called()
+
+    def test_publisher_supervisor(self):
+        supervisor = Supervisor()
+        with patch.object(self.microcontroller, "start"):
+            green_house_manager = GreenHouseManager(self.microcontroller, self.devices, supervisor=supervisor)
+        self.assertIs(green_house_manager.publisher, supervisor.publisher)
+
+    def test_save_states(self):
+        sensor, child = self.green_house_manager.readings
+        q.queue.clear()
+        sensor.fsm_instance.decrease()
+        self.assertEqual(Device.objects.get(id=sensor.device.id).blob, {"state": "medium"})
+        self.assertEqual(child.state, "medium")
+        with self.assertNumQueries(1):
+            self.green_house_manager.save_states()
+        self.assertEqual(Device.objects.get(id=sensor.device.id).blob, {"state": "low"})
+        self.assertEqual(Device.objects.get(id=child.device.id).blob, {"state": "high"})
+        # the reading of the child it switched shows it without reading the devices again
+        self.assertEqual(child.state, "high")
+        self.assertTrue(q.empty())
+
+    @patch("common.loop_manager.async_to_sync")
+    def test_metrics(self, mock_async_to_sync):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        q.queue.clear()
+        self.green_house_manager.tick()
+        names = {histogram["name"] for histogram in metrics.snapshot()["histograms"]}
+        for phase in ("save_states", "update_devices", "update_readings", "run_inputs", "communicate_state", "save_snapshot"):
+            self.assertIn("phase." + phase, names)
+        self.assertIn("device.Sensor", names)
+        self.assertIn("device.Child", names)
+        transitions = metrics.counters["transitions"]
+        self.green_house_manager.readings[0].fsm_instance.decrease()
+        # the child it switched as well
+        self.assertEqual(metrics.counters["transitions"], transitions + 2)
+
     def test_save_snapshot(self):
         self.assertFalse(SnapShot.objects.exists())
-        old_timestamp = timezone.now()
-        old_timestamp = old_timestamp.replace(year=self.green_house_manager.timestamp_snapshot.year - 1)
-        self.green_house_manager.timestamp_snapshot = old_timestamp
         self.green_house_manager.save_snapshot()
         self.assertEqual(SnapShot.objects.count(), 2)
         for reading in self.green_house_manager.readings:
@@ -233,3 +538,44 @@ class GreenHouseManagerTestCase(TestCase):
             snapshot = SnapShot.objects.get(device=device)
             self.assertTrue(snapshot.timestamp)
             self.assertEqual(snapshot.value, reading["median"])
+
+
+class AsyncGreenHouseManagerTestCase(TestCase):
+    def setUp(self):
+        self.microcontroller = MicrocontrollerFactory()
+        DeviceFactory(name="Sensor", microcontroller=self.microcontroller)
+        with patch.object(self.microcontroller, "start"):
+            self.green_house_manager = AsyncGreenHouseManager(self.microcontroller, Device.objects.all())
+
+    def test_setup_scheduler(self):
+        scheduler = self.green_house_manager.setup_scheduler()
+        tasks = {task.name: task.function for task in scheduler.tasks}
+        self.assertEqual(tasks["update_readings"], self.green_house_manager.async_update_readings)
+        self.assertEqual(tasks["communicate_state"], self.green_house_manager.async_communicate_state)
+        self.assertEqual(self.green_house_manager.readings_task.function, self.green_house_manager.async_update_readings)
+
+    async def test_async_communicate_state(self):
+        self.green_house_manager.channel_layer = AsyncMock()
+        await self.green_house_manager.async_communicate_state()
+        group, event = self.green_house_manager.channel_layer.group_send.call_args[0]
+        self.assertEqual(group, "events")
+        self.assertEqual(event["type"], "display.reading")
+
+    async def test_async_tasks(self):
+        for name in ("save_states", "update_devices", "update_readings", "run_inputs", "save_snapshot"):
+            with self.subTest(name=name), patch.object(self.green_house_manager, name) as mock_task:
+                await getattr(self.green_house_manager, "async_" + name)()
+                mock_task.assert_called_once_with()
+
+    async def test_async_run_stop(self):
+        with (
+            patch.object(self.green_house_manager, "async_save_states", AsyncMock()),
+            patch.object(self.green_house_manager, "async_update_devices", AsyncMock()),
+            patch.object(self.green_house_manager, "async_update_readings", AsyncMock()),
+            patch.object(self.green_house_manager, "async_communicate_state", AsyncMock(side_effect=self.green_house_manager.stop)),
+            patch.object(self.microcontroller, "stop") as mock_stop,
+        ):
+            await asyncio.wait_for(self.green_house_manager.async_run(), 1)
+            self.green_house_manager.async_update_readings.assert_awaited_once_with()
+            self.assertEqual(self.green_house_manager.async_save_states.await_count, 2)
+            mock_stop.assert_called_once_with()
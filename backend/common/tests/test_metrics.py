@@ -0,0 +1,89 @@
+import asyncio
+import os
+import tempfile
+import threading
+from django.test import SimpleTestCase
+from ..metrics import BOUNDS, Histogram, Metrics, load_snapshot
+
+
+class HistogramTestCase(SimpleTestCase):
+    def test_empty(self):
+        self.assertEqual(Histogram().summary(), {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None})
+
+    def test_percentile(self):
+        histogram = Histogram()
+        for millisecond in range(1, 101):
+            histogram.record(millisecond / 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertAlmostEqual(summary["mean"], 0.0505)
+        self.assertEqual(summary["max"], 0.1)
+        # within the bucket above the exact one
+        for percent in (50, 95, 99):
+            self.assertGreaterEqual(summary[f"p{percent}"], percent / 1000)
+            self.assertLess(summary[f"p{percent}"], percent / 1000 * 1.2)
+        self.assertLessEqual(summary["p99"], summary["max"])
+
+    def test_out_of_bounds(self):
+        histogram = Histogram()
+        histogram.record(0)
+        histogram.record(BOUNDS[-1] * 10)
+        self.assertEqual(histogram.percentile(100), BOUNDS[-1] * 10)
+        self.assertEqual(histogram.percentile(1), BOUNDS[0])
+
+
+class MetricsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_snapshot(self):
+        self.metrics.increment("transitions")
+        self.metrics.increment("transitions", 2)
+        self.metrics.record("phase.update_readings", 0.01)
+        with self.metrics.timer("device.temperature_probe"):
+            pass
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["counters"], [{"name": "transitions", "value": 3}])
+        self.assertEqual([histogram["name"] for histogram in snapshot["histograms"]], ["device.temperature_probe", "phase.update_readings"])
+        self.assertEqual(snapshot["histograms"][1]["count"], 1)
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot(), {"histograms": [], "counters": []})
+
+    def test_timer_raised(self):
+        with self.assertRaises(ValueError), self.metrics.timer("phase.run_inputs"):
+            raise ValueError
+        self.assertEqual(self.metrics.histogram("phase.run_inputs").count, 1)
+
+    def test_timed(self):
+        @self.metrics.timed("phase.save_snapshot")
+        def save_snapshot():
+            return 1
+
+        @self.metrics.timed("phase.communicate_state")
+        async def communicate_state():
+            return 2
+        self.assertEqual(save_snapshot(), 1)
+        self.assertEqual(asyncio.run(communicate_state()), 2)
+        self.assertEqual(self.metrics.histogram("phase.save_snapshot").count, 1)
+        self.assertEqual(self.metrics.histogram("phase.communicate_state").count, 1)
+        self.assertEqual(save_snapshot.__name__, "save_snapshot")
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profiles", "metrics.json")
+            self.assertIsNone(load_snapshot(path))
+            self.metrics.increment("ticks")
+            self.metrics.record("phase.update_readings", 0.01)
+            self.metrics.dump(path)
+            self.assertEqual(load_snapshot(path), self.metrics.snapshot())
+            self.assertFalse(os.path.exists(path + ".part"))
+
+    def test_dump_every(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            stopped = threading.Event()
+            stopped.set()
+            self.metrics.increment("ticks")
+            # once more when it stops
+            self.metrics.dump_every(path, stopped, period=0)
+            self.assertEqual(load_snapshot(path)["counters"], [{"name": "ticks", "value": 1}])
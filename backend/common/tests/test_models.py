@@ -1,11 +1,19 @@
+import asyncio
 import random
+import threading
+import time
+from arduino.protocol import BOOT_TIMEOUT, FIRMWARE_VERSION, FrameError
+from arduino.simulator import SimulatedBoard, constant, register
+from asgiref.sync import sync_to_async
 from django.core.exceptions import ValidationError
 from django.test import TestCase
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from .factories import DeviceFactory, MicrocontrollerFactory, PlantFactory, SnapShotFactory, UserFactory
 
-from ..choices import Category, FSMClass, ANALOG_SENSOR_BLOBS, DIGITAL_ACTUATOR_BLOBS, PWM_BLOBS, I2C_BLOBS
+from ..choices import Category, FSMClass, Protocol, ANALOG_SENSOR_BLOBS, DIGITAL_ACTUATOR_BLOBS, PWM_BLOBS, I2C_BLOBS
+from ..metrics import metrics
+from ..mixins import RESET_PULSE
 from ..models import default_blob, validate_attr_compatible
 
 
@@ -26,15 +34,182 @@ class MicrocontrollerTestCase(TestCase):
         self.assertEqual(self.microcontroller._devices, [])
         self.microcontroller._microcontroller.output.called_once_with(self.microcontroller._devices)
 
-    @patch("common.mixins.time")
     @patch("common.mixins.Arduino")
-    def test_start(self, mock_Arduino, mock_time):
+    def test_start(self, mock_Arduino):
+        mock_Arduino.return_value.waitReady.return_value = FIRMWARE_VERSION
         self.microcontroller.start()
         self.assertEqual(self.microcontroller._microcontroller, mock_Arduino(self.microcontroller.path))
-        self.assertEqual(mock_time.sleep.call_count, 2)
+        self.microcontroller._microcontroller.waitReady.assert_called_once_with(BOOT_TIMEOUT)
+        self.assertGreaterEqual(self.microcontroller.ready_latency, 0)
         self.assertEqual(self.microcontroller._devices, [])
         self.microcontroller._microcontroller.output.assert_called_once_with(self.microcontroller._devices)
 
+    @patch("common.mixins.Arduino")
+    def test_start_no_banner(self, mock_Arduino):
+        mock_Arduino.return_value.waitReady.return_value = None
+        with self.assertLogs("common.mixins", level="WARNING"):
+            self.microcontroller.start()
+        self.microcontroller._microcontroller.output.assert_called_once_with([])
+
+    @patch("common.mixins.Arduino")
+    def test_start_firmware_mismatch(self, mock_Arduino):
+        mock_Arduino.return_value.waitReady.return_value = FIRMWARE_VERSION + 1
+        with self.assertLogs("common.mixins", level="WARNING"):
+            self.microcontroller.start()
+
+    @patch("common.mixins.Arduino")
+    def test_start_serial_worker(self, mock_Arduino):
+        mock_Arduino.return_value.waitReady.return_value = FIRMWARE_VERSION
+        self.microcontroller.start()
+        self.assertTrue(self.microcontroller._worker.is_alive())
+        device = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        threads = []
+
+        def analog_read(pin):
+            threads.append(threading.current_thread())
+            return "7"
+        self.microcontroller._microcontroller.analogRead.side_effect = analog_read
+        with patch.object(self.microcontroller, "flush"):
+            self.assertEqual(self.microcontroller.read_data(device), 7)
+            worker = self.microcontroller._worker
+            self.assertEqual(threads, [worker])
+            self.microcontroller.stop()
+        self.assertFalse(worker.is_alive())
+        self.assertIsNone(self.microcontroller._worker)
+
+    def test_start_simulated(self):
+        register("test", SimulatedBoard(waveforms={0: constant(300)}))
+        temperature = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        relay = DeviceFactory(
+            blob=random.choice(DIGITAL_ACTUATOR_BLOBS),
+            fsm_class=FSMClass.DIGITAL_ACTUATOR,
+            name="Relay",
+            pin="D3",
+            microcontroller=self.microcontroller,
+        )
+        for protocol in (Protocol.TEXT, Protocol.FRAMED):
+            with self.subTest(protocol=protocol):
+                self.microcontroller.path = "sim://test"
+                self.microcontroller.protocol = protocol
+                self.microcontroller.start()
+                self.assertEqual(self.microcontroller.read_data(temperature), 300)
+                self.assertFalse(self.microcontroller.read_data(relay))
+                self.microcontroller.write_data(1, relay)
+                self.assertTrue(self.microcontroller.read_data(relay))
+                self.assertEqual(self.microcontroller.read_data_batch([temperature, relay]), {temperature.id: 300, relay.id: True})
+                self.assertLess(self.microcontroller.ready_latency, 1)
+                self.microcontroller.restart()
+                self.assertTrue(self.microcontroller.read_data(relay) is False)
+                self.assertLess(self.microcontroller.restart_latency, 1)
+                self.microcontroller.stop()
+
+    def test_stream(self):
+        board = register("stream", SimulatedBoard(waveforms={0: constant(300)}))
+        temperature = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        relay = DeviceFactory(
+            blob=random.choice(DIGITAL_ACTUATOR_BLOBS),
+            fsm_class=FSMClass.DIGITAL_ACTUATOR,
+            name="Relay",
+            pin="D3",
+            microcontroller=self.microcontroller,
+        )
+        self.microcontroller.path = "sim://stream"
+        self.microcontroller.protocol = Protocol.FRAMED
+        self.microcontroller.stream_period = 20
+        self.microcontroller.start()
+        try:
+            # subscribes, the values come a bit later
+            self.microcontroller.read_data_batch([temperature, relay])
+            self.assertEqual(self.microcontroller._subscription, (["A0"], ["D3"], False, False))
+            time.sleep(0.1)
+            commands = board.commands
+            self.assertEqual(self.microcontroller.read_data_batch([temperature, relay]), {temperature.id: 300, relay.id: False})
+            self.assertEqual(self.microcontroller.read_data(temperature), 300)
+            self.assertEqual(self.microcontroller.read_data(temperature), 300)
+            self.assertFalse(self.microcontroller.read_data(relay))
+            # no round trip to the board for any of them
+            self.assertEqual(board.commands, commands)
+            self.microcontroller.write_data(1, relay)
+            time.sleep(0.1)
+            self.assertTrue(self.microcontroller.read_data(relay))
+        finally:
+            self.microcontroller.stop()
+        self.assertIsNone(self.microcontroller._subscription)
+
+    @patch("common.mixins.FramedArduino")
+    def test_stream_subscribe_failed(self, mock_FramedArduino):
+        mock_FramedArduino.return_value.waitReady.return_value = FIRMWARE_VERSION
+        mock_FramedArduino.return_value.subscribe.side_effect = FrameError
+        device = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        self.microcontroller.protocol = Protocol.FRAMED
+        self.microcontroller.stream_period = 20
+        self.microcontroller.start()
+        with self.assertLogs("common.mixins", level="WARNING"):
+            self.assertEqual(self.microcontroller.read_data_batch([device]), {})
+        self.assertIsNone(self.microcontroller._subscription)
+        mock_FramedArduino.return_value.readMany.assert_not_called()
+        mock_FramedArduino.return_value.analogRead.return_value = 7
+        self.assertEqual(self.microcontroller.read_data(device), 7)
+        self.microcontroller._worker.stop()
+
+    @patch("common.mixins.SUBSCRIBE_MAX_PINS", 1)
+    @patch("common.mixins.FramedArduino")
+    def test_stream_too_many_pins(self, mock_FramedArduino):
+        mock_FramedArduino.return_value.waitReady.return_value = FIRMWARE_VERSION
+        mock_FramedArduino.return_value.readMany.return_value = {"analog": {"A0": 7, "A1": 8}, "digital": {}, "servo": None, "i2c": None}
+        temperature = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        humidity = DeviceFactory(name="Humidity", pin="A1", microcontroller=self.microcontroller)
+        self.microcontroller.protocol = Protocol.FRAMED
+        self.microcontroller.stream_period = 20
+        self.microcontroller.start()
+        try:
+            self.assertEqual(self.microcontroller.read_data_batch([temperature, humidity]), {temperature.id: 7, humidity.id: 8})
+            mock_FramedArduino.return_value.subscribe.assert_not_called()
+            mock_FramedArduino.return_value.readMany.assert_called_once_with(["A0", "A1"], [], False, False)
+        finally:
+            self.microcontroller._worker.stop()
+
+    def test_stream_read_without_subscribing(self):
+        register("stream", SimulatedBoard(waveforms={0: constant(300), 1: constant(200)}))
+        temperature = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        humidity = DeviceFactory(name="Humidity", pin="A1", microcontroller=self.microcontroller)
+        self.microcontroller.path = "sim://stream"
+        self.microcontroller.protocol = Protocol.FRAMED
+        self.microcontroller.stream_period = 20
+        self.microcontroller.start()
+        try:
+            self.microcontroller.read_data_batch([temperature])
+            with self.assertRaises(ValueError):
+                self.microcontroller._microcontroller.subscribe(20, [f"A{pin}" for pin in range(16)], [f"D{pin}" for pin in range(2, 16)])
+            time.sleep(0.1)
+            # the pushed value and one request for the other one, the subscription stays
+            values = self.microcontroller.read_data_batch([temperature, humidity], subscribe=False)
+            self.assertEqual(values, {temperature.id: 300, humidity.id: 200})
+            self.assertEqual(self.microcontroller._subscription, (["A0"], [], False, False))
+        finally:
+            self.microcontroller.stop()
+
+    def test_clean_stream_text_protocol(self):
+        self.microcontroller.stream_period = 20
+        with self.assertRaises(ValidationError):
+            self.microcontroller.clean()
+        self.microcontroller.protocol = Protocol.FRAMED
+        self.microcontroller.clean()
+
+    @patch("common.mixins.FramedArduino")
+    def test_start_framed(self, mock_FramedArduino):
+        mock_FramedArduino.return_value.waitReady.return_value = FIRMWARE_VERSION
+        self.microcontroller.protocol = Protocol.FRAMED
+        self.microcontroller.start()
+        mock_FramedArduino.assert_called_once_with(self.microcontroller.path)
+        self.microcontroller._microcontroller.output.assert_called_once_with([])
+
+    def test_get_backend(self):
+        from arduino import Arduino, FramedArduino
+        self.assertEqual(self.microcontroller.get_backend(), Arduino)
+        self.microcontroller.protocol = Protocol.FRAMED
+        self.assertEqual(self.microcontroller.get_backend(), FramedArduino)
+
     def test_stop_microcontroller(self):
         with patch.object(self.microcontroller, "flush"):
             self.microcontroller.stop()
@@ -49,9 +224,12 @@ class MicrocontrollerTestCase(TestCase):
 
     def test_restart(self):
         with patch.object(self.microcontroller, "stop"), patch.object(self.microcontroller, "start"):
+            restarts = metrics.histogram("microcontroller.restart").count
             self.microcontroller.restart()
             self.microcontroller.stop.called_once()
             self.microcontroller.start.called_once()
+        self.assertIsNotNone(self.microcontroller.restart_latency)
+        self.assertEqual(metrics.histogram("microcontroller.restart").count, restarts + 1)
 
     @patch("common.mixins.time")
     def test_flush_no_microcontroller(self, mock_time):
@@ -63,10 +241,36 @@ class MicrocontrollerTestCase(TestCase):
     @patch("common.mixins.Arduino")
     def test_flush_microcontroller(self, mock_Arduino, mock_time):
         self.microcontroller._microcontroller = mock_Arduino(self.microcontroller.path)
+        self.microcontroller._microcontroller.waitReady.return_value = FIRMWARE_VERSION
         self.microcontroller.flush()
         self.assertEqual(self.microcontroller._microcontroller.serial.setDTR.call_count, 2)
-        mock_time.sleep.called_once_with(2)
+        mock_time.sleep.assert_called_once_with(RESET_PULSE)
         self.microcontroller._microcontroller.serial.reset_input_buffer.called_once()
+        self.microcontroller._microcontroller.waitReady.assert_called_once_with(BOOT_TIMEOUT)
+
+    @patch("common.mixins.time")
+    @patch("common.mixins.Arduino")
+    def test_stop_does_not_wait_for_the_boot(self, mock_Arduino, mock_time):
+        self.microcontroller._microcontroller = arduino = mock_Arduino(self.microcontroller.path)
+        self.microcontroller.stop()
+        self.assertEqual(arduino.serial.setDTR.call_count, 2)
+        arduino.waitReady.assert_not_called()
+        arduino.close.assert_called_once_with()
+
+    @patch("common.mixins.time")
+    @patch("common.mixins.Arduino")
+    def test_flush_without_modem_lines(self, mock_Arduino, mock_time):
+        self.microcontroller._microcontroller = mock_Arduino(self.microcontroller.path)
+        self.microcontroller._microcontroller.serial.setDTR.side_effect = OSError(25, "Inappropriate ioctl for device")
+        self.microcontroller.flush()
+        mock_time.sleep.assert_not_called()
+        self.microcontroller._microcontroller.serial.reset_input_buffer.assert_called_once_with()
+
+    def test_get_output_pins_shared(self):
+        DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        DeviceFactory(name="Humidity", pin="A0", microcontroller=self.microcontroller)
+        DeviceFactory(name="Light", pin="A1", microcontroller=self.microcontroller)
+        self.assertCountEqual(self.microcontroller._get_output_pins(), ["A0", "A1"])
 
     @patch("common.mixins.Arduino")
     def test_read_data_pwm(self, mock_Arduino):
@@ -131,6 +335,121 @@ class MicrocontrollerTestCase(TestCase):
         result = self.microcontroller.read_data(device)
         self.microcontroller._microcontroller.getState.assert_called_once_with(device.pin)
 
+    @patch("common.mixins.Arduino")
+    def test_read_data_batch(self, mock_Arduino):
+        self.microcontroller._microcontroller = mock_Arduino(self.microcontroller.path)
+        temperature = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        relay = DeviceFactory(
+            blob=random.choice(DIGITAL_ACTUATOR_BLOBS),
+            fsm_class=FSMClass.DIGITAL_ACTUATOR,
+            name="Relay",
+            pin="D1",
+            microcontroller=self.microcontroller,
+        )
+        servo = DeviceFactory(blob=random.choice(PWM_BLOBS), fsm_class=FSMClass.PWM, name="Servo", microcontroller=self.microcontroller)
+        self.microcontroller._microcontroller.readMany.return_value = {
+            "analog": {"A0": 512}, "digital": {"D1": True}, "servo": 164, "i2c": None,
+        }
+        result = self.microcontroller.read_data_batch([temperature, relay, servo])
+        self.microcontroller._microcontroller.readMany.assert_called_once_with(["A0"], ["D1"], True, False)
+        self.assertEqual(result, {temperature.id: 512, relay.id: True, servo.id: 164})
+        self.assertEqual(self.microcontroller.read_data(temperature), 512)
+        self.microcontroller._microcontroller.analogRead.assert_not_called()
+        # the batched value is used only once
+        self.microcontroller.read_data(temperature)
+        self.microcontroller._microcontroller.analogRead.assert_called_once_with("A0")
+
+    @patch("common.mixins.Arduino")
+    def test_read_data_batch_exception(self, mock_Arduino):
+        self.microcontroller._microcontroller = mock_Arduino(self.microcontroller.path)
+        device = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        self.microcontroller._microcontroller.readMany.side_effect = ValueError
+        self.microcontroller._microcontroller.readMany.__name__ = "readMany"
+        errors, commands = metrics.counters["serial_errors"], metrics.histogram("serial.readMany").count
+        with self.assertLogs("common.mixins", level="WARNING"):
+            result = self.microcontroller.read_data_batch([device])
+        self.assertEqual(result, {})
+        self.assertEqual(metrics.counters["serial_errors"], errors + 1)
+        self.assertEqual(metrics.histogram("serial.readMany").count, commands + 1)
+
+    def test_read_data_batch_no_microcontroller(self):
+        device = DeviceFactory(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        self.assertEqual(self.microcontroller.read_data_batch([device]), {})
+
+    @patch("common.mixins.AsyncArduino")
+    async def test_async_start(self, mock_AsyncArduino):
+        mock_AsyncArduino.open = AsyncMock()
+        mock_AsyncArduino.open.return_value.waitReady.return_value = FIRMWARE_VERSION
+        await self.microcontroller.async_start()
+        mock_AsyncArduino.open.assert_awaited_once_with(self.microcontroller.path)
+        self.microcontroller._microcontroller.waitReady.assert_awaited_once_with(BOOT_TIMEOUT)
+        self.assertEqual(self.microcontroller._devices, [])
+        self.microcontroller._microcontroller.output.assert_awaited_once_with([])
+        self.assertIsNotNone(self.microcontroller._loop)
+        await self.microcontroller.async_stop()
+        self.assertIsNone(self.microcontroller._microcontroller)
+        self.assertIsNone(self.microcontroller._loop)
+
+    async def test_async_start_simulated(self):
+        register("async", SimulatedBoard(waveforms={0: constant(300)}))
+        temperature = DeviceFactory.build(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        relay = DeviceFactory.build(
+            blob=random.choice(DIGITAL_ACTUATOR_BLOBS),
+            fsm_class=FSMClass.DIGITAL_ACTUATOR,
+            name="Relay",
+            pin="D3",
+            microcontroller=self.microcontroller,
+        )
+        self.microcontroller.path = "sim://async"
+        await self.microcontroller.async_start()
+        try:
+            self.assertEqual(await self.microcontroller.async_read_data(temperature), 300)
+            await self.microcontroller.async_write_data(1, relay)
+            self.assertTrue(await self.microcontroller.async_read_data(relay))
+        finally:
+            await self.microcontroller.async_stop()
+
+    async def test_async_protocol_from_other_threads(self):
+        register("async", SimulatedBoard(waveforms={0: constant(300)}))
+        temperature = DeviceFactory.build(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        self.microcontroller.path = "sim://async"
+        self.microcontroller.protocol = Protocol.ASYNC
+        await self.microcontroller.async_start()
+        # the manager's threads find it running and hand the reads over to the loop
+        await sync_to_async(self.microcontroller.start, thread_sensitive=False)()
+        values = await sync_to_async(self.microcontroller.read_data_batch, thread_sensitive=False)([temperature])
+        self.assertEqual(list(values.values()), [300])
+        await sync_to_async(self.microcontroller.stop, thread_sensitive=False)()
+        self.assertIsNone(self.microcontroller._microcontroller)
+        self.assertIsNone(self.microcontroller._loop)
+
+    async def test_async_read_data_analogsensor(self):
+        self.microcontroller._microcontroller = AsyncMock()
+        self.microcontroller._microcontroller.analogRead.return_value = "512"
+        device = DeviceFactory.build(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        result = await self.microcontroller.async_read_data(device)
+        self.assertEqual(result, 512)
+        self.microcontroller._microcontroller.analogRead.assert_awaited_once_with(device.pin)
+
+    async def test_async_read_data_analogsensor_timeout(self):
+        self.microcontroller._microcontroller = AsyncMock()
+        self.microcontroller._microcontroller.analogRead.side_effect = asyncio.TimeoutError
+        device = DeviceFactory.build(name="Temperature", pin="A0", microcontroller=self.microcontroller)
+        result = await self.microcontroller.async_read_data(device)
+        self.assertEqual(result, 0)
+
+    async def test_async_write_data_digitalactuator(self):
+        self.microcontroller._microcontroller = AsyncMock()
+        device = DeviceFactory.build(
+            blob=random.choice(DIGITAL_ACTUATOR_BLOBS),
+            fsm_class=FSMClass.DIGITAL_ACTUATOR,
+            name="Relay",
+            pin="D1",
+            microcontroller=self.microcontroller,
+        )
+        await self.microcontroller.async_write_data(1, device)
+        self.microcontroller._microcontroller.setHigh.assert_awaited_once_with(device.pin)
+
     @patch("common.mixins.Arduino")
     def test_write_data_pwm(self, mock_Arduino):
         self.microcontroller._microcontroller = mock_Arduino(self.microcontroller.path)
@@ -172,6 +491,93 @@ class MicrocontrollerTestCase(TestCase):
         result = self.microcontroller.write_data(value, device)
         self.microcontroller._microcontroller.setHigh.assert_called_once_with(device.pin)
 
+    def test_batch_writes_simulated(self):
+        board = register("mask", SimulatedBoard())
+        relays = [
+            DeviceFactory(
+                blob=random.choice(DIGITAL_ACTUATOR_BLOBS),
+                fsm_class=FSMClass.DIGITAL_ACTUATOR,
+                name=f"Relay{index}",
+                pin=f"D{index}",
+                microcontroller=self.microcontroller,
+            )
+            for index in (2, 3, 20)
+        ]
+        for protocol in (Protocol.TEXT, Protocol.FRAMED):
+            with self.subTest(protocol=protocol):
+                self.microcontroller.path = "sim://mask"
+                self.microcontroller.protocol = protocol
+                self.microcontroller.start()
+                try:
+                    commands = board.commands
+                    with self.microcontroller.batch_writes():
+                        for relay in relays:
+                            self.microcontroller.write_data(1, relay)
+                        with self.microcontroller.batch_writes():
+                            self.microcontroller.write_data(0, relays[0])
+                        # nothing sent yet
+                        self.assertEqual(board.commands, commands)
+                    self.assertEqual(board.commands, commands + 1)
+                    self.assertEqual([self.microcontroller.read_data(relay) for relay in relays], [False, True, True])
+                    # already high, nothing to send
+                    commands = board.commands
+                    self.microcontroller.write_data(1, relays[1])
+                    with self.microcontroller.batch_writes():
+                        self.microcontroller.write_data(1, relays[2])
+                    self.assertEqual(board.commands, commands)
+                finally:
+                    self.microcontroller.stop()
+
+    def test_reset_on_its_own(self):
+        board = register("reset", SimulatedBoard())
+        for protocol in (Protocol.TEXT, Protocol.FRAMED):
+            with self.subTest(protocol=protocol):
+                self.microcontroller.protocol = protocol
+                arduino = self.microcontroller.get_backend()("sim://reset")
+                try:
+                    arduino.waitReady()
+                    arduino.output([3])
+                    arduino.setHigh(3)
+                    board.reset()
+                    time.sleep(board.boot_time + 0.1)
+                    if protocol == Protocol.TEXT:
+                        # the sketch asks for the output pins again
+                        arduino.output([3])
+                    # the banner comes before the reply, the outputs are low again
+                    arduino.analogRead("A0")
+                    commands = board.commands
+                    arduino.setHigh(3)
+                    self.assertEqual(board.commands, commands + 1)
+                    self.assertTrue(arduino.getState(3))
+                finally:
+                    arduino.close()
+
+    def test_read_many_more_pins_than_the_sketch_answers(self):
+        register("many", SimulatedBoard(waveforms={pin: constant(100 + pin) for pin in range(16)}))
+        analogPins = [f"A{pin}" for pin in range(16)]
+        digitalPins = [f"D{pin}" for pin in range(2, 16)]
+        for protocol in (Protocol.TEXT, Protocol.FRAMED):
+            with self.subTest(protocol=protocol):
+                self.microcontroller.protocol = protocol
+                arduino = self.microcontroller.get_backend()("sim://many")
+                try:
+                    arduino.waitReady()
+                    arduino.output([])
+                    values = arduino.readMany(analogPins, digitalPins, servo=True, i2c=True)
+                    self.assertEqual(values["analog"], {f"A{pin}": 100 + pin for pin in range(16)})
+                    self.assertEqual(set(values["digital"]), set(digitalPins))
+                    self.assertIsNotNone(values["servo"])
+                    self.assertIsNotNone(values["i2c"])
+                finally:
+                    arduino.close()
+
+    @patch("common.mixins.Arduino")
+    def test_batch_writes_empty(self, mock_Arduino):
+        self.microcontroller._microcontroller = mock_Arduino(self.microcontroller.path)
+        with self.microcontroller.batch_writes():
+            pass
+        self.microcontroller._microcontroller.writeMask.assert_not_called()
+
     @patch("common.mixins.Arduino")
     def test_write_data_digitalactuator_off(self, mock_Arduino):
         self.microcontroller._microcontroller = mock_Arduino(self.microcontroller.path)
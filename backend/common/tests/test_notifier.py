@@ -0,0 +1,114 @@
+import threading
+import telegram
+from unittest.mock import MagicMock, patch
+from django.test import SimpleTestCase, override_settings
+from .. import notifier as notifier_module
+from ..notifier import Notifier, log_transport, telegram_transport
+from ..telebot import get_bot, CHANNEL
+from .test_scheduler import Clock
+
+
+class NotifierTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.transport = MagicMock()
+        self.notifier = Notifier(self.transport, dedup_window=600, device_interval=60, clock=self.clock)
+
+    def test_due(self):
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.notifier.receive("humidity", "humidity is very_low.")
+        self.assertEqual(self.notifier.due(), ["temperature is very_high.", "humidity is very_low."])
+        self.assertEqual(self.notifier.due(), [])
+        self.assertIsNone(self.notifier.wait())
+
+    def test_dedup(self):
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.notifier.due()
+        self.clock.now += 599
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.assertEqual(self.notifier.due(), [])
+        self.clock.now += 1
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.assertEqual(self.notifier.due(), ["temperature is very_high."])
+
+    def test_forget(self):
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.notifier.due()
+        self.clock.now += 600
+        self.notifier.receive("humidity", "humidity is very_low.")
+        self.assertEqual(self.notifier._sent_texts, {})
+
+    def test_device_interval(self):
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.notifier.due()
+        self.clock.now += 10
+        self.notifier.receive("temperature", "temperature is very_low.")
+        self.notifier.receive("temperature", "temperature is very_high!")
+        # held until the interval is over, only the latest one
+        self.assertEqual(self.notifier.due(), [])
+        self.assertEqual(self.notifier.wait(), 50)
+        self.clock.now += 50
+        self.assertEqual(self.notifier.due(), ["temperature is very_high!"])
+
+    def test_send(self):
+        self.notifier.send([])
+        self.transport.assert_not_called()
+        self.notifier.send(["temperature is very_high.", "humidity is very_low."])
+        self.transport.assert_called_once_with("temperature is very_high.\nhumidity is very_low.")
+        self.transport.side_effect = telegram.error.TimedOut
+        with self.assertLogs("common.notifier", "ERROR"):
+            self.notifier.send(["temperature is very_high."])
+
+    def test_notify(self):
+        sent = threading.Event()
+        self.transport.side_effect = lambda text: sent.set()
+        notifier = Notifier(self.transport)
+        with patch.object(notifier_module, "BATCH_WINDOW", 0.05):
+            self.assertTrue(notifier.notify("temperature", "temperature is very_high."))
+            self.assertTrue(notifier.notify("humidity", "humidity is very_low."))
+            self.assertTrue(sent.wait(1))
+            notifier.stop(1)
+        self.assertFalse(notifier.thread.is_alive())
+        # in one message
+        self.transport.assert_called_once_with("temperature is very_high.\nhumidity is very_low.")
+
+    def test_notify_full(self):
+        with patch.object(self.notifier, "start"):
+            for number in range(notifier_module.QUEUE_SIZE):
+                self.notifier.notify(f"device_{number}", f"device_{number} is very_high.")
+            with self.assertLogs("common.notifier", "WARNING"):
+                self.assertFalse(self.notifier.notify("temperature", "temperature is very_high."))
+
+    def test_stop_sends_held(self):
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.notifier.queue.put(None)
+        self.notifier.run()
+        self.transport.assert_called_once_with("temperature is very_high.")
+
+    def test_stop_sends_held_in_interval(self):
+        self.notifier.receive("temperature", "temperature is very_high.")
+        self.notifier.send(self.notifier.due())
+        self.clock.now += 10
+        self.notifier.receive("temperature", "temperature is very_low.")
+        self.notifier.queue.put(None)
+        self.notifier.run()
+        # not lost waiting for the interval
+        self.transport.assert_called_with("temperature is very_low.")
+
+    def test_stop_timeout(self):
+        sending = threading.Event()
+        self.transport.side_effect = lambda text: sending.wait(1)
+        notifier = Notifier(self.transport)
+        notifier.start()
+        notifier.queue.put(("temperature", "temperature is very_high."))
+        with self.assertLogs("common.notifier", "WARNING"):
+            notifier.stop(0)
+        sending.set()
+        notifier.thread.join(1)
+
+    @override_settings(NOTIFY_TRANSPORT="common.notifier.log_transport")
+    def test_transport(self):
+        self.assertIs(Notifier().transport, log_transport)
+        with patch.object(get_bot(), "send_message") as mock_send_message:
+            telegram_transport("temperature is very_high.")
+        mock_send_message.assert_called_once_with(chat_id=CHANNEL, text="temperature is very_high.", parse_mode=telegram.ParseMode.HTML)
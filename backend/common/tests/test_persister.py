@@ -0,0 +1,51 @@
+from unittest.mock import patch
+from django.db import DatabaseError
+from django.test import TestCase
+from .factories import DeviceFactory, MicrocontrollerFactory
+from ..models import Device
+from ..persister import Persister
+
+
+class PersisterTestCase(TestCase):
+    def setUp(self):
+        self.microcontroller = MicrocontrollerFactory()
+        self.sensor = DeviceFactory(name="Sensor", microcontroller=self.microcontroller)
+        self.other = DeviceFactory(name="Other", microcontroller=self.microcontroller)
+        self.persister = Persister()
+
+    def test_flush(self):
+        self.sensor.blob = {"state": "high"}
+        self.persister.save(self.sensor)
+        self.other.blob = {"state": "low"}
+        self.persister.save(self.other)
+        # switched again before the flush, written once
+        self.sensor.blob = {"state": "very_high"}
+        self.persister.save(self.sensor)
+        self.assertEqual(self.persister.pending(), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.persister.flush(), [self.sensor, self.other])
+        self.assertEqual(Device.objects.get(id=self.sensor.id).blob, {"state": "very_high"})
+        self.assertEqual(Device.objects.get(id=self.other.id).blob, {"state": "low"})
+        self.assertEqual(self.persister.pending(), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.persister.flush(), [])
+
+    def test_flush_failed(self):
+        self.persister.save(self.sensor)
+        with patch("django.db.models.QuerySet.bulk_update", side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.persister.flush()
+        # kept for the next one
+        self.assertEqual(self.persister.pending(), 1)
+        self.assertEqual(self.persister.flush(), [self.sensor])
+
+    def test_flush_quietly(self):
+        self.persister.save(self.sensor)
+        with patch("django.db.models.QuerySet.bulk_update", side_effect=DatabaseError), self.assertLogs("common.persister", "ERROR"):
+            self.persister.flush_quietly()
+        self.assertEqual(self.persister.pending(), 1)
+
+    def test_per_microcontroller(self):
+        # the states one board's FSMs switched to aren't written by the manager of another one
+        self.sensor.get_fsm(self.microcontroller).decrease()
+        self.assertEqual(self.microcontroller.persister.pending(), 1)
+        self.assertEqual(MicrocontrollerFactory().persister.pending(), 0)
@@ -0,0 +1,155 @@
+import os
+import pstats
+import tempfile
+import threading
+from unittest.mock import patch
+from django.test import SimpleTestCase, override_settings
+from ..profiler import IDLE, Capture, Profiler, capture_path
+
+
+def work():
+    return sum(range(100))
+
+
+class CaptureTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(PROFILE_ROOT=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def test_ticks(self):
+        capture = Capture(ticks=2)
+        with capture.profile():
+            work()
+        self.assertFalse(capture.done)
+        self.assertFalse(os.path.exists(capture_path(capture.name)))
+        with capture.profile():
+            work()
+        self.assertTrue(capture.done)
+        self.assertTrue(capture.saved)
+        stats = pstats.Stats(capture_path(capture.name))
+        self.assertIn("work", {function for _, _, function in stats.stats})
+        # over, the next passes aren't profiled
+        with capture.profile():
+            pass
+        self.assertEqual(capture.passes, 2)
+
+    def test_seconds(self):
+        now = [0]
+        capture = Capture(seconds=5, clock=lambda: now[0])
+        with capture.profile():
+            now[0] = 4
+        self.assertFalse(capture.done)
+        with capture.profile():
+            now[0] = 5
+        self.assertTrue(capture.done)
+        self.assertTrue(os.path.exists(capture_path(capture.name)))
+
+    def test_nested(self):
+        # the passes of the async managers overlap on the event loop thread
+        capture = Capture(ticks=1)
+        with capture.profile():
+            with capture.profile():
+                work()
+            self.assertTrue(capture.done)
+            self.assertFalse(capture.saved)
+            work()
+        self.assertTrue(capture.saved)
+        self.assertEqual(capture.passes, 2)
+
+    def test_threads(self):
+        capture = Capture(ticks=2)
+        # one thread at a time, the other one's pass in the meantime isn't profiled
+        profiled, other = threading.Event(), threading.Event()
+
+        def run():
+            with capture.profile():
+                profiled.set()
+                other.wait(1)
+        thread = threading.Thread(target=run)
+        thread.start()
+        profiled.wait(1)
+        with capture.profile():
+            work()
+        other.set()
+        thread.join()
+        self.assertEqual(capture.passes, 1)
+        self.assertFalse(capture.done)
+        # then it's this one's turn
+        with capture.profile():
+            work()
+        self.assertTrue(capture.saved)
+        self.assertTrue(os.path.exists(capture_path(capture.name)))
+
+    def test_another_profiler(self):
+        capture = Capture(ticks=2)
+        with patch.object(capture._profile, "enable", side_effect=ValueError("Another profiling tool is already active")):
+            with self.assertLogs("common.profiler", "WARNING"):
+                with capture.profile():
+                    work()
+        # given up instead of running for ever
+        self.assertTrue(capture.done)
+        self.assertFalse(capture.saved)
+        self.assertEqual(capture.error, "Another profiling tool is already active")
+        with capture.profile():
+            work()
+        self.assertEqual(capture.passes, 0)
+
+    def test_save_failed(self):
+        capture = Capture(ticks=1)
+        with patch.object(pstats.Stats, "dump_stats", side_effect=OSError("No space left on device")):
+            with self.assertLogs("common.profiler", "ERROR"):
+                # the loop keeps running
+                with capture.profile():
+                    work()
+        self.assertFalse(os.path.exists(capture_path(capture.name)))
+
+
+class ProfilerTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(PROFILE_ROOT=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.profiler = Profiler()
+
+    def test_idle(self):
+        self.assertIs(self.profiler.profile(), IDLE)
+        self.assertIsNone(self.profiler.running())
+
+    def test_start(self):
+        capture = self.profiler.start(ticks=1)
+        self.assertIs(self.profiler.running(), capture)
+        # one at a time
+        self.assertIsNone(self.profiler.start(seconds=1))
+        with self.profiler.profile():
+            work()
+        self.assertIsNone(self.profiler.running())
+        self.assertIs(self.profiler.profile(), IDLE)
+        self.assertIsNotNone(self.profiler.start(seconds=1))
+
+    def test_captures(self):
+        self.assertEqual(self.profiler.captures(), [])
+        capture = self.profiler.start(ticks=1)
+        with self.profiler.profile():
+            work()
+        # the leftovers of a failed save and the other files aren't captures
+        for name in (capture.name + ".prof.part", "notes.txt"):
+            with open(os.path.join(self.settings.options["PROFILE_ROOT"], name), "w"):
+                pass
+        captures = self.profiler.captures()
+        self.assertEqual([each["name"] for each in captures], [capture.name])
+        self.assertEqual(captures[0]["size"], os.path.getsize(capture_path(capture.name)))
+        self.assertTrue(captures[0]["created"])
+
+    def test_captures_without_directory(self):
+        with override_settings(PROFILE_ROOT=os.path.join(self.settings.options["PROFILE_ROOT"], "missing")):
+            self.assertEqual(self.profiler.captures(), [])
+
+    def test_capture_path(self):
+        self.assertTrue(capture_path("20261018-101500-123456").endswith("20261018-101500-123456.prof"))
+        for name in ("../settings", "20261018-101500-123456/../x", ""):
+            self.assertIsNone(capture_path(name))
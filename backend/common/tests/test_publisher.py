@@ -0,0 +1,65 @@
+import datetime
+import decimal
+import json
+from unittest.mock import patch
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from .. import publisher as publisher_module
+from ..publisher import DELTA, FULL, Publisher, dumps
+from .test_scheduler import Clock
+
+
+class PublisherTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.publisher = Publisher(DELTA, max_rate=2, keyframe=10, clock=self.clock)
+        self.readings = [{"name": "temperature", "median": 20, "state": "medium"}, {"name": "fan", "median": 0, "state": "off"}]
+
+    def test_full(self):
+        publisher = Publisher(FULL)
+        self.assertIs(publisher.frame(self.readings), self.readings)
+        self.assertIs(publisher.frame(self.readings), self.readings)
+
+    @override_settings(PUBLISH_MODE=DELTA, PUBLISH_MAX_RATE=5, PUBLISH_KEYFRAME=60)
+    def test_from_settings(self):
+        publisher = Publisher.from_settings()
+        self.assertEqual((publisher.mode, publisher.max_rate, publisher.keyframe), (DELTA, 5, 60))
+
+    def test_delta(self):
+        # everything the first time
+        self.assertEqual(self.publisher.frame(self.readings), {"seq": 1, "keyframe": True, "readings": self.readings})
+        self.clock.now += 1
+        self.assertIsNone(self.publisher.frame(self.readings))
+        changed = {"name": "temperature", "median": 21, "state": "medium"}
+        self.assertEqual(
+            self.publisher.frame([changed, self.readings[1]]),
+            {"seq": 2, "keyframe": False, "readings": [changed]},
+        )
+
+    def test_delta_max_rate(self):
+        self.publisher.frame(self.readings)
+        changed = {"name": "fan", "median": 1, "state": "on"}
+        self.clock.now += 0.1
+        self.assertIsNone(self.publisher.frame([self.readings[0], changed]))
+        # conflated into the next frame
+        self.clock.now += 0.4
+        self.assertEqual(self.publisher.frame([self.readings[0], changed]), {"seq": 2, "keyframe": False, "readings": [changed]})
+
+    def test_delta_keyframe(self):
+        self.publisher.frame(self.readings)
+        self.clock.now += 10
+        self.assertEqual(self.publisher.frame(self.readings), {"seq": 2, "keyframe": True, "readings": self.readings})
+        # the removed ones are gone after a keyframe
+        self.clock.now += 10
+        self.publisher.frame(self.readings[:1])
+        self.assertEqual(list(self.publisher._sent), ["temperature"])
+
+
+class DumpsTestCase(SimpleTestCase):
+    def test_dumps(self):
+        value = [{"name": "temperature", "median": decimal.Decimal("20.5"), "timestamp": timezone.make_aware(datetime.datetime(2021, 6, 1, 12, 0, 0, 123456), timezone.utc)}]
+        expected = [{"name": "temperature", "median": "20.5", "timestamp": "2021-06-01T12:00:00.123Z"}]
+        self.assertIsInstance(dumps(value), str)
+        self.assertEqual(json.loads(dumps(value)), expected)
+        with patch.object(publisher_module, "orjson", None):
+            self.assertEqual(json.loads(dumps(value)), expected)
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+from channels.layers import get_channel_layer
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from .factories import DeviceFactory, MicrocontrollerFactory
+from .. import relay
+from ..loop_manager import q
+from ..metrics import load_snapshot, metrics
+from ..notifier import STOP_TIMEOUT
+from ..profiler import Profiler
+
+IN_MEMORY = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY, GREENHOUSE_LOOP="process", RUNNING_GREENHOUSE=False)
+class RelayTestCase(TestCase):
+    def setUp(self):
+        self.microcontroller = MicrocontrollerFactory()
+        q.queue.clear()
+        self.addCleanup(q.queue.clear)
+
+    def receive(self):
+        return asyncio.run(asyncio.wait_for(get_channel_layer().receive(relay.CHANNEL), 1))
+
+    def test_is_local(self):
+        self.assertFalse(relay.is_local())
+        with self.settings(RUNNING_GREENHOUSE=True):
+            self.assertTrue(relay.is_local())
+        for loop in ("thread", "asyncio"):
+            with self.settings(GREENHOUSE_LOOP=loop):
+                self.assertTrue(relay.is_local())
+
+    def test_put_local(self):
+        with self.settings(GREENHOUSE_LOOP="thread"):
+            relay.put({"updated": 1})
+        self.assertEqual(q.get_nowait(), {"updated": 1})
+
+    def test_put(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            relay.put({"updated": 1})
+        # not before the change is committed
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(self.receive(), {"type": "change", "change": {"updated": 1}})
+        self.assertTrue(q.empty())
+
+    def test_device_saved(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            device = DeviceFactory(name="Sensor", microcontroller=self.microcontroller)
+        self.assertEqual(self.receive(), {"type": "change", "change": {"created": device.id}})
+        self.assertTrue(q.empty())
+
+    def test_send_failed(self):
+        with patch("common.relay.get_channel_layer", side_effect=ConnectionError):
+            with self.assertLogs("common.relay", "ERROR"):
+                self.assertFalse(relay.send({"type": "change", "change": {"updated": 1}}))
+
+    def test_handle(self):
+        relay.handle({"type": "change", "change": {"deleted": 1}})
+        self.assertEqual(q.get_nowait(), {"deleted": 1})
+        with patch("common.relay.profiler", Profiler()) as profiler:
+            relay.handle({"type": "capture", "ticks": 10})
+            self.assertEqual(profiler.running().ticks, 10)
+            with self.assertLogs("common.relay", "WARNING"):
+                relay.handle({"type": "capture", "seconds": 5})
+            self.assertEqual(profiler.running().ticks, 10)
+        with self.assertLogs("common.relay", "WARNING"):
+            relay.handle({"type": "reboot"})
+
+    def test_listen(self):
+        async def listen():
+            channel_layer = get_channel_layer()
+            task = asyncio.create_task(relay.listen(channel_layer))
+            await channel_layer.send(relay.CHANNEL, {"type": "change", "change": {"updated": 1}})
+            await channel_layer.send(relay.CHANNEL, {"type": "change", "change": {"deleted": 2}})
+            while q.qsize() < 2:
+                await asyncio.sleep(0.01)
+            task.cancel()
+        asyncio.run(asyncio.wait_for(listen(), 1))
+        self.assertEqual([q.get_nowait(), q.get_nowait()], [{"updated": 1}, {"deleted": 2}])
+
+    def test_listen_retries(self):
+        channel_layer = AsyncMock()
+        channel_layer.receive.side_effect = [ConnectionError, {"type": "change", "change": {"updated": 1}}, asyncio.CancelledError]
+        with patch("common.relay.RETRY", 0), self.assertLogs("common.relay", "ERROR"):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(relay.listen(channel_layer))
+        self.assertEqual(q.get_nowait(), {"updated": 1})
+
+
+@override_settings(GREENHOUSE_LOOP="process")
+class RunGreenhouseTestCase(TestCase):
+    @patch("common.management.commands.run_greenhouse.notifier")
+    @patch("common.management.commands.run_greenhouse.atexit.register")
+    @patch("common.management.commands.run_greenhouse.signal.signal")
+    @patch("common.relay.listen", new_callable=AsyncMock)
+    @patch("common.management.commands.run_greenhouse.Supervisor")
+    def test_command(self, mock_supervisor, mock_listen, mock_signal, mock_register, mock_notifier):
+        mock_supervisor.return_value.run.side_effect = KeyboardInterrupt
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            with self.settings(METRICS_FILE=path):
+                call_command("run_greenhouse", "--timeout", "3", stdout=StringIO())
+            # for the web processes, written once more on the way out
+            self.assertEqual(load_snapshot(path), metrics.snapshot())
+        mock_supervisor.return_value.run.assert_called_once_with()
+        # the managers save the states and stop the boards
+        mock_supervisor.return_value.stop.assert_called_once_with(3)
+        mock_listen.assert_called_once_with()
+        mock_signal.assert_called_once()
+        mock_register.assert_called_once_with(mock_supervisor.return_value.save_states)
+        # and the alerts held go out
+        mock_notifier.stop.assert_called_once_with(STOP_TIMEOUT)
+
+    def test_not_process(self):
+        with self.settings(GREENHOUSE_LOOP="thread"), self.assertRaises(CommandError):
+            call_command("run_greenhouse", stdout=StringIO())
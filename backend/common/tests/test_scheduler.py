@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from unittest.mock import patch
+from django.test import SimpleTestCase
+from ..metrics import metrics
+from ..scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.scheduler = Scheduler(clock=self.clock)
+        self.calls = []
+
+    def task(self, name, duration=0):
+        def function():
+            self.calls.append(name)
+            self.clock.now += duration
+        return function
+
+    def test_run_pending_order(self):
+        self.scheduler.every(1, self.task("devices"))
+        self.scheduler.every(2, self.task("readings"))
+        self.scheduler.every(3, self.task("inputs"), delay=3)
+        self.scheduler.every(2, self.task("communicate"))
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.calls, ["devices", "readings", "communicate"])
+        self.calls.clear()
+        self.clock.now += 1
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.calls, ["devices"])
+        self.calls.clear()
+        self.clock.now += 1
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, ["devices", "readings", "communicate"])
+        self.calls.clear()
+        self.clock.now += 1
+        self.scheduler.run_pending()
+        self.assertEqual(self.calls, ["devices", "inputs"])
+        self.assertFalse(self.scheduler.overruns)
+
+    def test_run_pending_nothing_due(self):
+        self.scheduler.every(5, self.task("snapshot"), delay=5)
+        self.clock.now += 2
+        self.assertEqual(self.scheduler.run_pending(), 3)
+        self.assertEqual(self.calls, [])
+        self.assertIsNone(Scheduler(clock=self.clock).run_pending())
+
+    def test_overrun(self):
+        self.scheduler.every(1, self.task("slow", duration=3.5), name="slow")
+        overruns, ticks = metrics.counters["overruns.slow"], metrics.counters["ticks"]
+        with self.assertLogs("common.scheduler", "WARNING") as logs:
+            self.assertEqual(self.scheduler.run_pending(), 0.5)
+        self.assertEqual(self.calls, ["slow"])
+        self.assertEqual(self.scheduler.overruns["slow"], 1)
+        self.assertEqual(metrics.counters["overruns.slow"], overruns + 1)
+        self.assertEqual(metrics.counters["ticks"], ticks + 1)
+        self.assertIn("slow overran its deadline by 2.500 seconds.", logs.output[0])
+        # the missed runs are skipped, the next one stays on the grid
+        self.assertEqual(self.scheduler.tasks[0].deadline, 104)
+
+    def test_profile(self):
+        self.scheduler.every(1, self.task("devices"))
+        self.scheduler.every(2, self.task("readings"))
+        with patch("common.scheduler.profiler") as mock_profiler:
+            self.scheduler.run_pending()
+            # the tasks due together are one pass
+            mock_profiler.profile.assert_called_once_with()
+            self.assertEqual(self.calls, ["devices", "readings"])
+            self.scheduler.run_pending()
+            mock_profiler.profile.assert_called_once_with()
+
+    async def test_async_profile(self):
+        async def task():
+            self.calls.append("devices")
+        self.scheduler.every(1, task)
+        with patch("common.scheduler.profiler") as mock_profiler:
+            await self.scheduler.async_run_pending()
+            mock_profiler.profile.assert_called_once_with()
+            self.assertEqual(self.calls, ["devices"])
+
+    def test_profile_failed(self):
+        self.scheduler.every(1, self.task("devices"))
+        with patch("common.scheduler.profiler") as mock_profiler:
+            mock_profiler.profile.return_value.__enter__.side_effect = ValueError("Another profiling tool is already active")
+            with self.assertLogs("common.scheduler", "ERROR"):
+                self.scheduler.run_pending()
+            # the loop goes on without it
+            self.assertEqual(self.calls, ["devices"])
+            mock_profiler.profile.return_value.__exit__.assert_not_called()
+            self.clock.now += 1
+            mock_profiler.profile.return_value.__enter__.side_effect = None
+            mock_profiler.profile.return_value.__exit__.side_effect = OSError
+            with self.assertLogs("common.scheduler", "ERROR"):
+                self.scheduler.run_pending()
+            self.assertEqual(self.calls, ["devices", "devices"])
+
+    def test_exception_reschedules(self):
+        def broken():
+            raise ValueError
+        self.scheduler.every(1, broken)
+        with self.assertRaises(ValueError):
+            self.scheduler.run_pending()
+        self.assertEqual(self.scheduler.tasks[0].deadline, 101)
+
+    def test_run_stop(self):
+        stopped = threading.Event()
+        scheduler = Scheduler()
+        scheduler.every(60, stopped.set)
+        scheduler.every(60, self.task("after"))
+        scheduler.run(stopped)
+        # the tasks due together still run
+        self.assertEqual(self.calls, ["after"])
+
+    async def test_async_run_pending(self):
+        async def task(name):
+            self.calls.append(name)
+        self.scheduler.every(1, lambda: task("devices"), "devices")
+        self.scheduler.every(2, lambda: task("readings"), "readings", delay=1)
+        self.assertEqual(await self.scheduler.async_run_pending(), 1)
+        self.clock.now += 1
+        await self.scheduler.async_run_pending()
+        self.assertEqual(self.calls, ["devices", "devices", "readings"])
+
+    async def test_async_run_stop(self):
+        stopped = asyncio.Event()
+        scheduler = Scheduler()
+
+        async def stop():
+            stopped.set()
+        scheduler.every(60, stop)
+        await asyncio.wait_for(scheduler.async_run(stopped), 1)
+        self.assertTrue(stopped.is_set())
@@ -0,0 +1,121 @@
+import threading
+from concurrent.futures import CancelledError
+from django.test import SimpleTestCase
+from ..serial_worker import SerialWorker, WorkerStopped, USER, CONTROL, POLL
+
+
+class SerialWorkerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.worker = SerialWorker()
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def block(self):
+        """Keep the worker busy until the returned event is set."""
+        release = threading.Event()
+        started = threading.Event()
+
+        def busy():
+            started.set()
+            release.wait()
+        self.worker.submit(POLL, busy)
+        started.wait()
+        return release
+
+    def test_submit(self):
+        future = self.worker.submit(POLL, lambda value: value * 2, 21)
+        self.assertEqual(future.result(1), 42)
+
+    def test_submit_exception(self):
+        def fail():
+            raise ValueError("board is gone")
+        future = self.worker.submit(POLL, fail)
+        with self.assertRaises(ValueError):
+            future.result(1)
+
+    def test_priority(self):
+        order = []
+        release = self.block()
+        futures = [
+            self.worker.submit(POLL, order.append, "poll"),
+            self.worker.submit(CONTROL, order.append, "control"),
+            self.worker.submit(USER, order.append, "user"),
+            self.worker.submit(POLL, order.append, "poll again"),
+        ]
+        release.set()
+        for future in futures:
+            future.result(1)
+        self.assertEqual(order, ["user", "control", "poll", "poll again"])
+
+    def test_call(self):
+        self.assertEqual(self.worker.call(USER, threading.current_thread), self.worker)
+
+    def test_call_from_worker(self):
+        # the nested call doesn't wait for itself
+        result = self.worker.call(POLL, lambda: self.worker.call(USER, threading.current_thread))
+        self.assertEqual(result, self.worker)
+
+    def test_stop(self):
+        order = []
+        release = self.block()
+        futures = [self.worker.submit(POLL, order.append, "poll"), self.worker.submit(CONTROL, order.append, "control")]
+        stopper = threading.Thread(target=self.worker.stop)
+        stopper.start()
+        while not self.worker._stopping:
+            pass
+        release.set()
+        stopper.join(1)
+        self.assertFalse(self.worker.is_alive())
+        # the queued commands went to the board before it stopped
+        self.assertEqual(order, ["control", "poll"])
+        for future in futures:
+            self.assertIsNone(future.result(0))
+
+    def test_submit_while_stopping(self):
+        release = self.block()
+        stopper = threading.Thread(target=self.worker.stop)
+        stopper.start()
+        while not self.worker._stopping:
+            pass
+        # behind the STOP it would never run, it's refused instead of waiting for ever
+        future = self.worker.submit(CONTROL, lambda: None)
+        with self.assertRaises(WorkerStopped):
+            future.result(0)
+        release.set()
+        stopper.join(1)
+        self.assertFalse(self.worker.is_alive())
+
+    def test_call_after_stop(self):
+        self.worker.stop()
+        with self.assertRaises(WorkerStopped):
+            self.worker.call(CONTROL, lambda: None)
+        # stopping again does nothing
+        self.worker.stop()
+
+    def test_call_not_started(self):
+        self.assertEqual(SerialWorker().call(USER, threading.current_thread), threading.current_thread())
+
+    def test_cancel_after_run(self):
+        # whatever ends the loop, the commands left aren't waited on for ever
+        release = self.block()
+
+        def die():
+            raise SystemExit
+        self.worker.submit(USER, die)
+        future = self.worker.submit(POLL, lambda: None)
+        release.set()
+        self.worker.join(1)
+        self.assertFalse(self.worker.is_alive())
+        with self.assertRaises(CancelledError):
+            future.result(1)
+        with self.assertRaises(WorkerStopped):
+            self.worker.call(POLL, lambda: None)
+
+    def test_get_latency(self):
+        self.assertIsNone(self.worker.get_latency(50))
+        for _ in range(10):
+            self.worker.call(POLL, lambda: None)
+        self.assertEqual(len(self.worker.latencies), 10)
+        self.assertGreaterEqual(self.worker.get_latency(99), self.worker.get_latency(50))
@@ -3,7 +3,7 @@ from django.test import TestCase
 from django.utils import timezone
 from rest_framework import serializers
 from shamrock import ShamrockException
-from ..choices import FSMClass, Category
+from ..choices import FSMClass, Category, Filter
 from ..models import Plant, Device
 from ..serializers import DeviceSerializer, SnapShotSerializer, PlantSerializer, ShamrockSerializer, ProfileSerializer
 from .factories import DeviceFactory, SnapShotFactory, PlantFactory, UserFactory, MicrocontrollerFactory
@@ -26,6 +26,10 @@ class DeviceSerializerTestCase(TestCase):
             "parent": None,
             "thresholds": self.device.thresholds,
             "desired_state": self.device.desired_state,
+            "microcontroller": self.microcontroller.id,
+            "sampling_period": 0,
+            "filter": Filter.MEDIAN,
+            "filter_window": 3,
         })
 
     def test_to_database(self):
@@ -104,6 +108,28 @@ class DeviceSerializerTestCase(TestCase):
         self.assertEqual(new_device.pin, data["pin"])
         self.assertEqual(new_device.microcontroller, self.microcontroller)
 
+    def test_to_database_create_microcontroller(self):
+        other = MicrocontrollerFactory(name="Bench 2")
+        data = {
+            "name": "foo",
+            "pin": "A4",
+            "fsm_class": FSMClass.ANALOG_SENSOR,
+            "category": Category.TEMPERATURE,
+            "thresholds": {
+                "very_low": [0, 127],
+                "low": [128, 255],
+                "medium": [256, 767],
+                "high": [768, 895],
+                "very_high": [896, 1024],
+            },
+            "desired_state": "very_low",
+            "microcontroller": other.id,
+        }
+        serializer = DeviceSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        new_device = serializer.save()
+        self.assertEqual(new_device.microcontroller, other)
+
 
 class SnapShotSerializerTestCase(TestCase):
     def setUp(self):
@@ -145,7 +171,7 @@ class PlantSerializerTestCase(TestCase):
         serializer.is_valid(raise_exception=True)
         self.assertEqual(serializer.validated_data, data)
 
-    @patch("common.serializers.Shamrock")
+    @patch("shamrock.Shamrock")
     def test_to_database_create_shamrock_error(self, mock_Shamrock):
         data = {
             "remote_id": "remote_foo",
@@ -170,7 +196,7 @@ class PlantSerializerTestCase(TestCase):
         self.assertFalse(Plant.objects.exclude(id=self.plant.id).exists())
 
 
-    @patch("common.serializers.Shamrock")
+    @patch("shamrock.Shamrock")
     def test_to_database_create_no_scientific_name(self, mock_Shamrock):
         data = {
             "remote_id": "remote_foo",
@@ -199,7 +225,7 @@ class PlantSerializerTestCase(TestCase):
         self.assertEqual(context.exception.detail["detail"], f"There is a response for {data['remote_id']}, but it seems the API changed.")
         self.assertFalse(Plant.objects.exclude(id=self.plant.id).exists())
 
-    @patch("common.serializers.Shamrock")
+    @patch("shamrock.Shamrock")
     def test_to_database_create_success(self, mock_Shamrock):
         data = {
             "remote_id": "remote_foo",
@@ -1,15 +1,16 @@
 from django.test import TestCase
-from .factories import DeviceFactory, UserFactory
+from .factories import DeviceFactory, MicrocontrollerFactory, UserFactory
 from ..loop_manager import q
 
 
 class PostSaveUpdateDevicesTestCase(TestCase):
     def setUp(self):
+        self.microcontroller = MicrocontrollerFactory()
         q.queue.clear()
 
     def test_device_created(self):
         self.assertTrue(q.empty())
-        device = DeviceFactory()
+        device = DeviceFactory(microcontroller=self.microcontroller)
         self.assertFalse(q.empty())
         result = q.get()
         self.assertEqual(result, {"created": device.id})
@@ -38,6 +39,29 @@ class PostDeleteUpdateDevicesTestCase(TestCase):
         self.assertEqual(result, {"deleted": device_id})
 
 
+class MicrocontrollerSignalsTestCase(TestCase):
+    def setUp(self):
+        q.queue.clear()
+
+    def test_microcontroller_created(self):
+        microcontroller = MicrocontrollerFactory()
+        self.assertEqual(q.get_nowait(), {"microcontroller_created": microcontroller.id})
+
+    def test_microcontroller_updated(self):
+        microcontroller = MicrocontrollerFactory()
+        q.queue.clear()
+        microcontroller.path = "sim://"
+        microcontroller.save()
+        self.assertEqual(q.get_nowait(), {"microcontroller_updated": microcontroller.id})
+
+    def test_microcontroller_deleted(self):
+        microcontroller = MicrocontrollerFactory()
+        microcontroller_id = microcontroller.id
+        q.queue.clear()
+        microcontroller.delete()
+        self.assertEqual(q.get_nowait(), {"microcontroller_deleted": microcontroller_id})
+
+
 class PostSaveCreateProfileTestCase(TestCase):
     def test_profile_created(self):
         user = UserFactory()
@@ -0,0 +1,212 @@
+import asyncio
+import queue
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+from channels.db import database_sync_to_async
+from django.test import TestCase
+from .factories import MicrocontrollerFactory
+from ..choices import Protocol
+from ..loop_manager import q
+from ..supervisor import AsyncSupervisor, Supervisor
+
+
+class SupervisorTestCase(TestCase):
+    def setUp(self):
+        self.supervisor = Supervisor()
+        self.microcontroller_1 = MicrocontrollerFactory(name="Bench 1", path="sim://")
+        self.microcontroller_2 = MicrocontrollerFactory(name="Bench 2", path="sim://")
+
+    def tearDown(self):
+        self.supervisor.stop(timeout=1)
+
+    @patch("common.supervisor.GreenHouseManager")
+    def test_start_manager(self, mock_GreenHouseManager):
+        ran = threading.Event()
+        mock_GreenHouseManager.return_value.run.side_effect = ran.set
+        thread = self.supervisor.start_manager(self.microcontroller_1)
+        self.assertTrue(ran.wait(1))
+        thread.join(1)
+        args, kwargs = mock_GreenHouseManager.call_args
+        self.assertEqual(args[0], self.microcontroller_1)
+        self.assertEqual(kwargs["changes"], self.supervisor.changes[self.microcontroller_1.id])
+        self.assertEqual(kwargs["supervisor"], self.supervisor)
+        self.assertEqual(self.supervisor.managers[self.microcontroller_1.id], mock_GreenHouseManager.return_value)
+        self.assertEqual(thread.name, f"manager-{self.microcontroller_1.path}")
+
+    @patch("common.supervisor.GreenHouseManager")
+    def test_start_manager_failed(self, mock_GreenHouseManager):
+        mock_GreenHouseManager.side_effect = OSError("no such port")
+        with self.assertLogs("common.supervisor", level="ERROR"):
+            self.supervisor.start_manager(self.microcontroller_1).join(1)
+        self.assertNotIn(self.microcontroller_1.id, self.supervisor.managers)
+
+    def test_dispatch_device_change(self):
+        self.supervisor.changes = {self.microcontroller_1.id: queue.Queue(), self.microcontroller_2.id: queue.Queue()}
+        self.supervisor.dispatch({"updated": 7})
+        for changes in self.supervisor.changes.values():
+            self.assertEqual(changes.get_nowait(), {"updated": 7})
+
+    def test_dispatch_microcontroller_created(self):
+        with patch.object(self.supervisor, "start_manager") as mock_start_manager:
+            self.supervisor.dispatch({"microcontroller_created": self.microcontroller_1.id})
+            mock_start_manager.assert_called_once_with(self.microcontroller_1)
+
+    def test_dispatch_microcontroller_updated(self):
+        with patch.object(self.supervisor, "start_manager") as mock_start_manager, patch.object(self.supervisor, "stop_manager") as mock_stop_manager:
+            self.supervisor.dispatch({"microcontroller_updated": self.microcontroller_2.id})
+            mock_stop_manager.assert_called_once_with(self.microcontroller_2.id)
+            mock_start_manager.assert_called_once_with(self.microcontroller_2)
+
+    def test_dispatch_microcontroller_updated_gone(self):
+        with patch.object(self.supervisor, "start_manager") as mock_start_manager:
+            self.supervisor.dispatch({"microcontroller_updated": 0})
+            mock_start_manager.assert_not_called()
+
+    def test_dispatch_microcontroller_deleted(self):
+        with patch.object(self.supervisor, "stop_manager") as mock_stop_manager:
+            self.supervisor.dispatch({"microcontroller_deleted": self.microcontroller_1.id})
+            mock_stop_manager.assert_called_once_with(self.microcontroller_1.id)
+
+    @patch("common.supervisor.GreenHouseManager")
+    def test_stop_manager(self, mock_GreenHouseManager):
+        stopped = threading.Event()
+        mock_GreenHouseManager.return_value.run.side_effect = lambda: stopped.wait(1)
+        mock_GreenHouseManager.return_value.stop.side_effect = stopped.set
+        thread = self.supervisor.start_manager(self.microcontroller_1)
+        while self.microcontroller_1.id not in self.supervisor.managers:
+            thread.join(0.01)
+        self.supervisor.publish(self.microcontroller_1.id, [{"name": "foo"}])
+        self.supervisor.stop_manager(self.microcontroller_1.id)
+        mock_GreenHouseManager.return_value.stop.assert_called_once_with()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.supervisor.publish(self.microcontroller_2.id, []), [])
+        self.assertEqual(self.supervisor.changes, {})
+
+    @patch("common.supervisor.GreenHouseManager")
+    def test_stop_manager_while_starting(self, mock_GreenHouseManager):
+        release = threading.Event()
+
+        def slow_start(*args, **kwargs):
+            release.wait(1)
+            return mock_GreenHouseManager.return_value
+        mock_GreenHouseManager.side_effect = slow_start
+        with patch.object(self.microcontroller_1, "stop") as mock_stop:
+            thread = self.supervisor.start_manager(self.microcontroller_1)
+            self.supervisor.changes.pop(self.microcontroller_1.id)
+            release.set()
+            thread.join(1)
+            mock_stop.assert_called_once_with()
+        mock_GreenHouseManager.return_value.run.assert_not_called()
+
+    def test_publish(self):
+        self.assertEqual(self.supervisor.publish(self.microcontroller_1.id, [{"name": "foo"}]), [{"name": "foo"}])
+        self.assertEqual(
+            self.supervisor.publish(self.microcontroller_2.id, [{"name": "bar"}]),
+            [{"name": "foo"}, {"name": "bar"}],
+        )
+        # only the latest readings of each microcontroller
+        self.assertEqual(
+            self.supervisor.publish(self.microcontroller_1.id, [{"name": "baz"}]),
+            [{"name": "baz"}, {"name": "bar"}],
+        )
+
+    def test_save_states(self):
+        manager_1, manager_2 = MagicMock(), MagicMock()
+        self.supervisor.managers = {self.microcontroller_1.id: manager_1, self.microcontroller_2.id: manager_2}
+        self.supervisor.save_states()
+        manager_1.microcontroller.persister.flush_quietly.assert_called_once_with()
+        manager_2.microcontroller.persister.flush_quietly.assert_called_once_with()
+        self.supervisor.managers = {}
+
+
+class AsyncSupervisorTestCase(TestCase):
+    def setUp(self):
+        self.supervisor = AsyncSupervisor()
+        self.microcontroller = MicrocontrollerFactory(name="Bench 1", path="sim://")
+        q.queue.clear()
+
+    @patch("common.supervisor.AsyncGreenHouseManager")
+    async def test_start_stop_manager(self, mock_AsyncGreenHouseManager):
+        stopped = asyncio.Event()
+        manager = mock_AsyncGreenHouseManager.return_value
+        manager.async_run = AsyncMock(side_effect=stopped.wait)
+        manager.stop.side_effect = stopped.set
+        task = self.supervisor.start_manager(self.microcontroller)
+        while self.microcontroller.id not in self.supervisor.managers:
+            await asyncio.sleep(0.01)
+        self.assertEqual(mock_AsyncGreenHouseManager.call_args[1]["changes"], self.supervisor.changes[self.microcontroller.id])
+        await asyncio.wait_for(self.supervisor.async_stop(), 1)
+        manager.stop.assert_called_once_with()
+        self.assertTrue(task.done())
+        self.assertEqual(self.supervisor.managers, {})
+
+    @patch("common.supervisor.AsyncGreenHouseManager")
+    async def test_start_manager_failed(self, mock_AsyncGreenHouseManager):
+        mock_AsyncGreenHouseManager.side_effect = OSError("no such port")
+        with self.assertLogs("common.supervisor", level="ERROR"):
+            await self.supervisor.start_manager(self.microcontroller)
+        self.assertNotIn(self.microcontroller.id, self.supervisor.managers)
+
+    @patch("common.supervisor.AsyncGreenHouseManager")
+    async def test_start_manager_off_the_shared_thread(self, mock_AsyncGreenHouseManager):
+        mock_AsyncGreenHouseManager.return_value.async_run = AsyncMock()
+        with patch("common.supervisor.database_sync_to_async", wraps=database_sync_to_async) as mock_database_sync_to_async:
+            await self.supervisor.start_manager(self.microcontroller)
+        # it waits for the board, the thread sensitive calls would wait behind it
+        mock_database_sync_to_async.assert_any_call(mock_AsyncGreenHouseManager, thread_sensitive=False)
+
+    @patch("common.supervisor.AsyncGreenHouseManager")
+    async def test_start_manager_async_protocol(self, mock_AsyncGreenHouseManager):
+        mock_AsyncGreenHouseManager.return_value.async_run = AsyncMock()
+        self.microcontroller.protocol = Protocol.ASYNC
+        with patch.object(self.microcontroller, "async_start", AsyncMock()) as mock_async_start:
+            await self.supervisor.start_manager(self.microcontroller)
+        mock_async_start.assert_awaited_once_with()
+
+    async def test_dispatch_pending(self):
+        changes = queue.Queue()
+        self.supervisor.changes = {self.microcontroller.id: changes}
+        q.put({"updated": 7})
+        q.put({"microcontroller_deleted": self.microcontroller.id})
+        with patch.object(self.supervisor, "async_stop_manager", AsyncMock()) as mock_async_stop_manager:
+            await self.supervisor.dispatch_pending()
+            mock_async_stop_manager.assert_awaited_once_with(self.microcontroller.id)
+        self.assertEqual(changes.get_nowait(), {"updated": 7})
+        self.assertTrue(q.empty())
+
+    async def test_dispatch_microcontroller_updated(self):
+        with (
+            patch.object(self.supervisor, "async_stop_manager", AsyncMock()) as mock_async_stop_manager,
+            patch.object(self.supervisor, "start_manager") as mock_start_manager,
+        ):
+            await self.supervisor.async_dispatch_microcontroller({"microcontroller_updated": self.microcontroller.id})
+            mock_async_stop_manager.assert_awaited_once_with(self.microcontroller.id)
+            mock_start_manager.assert_called_once_with(self.microcontroller)
+
+    def test_start(self):
+        supervisor = AsyncSupervisor()
+        with patch.object(AsyncSupervisor, "run", AsyncMock()) as mock_run:
+            async def start():
+                supervisor.start()
+                task = supervisor.task
+                # once
+                supervisor.start()
+                self.assertIs(supervisor.task, task)
+                await task
+            asyncio.run(start())
+            mock_run.assert_awaited_once_with()
+
+    def test_wrap(self):
+        supervisor = AsyncSupervisor()
+        application = AsyncMock()
+        with patch.object(AsyncSupervisor, "run", AsyncMock()) as mock_run:
+            async def connect():
+                wrapper = supervisor.wrap(application)
+                await wrapper({"type": "lifespan"}, "receive", "send")
+                await wrapper({"type": "http"}, "receive", "send")
+                await supervisor.task
+            asyncio.run(connect())
+            # started on the loop of the server with the first scope
+            mock_run.assert_awaited_once_with()
+        application.assert_awaited_with({"type": "http"}, "receive", "send")
+        self.assertEqual(application.await_count, 2)
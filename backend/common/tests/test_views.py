@@ -1,6 +1,8 @@
 import datetime
+import os
+import tempfile
 from unittest.mock import patch, MagicMock
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse_lazy
 from django.utils import timezone
 from rest_framework.test import APITestCase
@@ -8,7 +10,9 @@ from djangorestframework_camel_case.util import camelize
 from .factories import SnapShotFactory, DeviceFactory, PlantFactory, UserFactory
 from .utils import auth_user
 from ..choices import FSMClass, Category, CurrentState
+from ..metrics import Metrics, metrics
 from ..models import SnapShot, Device, Plant, Profile
+from ..profiler import Profiler, capture_path
 from ..views import SnapShotViewSet, DeviceViewSet, PlantViewSet, ShamrockViewSet, ProfileViewSet
 
 
@@ -301,7 +305,7 @@ class PlantViewSetTestCase(APITestCase):
         self.assertEqual(result["timeInstalled"], self.plant.time_installed.strftime("%Y-%m-%dT%H:%M:%S.%fZ"))
         self.assertEqual(result["currentState"], self.plant.current_state)
 
-    @patch("common.serializers.Shamrock")
+    @patch("shamrock.Shamrock")
     def test_create(self, mock_Shamrock):
         self.assertEqual(Plant.objects.count(), 1)
         mock_shamrock = MagicMock()
@@ -331,7 +335,7 @@ class PlantViewSetTestCase(APITestCase):
         mock_shamrock.plants.assert_called_once_with(data["remoteId"])
         self.assertEqual(Plant.objects.count(), 2)
 
-    @patch("common.serializers.Shamrock")
+    @patch("shamrock.Shamrock")
     def test_put_update(self, mock_Shamrock):
         remote_id = self.plant.remote_id
         current_state = self.plant.current_state
@@ -363,7 +367,7 @@ class PlantViewSetTestCase(APITestCase):
         mock_Shamrock.assert_called_once_with(self.user.profile.remote_token, "https://api.floracodex.com/")
         mock_shamrock.plants.assert_called_once_with(data["remoteId"])
 
-    @patch("common.serializers.Shamrock")
+    @patch("shamrock.Shamrock")
     def test_patch_update(self, mock_Shamrock):
         remote_id = self.plant.remote_id
         current_state = self.plant.current_state
@@ -410,7 +414,7 @@ class ShamrockViewSetTestCase(APITestCase):
         response = self.client.get(self.url, format="json")
         self.assertEqual(response.status_code, 404)
 
-    @patch("common.views.Shamrock")
+    @patch("shamrock.Shamrock")
     def test_get_list_q(self, mock_Shamrock):
         q = "foo plant"
         mock_shamrock = MagicMock()
@@ -525,3 +529,117 @@ class ProfileViewSetTestCase(APITestCase):
         response = self.client.delete(self.url_detail, format="json")
         self.assertEqual(response.status_code, 204)
         self.assertFalse(Profile.objects.exists())
+
+
+class MetricsViewSetTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse_lazy("metrics-list")
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_unauthenticated(self):
+        response = self.client.get(self.url, format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_list(self):
+        auth_user(self.client, UserFactory())
+        metrics.record("phase.update_readings", 0.01)
+        metrics.increment("serial_errors")
+        response = self.client.get(self.url, format="json")
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        # the names aren't camelized
+        self.assertEqual(result["counters"], [{"name": "serial_errors", "value": 1}])
+        self.assertEqual(result["histograms"][0]["name"], "phase.update_readings")
+        self.assertEqual(result["histograms"][0]["count"], 1)
+        self.assertEqual(result["histograms"][0]["max"], 0.01)
+
+    @override_settings(GREENHOUSE_LOOP="process", RUNNING_GREENHOUSE=False)
+    def test_list_process(self):
+        auth_user(self.client, UserFactory())
+        # this process doesn't run the control loop, the run_greenhouse one writes its metrics to the file
+        metrics.increment("serial_errors")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            with self.settings(METRICS_FILE=path):
+                response = self.client.get(self.url, format="json")
+                self.assertEqual(response.status_code, 503)
+                loop = Metrics()
+                loop.increment("ticks", 3)
+                loop.dump(path)
+                response = self.client.get(self.url, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"histograms": [], "counters": [{"name": "ticks", "value": 3}]})
+
+
+class CaptureViewSetTestCase(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(PROFILE_ROOT=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.url = reverse_lazy("capture-list")
+        auth_user(self.client, UserFactory())
+        patcher = patch("common.views.profiler", Profiler())
+        self.profiler = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_not_admin(self):
+        auth_user(self.client, UserFactory(username="gardener", is_staff=False, is_superuser=False))
+        response = self.client.get(self.url, format="json")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(self.url, data={"ticks": 10}, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(self.profiler.running())
+
+    def test_create(self):
+        response = self.client.post(self.url, data={"ticks": 10}, format="json")
+        self.assertEqual(response.status_code, 201)
+        capture = self.profiler.running()
+        self.assertEqual(capture.ticks, 10)
+        self.assertEqual(response.json(), {"name": capture.name, "seconds": None, "ticks": 10, "passes": 0, "saved": False, "error": None})
+        # one at a time
+        response = self.client.post(self.url, data={"seconds": 5}, format="json")
+        self.assertEqual(response.status_code, 409)
+
+    @override_settings(GREENHOUSE_LOOP="process", RUNNING_GREENHOUSE=False)
+    @patch("common.relay.send", return_value=True)
+    def test_create_process(self, mock_send):
+        response = self.client.post(self.url, data={"ticks": 10}, format="json")
+        self.assertEqual(response.status_code, 202)
+        # the run_greenhouse process starts it
+        mock_send.assert_called_once_with({"type": "capture", "ticks": 10})
+        self.assertIsNone(self.profiler.running())
+        mock_send.return_value = False
+        response = self.client.post(self.url, data={"ticks": 10}, format="json")
+        self.assertEqual(response.status_code, 503)
+
+    def test_create_invalid(self):
+        for data in ({}, {"seconds": 5, "ticks": 10}, {"ticks": 0}, {"seconds": -1}):
+            response = self.client.post(self.url, data=data, format="json")
+            self.assertEqual(response.status_code, 400, data)
+        self.assertIsNone(self.profiler.running())
+
+    def test_list_and_download(self):
+        capture = self.profiler.start(ticks=1)
+        response = self.client.get(self.url, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["running"]["name"], capture.name)
+        self.assertEqual(response.json()["captures"], [])
+        with self.profiler.profile():
+            sum(range(100))
+        response = self.client.get(self.url, format="json")
+        result = response.json()
+        self.assertIsNone(result["running"])
+        self.assertEqual([each["name"] for each in result["captures"]], [capture.name])
+        response = self.client.get(reverse_lazy("capture-detail", kwargs={"pk": capture.name}))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'filename="{capture.name}.prof"', response["Content-Disposition"])
+        with open(capture_path(capture.name), "rb") as file:
+            self.assertEqual(b"".join(response.streaming_content), file.read())
+
+    def test_download_missing(self):
+        for name in ("20261018-101500-123456", "settings"):
+            response = self.client.get(reverse_lazy("capture-detail", kwargs={"pk": name}))
+            self.assertEqual(response.status_code, 404)
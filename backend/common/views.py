@@ -1,9 +1,16 @@
-from rest_framework import mixins, viewsets
-from shamrock import Shamrock
+import os
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.response import Response
 from .filtersets import DeviceFilter, SnapShotFilter
+from .metrics import load_snapshot, metrics
 from .models import Device, Plant, Profile, SnapShot
-from .serializers import DeviceSerializer, PlantSerializer, ShamrockSerializer, ProfileSerializer, SnapShotSerializer
-from django.http import Http404
+from .profiler import capture_path, profiler
+from . import relay
+from .serializers import (
+    CaptureSerializer, DeviceSerializer, PlantSerializer, ShamrockSerializer, ProfileSerializer, SnapShotSerializer
+)
+from django.conf import settings
+from django.http import FileResponse, Http404
 
 
 class SnapShotViewSet(viewsets.ModelViewSet):
@@ -33,6 +40,7 @@ class ShamrockViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
         q = self.request.query_params.get("q")
         if not q:
             raise Http404
+        from shamrock import Shamrock
         shamrock = Shamrock(self.request.user.profile.remote_token, "https://api.floracodex.com/")
         objects = shamrock.search(q)["data"]
         return objects
@@ -44,3 +52,55 @@ class ProfileViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         return super(ProfileViewSet, self).get_queryset().filter(user=self.request.user)
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    """
+    The timings of the control loop phases, the devices and the serial commands, in seconds, and the counters
+    of the ticks, the transitions, the serial errors and the overruns, as the process running the control loop
+    recorded them. The run_greenhouse process writes them to the METRICS_FILE every few seconds.
+    """
+
+    def list(self, request):
+        if relay.is_local():
+            return Response(metrics.snapshot())
+        snapshot = load_snapshot(settings.METRICS_FILE)
+        if snapshot is None:
+            return Response(
+                {"detail": "The control loop didn't write its metrics yet."}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response(snapshot)
+
+
+class CaptureViewSet(viewsets.ViewSet):
+    """
+    The cProfile captures of the control loop, for the admins. POST the seconds or the ticks to capture the next
+    passes of the managers, the list has the saved ones and the running one, a saved one downloads as a pstats file.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        running = profiler.running()
+        return Response({
+            "running": running.as_dict() if running is not None else None,
+            "captures": profiler.captures(),
+        })
+
+    def create(self, request):
+        serializer = CaptureSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not relay.is_local():
+            # the run_greenhouse process starts it and saves it where the list looks
+            if not relay.send({"type": "capture", **serializer.validated_data}):
+                return Response({"detail": "The control loop can't be reached."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return Response(serializer.validated_data, status=status.HTTP_202_ACCEPTED)
+        capture = profiler.start(**serializer.validated_data)
+        if capture is None:
+            return Response({"detail": "A capture is already running."}, status=status.HTTP_409_CONFLICT)
+        return Response(capture.as_dict(), status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        path = capture_path(pk)
+        if path is None or not os.path.exists(path):
+            raise Http404
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=pk + ".prof")
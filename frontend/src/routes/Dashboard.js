@@ -59,7 +59,25 @@ class Dashboard extends React.Component {
 
   parseEvent = e => {
     let data = JSON.parse(e.data);
-    this.setState({ data: data });
+    if (Array.isArray(data)) {
+      // all the readings every time
+      this.setState({ data: data });
+      return;
+    }
+    // the delta mode of the publisher: the readings that changed since the last frame, all of them in the
+    // keyframes, so whatever a missed frame had is back with the next keyframe at the latest
+    this.setState(state => {
+      let readings = data.keyframe || !Array.isArray(state.data) ? [] : state.data.slice();
+      for (const reading of data.readings) {
+        const index = readings.findIndex(item => item["name"] === reading["name"]);
+        if (index === -1) {
+          readings.push(reading);
+        } else {
+          readings[index] = reading;
+        }
+      }
+      return { data: readings };
+    });
   };
 
   componentDidMount() {
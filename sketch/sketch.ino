@@ -2,6 +2,9 @@
 #define SERIAL_RATE         115200
 #endif
 
+// announced in the banner after the boot, see FIRMWARE_VERSION in backend/arduino/protocol.py
+#define FIRMWARE_VERSION    2
+
 #ifndef SERIAL_TIMEOUT
 #define SERIAL_TIMEOUT      5
 #endif
@@ -29,12 +32,45 @@ Servo myservo;  // create servo object to control a servo
 // pwm pin 2
 int servoPin = 2;
 
+// framed protocol, see backend/arduino/protocol.py
+// START | LENGTH | SEQUENCE | OPCODE | ARGUMENTS (uint16, little endian) | CHECKSUM
+#define FRAME_START         0xAA
+#define FRAME_ERROR         0xFF
+#define FRAME_MAX_LENGTH    64
+#define FRAMED              -1
+
+unsigned char frame[FRAME_MAX_LENGTH + 1];
+unsigned char frameLength = 0;
+int frameCursor = 0;
+unsigned char reply[FRAME_MAX_LENGTH + 3];
+
+// read many: analog pins, digital pins and the servo/i2c flags in one request
+#define READ_MANY_MAX       28
+#define READ_SERVO_FLAG     1
+#define READ_I2C_FLAG       2
+
+unsigned int batch[READ_MANY_MAX + 2];
+
+// streaming: the subscribe frame is kept and replayed as a read many every streamPeriod milliseconds
+#define STREAM              11
+#define STREAM_SEQUENCE     0
+
+unsigned char subscription[FRAME_MAX_LENGTH + 1];
+unsigned char subscriptionLength = 0;
+unsigned long streamPeriod = 0;
+unsigned long streamLast = 0;
+
 void setup() {
     Serial.begin(SERIAL_RATE);
     Serial.setTimeout(SERIAL_TIMEOUT);
     Wire.begin();
 
-    int cmd = readData();
+    // the host waits for this line instead of sleeping while the board boots
+    Serial.print("ready ");
+    Serial.println(FIRMWARE_VERSION);
+
+    // in the framed protocol this returns FRAMED and the pins come later in a frame
+    long cmd = readData();
     for (int i = 0; i < cmd; i++) {
         pinMode(readData(), OUTPUT);
     }
@@ -42,7 +78,12 @@ void setup() {
 }
 
 void loop() {
-    switch (readData()) {
+    long cmd = readData();
+    if (cmd == FRAMED) {
+        handleFrame();
+        return;
+    }
+    switch (cmd) {
         case 0 :
             //set digital low
             digitalWrite(readData(), LOW); break;
@@ -67,6 +108,29 @@ void loop() {
         case 7:
             //read servo position
             Serial.println(myservo.read()); break;
+        case 12: {
+            //write mask, groups of the base pin, the mask and the values
+            long groups = readData();
+            for (int i = 0; i < groups; i++) {
+                long base = readData();
+                long mask = readData();
+                long values = readData();
+                writeMask(base, mask, values);
+            }
+            break;
+        }
+        case 9: {
+            //read many values, answered on a single line separated by commas
+            int count = readMany(false);
+            for (int i = 0; i < count; i++) {
+                if (i > 0) {
+                    Serial.print(",");
+                }
+                Serial.print(batch[i]);
+            }
+            Serial.println();
+            break;
+        }
 
         case 99:
             //just dummy to cancel the current read, needed to prevent lock 
@@ -75,12 +139,170 @@ void loop() {
     }
 }
 
-char readData() {
+long readData() {
     Serial.println("w");
     while(1) {
         if(Serial.available() > 0) {
+            if (Serial.peek() == FRAME_START) {
+                return FRAMED;
+            }
             return Serial.parseInt();
         }
+        stream();
+    }
+}
+
+// push the subscribed values while waiting for the host
+void stream() {
+    if (streamPeriod == 0 || millis() - streamLast < streamPeriod) {
+        return;
+    }
+    streamLast = millis();
+    memcpy(frame, subscription, subscriptionLength);
+    frameLength = subscriptionLength;
+    frameCursor = 1;  // skip the period, the rest are the read many arguments
+    replyFrame(STREAM_SEQUENCE, STREAM, batch, readMany(true));
+}
+
+unsigned int frameArgument(int index) {
+    if (3 + 2 * index >= frameLength) {
+        return 0;
+    }
+    return frame[2 + 2 * index] | (frame[3 + 2 * index] << 8);
+}
+
+// arguments of the current command, either from the text prompts or from the received frame
+long nextArgument(bool framed) {
+    if (framed) {
+        return frameArgument(frameCursor++);
+    }
+    return readData();
+}
+
+int readMany(bool framed) {
+    int count = 0;
+    long analogCount = nextArgument(framed);
+    for (int i = 0; i < analogCount; i++) {
+        long pin = nextArgument(framed);
+        if (count < READ_MANY_MAX) {
+            batch[count++] = analogRead(pin);
+        }
+    }
+    long digitalCount = nextArgument(framed);
+    for (int i = 0; i < digitalCount; i++) {
+        long pin = nextArgument(framed);
+        if (count < READ_MANY_MAX) {
+            batch[count++] = digitalRead(pin);
+        }
+    }
+    long flags = nextArgument(framed);
+    if (flags & READ_SERVO_FLAG) {
+        batch[count++] = myservo.read();
+    }
+    if (flags & READ_I2C_FLAG) {
+        batch[count++] = check();
+    }
+    return count;
+}
+
+// the pins base + bit for the bits set in the mask get the bit from the values
+void writeMask(long base, unsigned int mask, unsigned int values) {
+    for (int bit = 0; bit < 16; bit++) {
+        if (mask & (1 << bit)) {
+            digitalWrite(base + bit, (values >> bit) & 1 ? HIGH : LOW);
+        }
+    }
+}
+
+void replyFrame(unsigned char sequence, unsigned char opcode, unsigned int *values, int count) {
+    int length = 2 + 2 * count;
+    reply[0] = FRAME_START;
+    reply[1] = length;
+    reply[2] = sequence;
+    reply[3] = opcode;
+    for (int i = 0; i < count; i++) {
+        reply[4 + 2 * i] = values[i] & 0xFF;
+        reply[5 + 2 * i] = (values[i] >> 8) & 0xFF;
+    }
+    unsigned char checksum = 0;
+    for (int i = 1; i < length + 2; i++) {
+        checksum ^= reply[i];
+    }
+    reply[length + 2] = checksum;
+    Serial.write(reply, length + 3);
+}
+
+void handleFrame() {
+    Serial.read();  // FRAME_START
+    unsigned char length;
+    if (Serial.readBytes(&length, 1) != 1 || length < 2 || length > FRAME_MAX_LENGTH) {
+        // nothing to answer to, the host times out and moves on
+        return;
+    }
+    if (Serial.readBytes(frame, length + 1) != length + 1) {
+        return;
+    }
+    unsigned char checksum = length;
+    for (int i = 0; i < length; i++) {
+        checksum ^= frame[i];
+    }
+    unsigned char sequence = frame[0];
+    unsigned char opcode = frame[1];
+    int argc = (length - 2) / 2;
+    frameLength = length;
+    frameCursor = 0;
+    if (checksum != frame[length] || length % 2) {
+        replyFrame(sequence, FRAME_ERROR, NULL, 0);
+        return;
+    }
+    unsigned int values[1];
+    switch (opcode) {
+        case 0:
+            digitalWrite(frameArgument(0), LOW);
+            replyFrame(sequence, opcode, NULL, 0); break;
+        case 1:
+            digitalWrite(frameArgument(0), HIGH);
+            replyFrame(sequence, opcode, NULL, 0); break;
+        case 2:
+            values[0] = digitalRead(frameArgument(0));
+            replyFrame(sequence, opcode, values, 1); break;
+        case 3:
+            analogWrite(frameArgument(0), frameArgument(1));
+            replyFrame(sequence, opcode, NULL, 0); break;
+        case 4:
+            values[0] = analogRead(frameArgument(0));
+            replyFrame(sequence, opcode, values, 1); break;
+        case 5:
+            values[0] = check();
+            replyFrame(sequence, opcode, values, 1); break;
+        case 6:
+            myservo.write(frameArgument(0));
+            replyFrame(sequence, opcode, NULL, 0); break;
+        case 7:
+            values[0] = myservo.read();
+            replyFrame(sequence, opcode, values, 1); break;
+        case 8:
+            //register output pins, the text protocol does it in setup
+            for (int i = 0; i < argc; i++) {
+                pinMode(frameArgument(i), OUTPUT);
+            }
+            replyFrame(sequence, opcode, NULL, 0); break;
+        case 9:
+            replyFrame(sequence, opcode, batch, readMany(true)); break;
+        case 10:
+            //subscribe, the first values go out right away
+            streamPeriod = frameArgument(0);
+            memcpy(subscription, frame, length);
+            subscriptionLength = length;
+            streamLast = millis() - streamPeriod;
+            replyFrame(sequence, opcode, NULL, 0); break;
+        case 12:
+            for (int i = 0; i + 2 < argc; i += 3) {
+                writeMask(frameArgument(i), frameArgument(i + 1), frameArgument(i + 2));
+            }
+            replyFrame(sequence, opcode, NULL, 0); break;
+        default:
+            replyFrame(sequence, FRAME_ERROR, NULL, 0); break;
     }
 }
 